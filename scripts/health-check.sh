@@ -8,7 +8,6 @@ WORKSPACE_DIR="/root/workspace"
 LOG_FILE="$WORKSPACE_DIR/logs/health-check.log"
 WAKE_LOCK="$WORKSPACE_DIR/.wake-lock"
 DB_PATH="$WORKSPACE_DIR/telegram_bot/messages.db"
-STALE_THRESHOLD=900  # 15 minutes in seconds
 
 mkdir -p "$WORKSPACE_DIR/logs"
 
@@ -34,24 +33,14 @@ if [ -f "$WAKE_LOCK" ]; then
     fi
 fi
 
-# Check 2: Stale database lock
+# Check 2: Chat locks whose holder stopped renewing
 if [ -f "$DB_PATH" ]; then
-    LOCK_INFO=$(sqlite3 "$DB_PATH" \
-        "SELECT locked_at FROM processing_lock WHERE is_locked = 1;" 2>/dev/null)
+    EXPIRED_CHATS=$(sqlite3 "$DB_PATH" "
+        DELETE FROM chat_locks WHERE lease_expires < CAST(strftime('%s', 'now') AS REAL);
+        SELECT changes();" 2>/dev/null)
 
-    if [ -n "$LOCK_INFO" ]; then
-        # Calculate lock age
-        LOCKED_AT=$(date -d "$LOCK_INFO" +%s 2>/dev/null)
-        NOW=$(date +%s)
-
-        if [ -n "$LOCKED_AT" ]; then
-            LOCK_AGE=$((NOW - LOCKED_AT))
-
-            if [ "$LOCK_AGE" -gt "$STALE_THRESHOLD" ]; then
-                log "RECOVERY: Releasing stale database lock (age: ${LOCK_AGE}s)"
-                sqlite3 "$DB_PATH" "UPDATE processing_lock SET is_locked = 0, locked_at = NULL;"
-            fi
-        fi
+    if [ -n "$EXPIRED_CHATS" ] && [ "$EXPIRED_CHATS" -gt 0 ]; then
+        log "RECOVERY: Released $EXPIRED_CHATS chat lock(s) with expired lease"
     fi
 fi
 
@@ -65,7 +54,20 @@ if [ -f "$DB_PATH" ]; then
     fi
 fi
 
-# Check 4: Incomplete plan files
+# Check 4: Archive old messages and compact the database (daily)
+RETENTION_STAMP="$WORKSPACE_DIR/.last-retention"
+if [ -f "$DB_PATH" ] && [ -z "$(find "$RETENTION_STAMP" -mmin -1440 2>/dev/null)" ]; then
+    if [ -f "$WORKSPACE_DIR/.env" ]; then
+        export $(grep -v '^#' "$WORKSPACE_DIR/.env" | xargs)
+    fi
+    if python3 "$WORKSPACE_DIR/telegram_bot/src/retention.py" >> "$LOG_FILE" 2>&1; then
+        touch "$RETENTION_STAMP"
+    else
+        log "ERROR: Message retention failed"
+    fi
+fi
+
+# Check 5: Incomplete plan files
 "$WORKSPACE_DIR/scripts/plan-manager.sh" check-incomplete >> "$LOG_FILE" 2>&1
 
 log "=== Health check complete ==="
@@ -1,13 +1,21 @@
 #!/bin/bash
 
 # Poll for unprocessed Telegram messages and trigger wake-up
-# Runs every 5 minutes via cron
+# Runs every 5 minutes via cron; a no-op while a queue watcher (run by the
+# bot, or telegram_bot/src/queue_watcher.py without it) is running, since it
+# is notified of every insert and sweeps the queue itself
 
 WORKSPACE_DIR="/root/workspace"
 WAKE_SCRIPT="$WORKSPACE_DIR/scripts/wake-up.sh"
 WAKE_LOCK="$WORKSPACE_DIR/.wake-lock"
+WATCHER_PID_FILE="$WORKSPACE_DIR/.queue-watcher.pid"
 DB_PATH="$WORKSPACE_DIR/telegram_bot/messages.db"
 
+# Queue watcher handles the queue
+if [ -f "$WATCHER_PID_FILE" ] && ps -p "$(cat "$WATCHER_PID_FILE")" > /dev/null 2>&1; then
+    exit 0
+fi
+
 # Check if agent is already running
 if [ -f "$WAKE_LOCK" ]; then
     LOCK_PID=$(cat "$WAKE_LOCK")
@@ -20,7 +28,7 @@ fi
 # Check for unprocessed messages
 if [ -f "$DB_PATH" ]; then
     UNPROCESSED=$(sqlite3 "$DB_PATH" \
-        "SELECT COUNT(*) FROM messages WHERE processed = 0 AND direction = 'incoming';" 2>/dev/null)
+        "SELECT COUNT(*) FROM messages WHERE processed = 0 AND direction = 'incoming' AND (voice_file_path IS NULL OR voice_transcription IS NOT NULL);" 2>/dev/null)
 
     if [ -n "$UNPROCESSED" ] && [ "$UNPROCESSED" -gt 0 ]; then
         echo "[$(date -u +"%Y-%m-%d %H:%M:%S UTC")] Found $UNPROCESSED unprocessed message(s), triggering wake-up"
@@ -1,13 +1,24 @@
 #!/bin/bash
 
 # Process Telegram message queue
-# Called by bot server or poll-telegram.sh
-
-WORKSPACE_DIR="/root/workspace"
+# Run once by poll-telegram.sh, or kept running by the bot server with
+# --listen and woken through its stdin
+#
+# Each chat with waiting messages gets its own agent run under a leased
+# per-chat lock (chat_locks table), so a long run for one chat does not
+# hold up the others. Up to MAX_PARALLEL chats run at once; messages
+# within a chat are still handled by one run at a time, in order.
+
+WORKSPACE_DIR="${WORKSPACE_DIR:-/root/workspace}"
 WAKE_LOCK="$WORKSPACE_DIR/.wake-lock"
 DB_PATH="$WORKSPACE_DIR/telegram_bot/messages.db"
 LOG_FILE="$WORKSPACE_DIR/logs/telegram-process.log"
 TIMEOUT=600  # 10 minutes
+LEASE_SECONDS=60  # chat lock lease, renewed by a heartbeat while running
+MAX_PARALLEL=3  # chats processed at once
+RESCAN_SECONDS=5  # listen mode re-check while chats wait for a slot
+BUSY_TIMEOUT_MS=5000
+HOLDER_HOST=$(hostname)
 
 mkdir -p "$WORKSPACE_DIR/logs"
 
@@ -16,66 +27,186 @@ log() {
     echo "[$(date -u +"%Y-%m-%d %H:%M:%S UTC")] $1" >> "$LOG_FILE"
 }
 
-# Check for existing wake lock
-if [ -f "$WAKE_LOCK" ]; then
-    LOCK_PID=$(cat "$WAKE_LOCK")
-    if ps -p "$LOCK_PID" > /dev/null 2>&1; then
-        log "Agent already running (PID $LOCK_PID), skipping"
-        exit 0
-    else
-        log "Removing stale wake-lock (PID $LOCK_PID)"
-        rm "$WAKE_LOCK"
-    fi
+# Load environment variables
+if [ -f "$WORKSPACE_DIR/.env" ]; then
+    export $(grep -v '^#' "$WORKSPACE_DIR/.env" | xargs)
 fi
 
-# Create wake-lock
-echo $$ > "$WAKE_LOCK"
-log "Processing Telegram messages (PID $$)"
+if [ -n "$PROCESSING_LOCK_LEASE_SECONDS" ]; then
+    LEASE_SECONDS=${PROCESSING_LOCK_LEASE_SECONDS%.*}
+fi
+if [ -n "$PROCESSING_MAX_PARALLEL_CHATS" ]; then
+    MAX_PARALLEL=$PROCESSING_MAX_PARALLEL_CHATS
+fi
 
-# Cleanup function
-cleanup() {
-    EXIT_CODE=$?
-    log "Processing completed with exit code $EXIT_CODE"
+# Run SQL against the messages database, waiting out other writers (runs
+# for different chats write concurrently)
+db() {
+    sqlite3 -cmd ".timeout $BUSY_TIMEOUT_MS" "$DB_PATH" "$1" 2>/dev/null
+}
 
-    # Always release database lock
-    if [ -f "$DB_PATH" ]; then
-        sqlite3 "$DB_PATH" "UPDATE processing_lock SET is_locked = 0, locked_at = NULL;" 2>/dev/null
-    fi
+READY="processed = 0 AND direction = 'incoming' AND (voice_file_path IS NULL OR voice_transcription IS NOT NULL)"
+NOW="CAST(strftime('%s', 'now') AS REAL)"
+
+# Chats with ready messages that no live run holds, oldest message first
+ready_chats() {
+    db "
+        SELECT chat_id FROM messages
+        WHERE $READY
+          AND chat_id NOT IN (SELECT chat_id FROM chat_locks WHERE lease_expires >= $NOW)
+        GROUP BY chat_id
+        ORDER BY MIN(created_at), MIN(id);"
+}
 
-    rm -f "$WAKE_LOCK"
+# Newest ready message ID for a chat (empty if none)
+newest_ready() {
+    db "SELECT MAX(id) FROM messages WHERE $READY AND chat_id = $1;"
 }
-trap cleanup EXIT
 
-# Load environment variables
-if [ -f "$WORKSPACE_DIR/.env" ]; then
-    export $(grep -v '^#' "$WORKSPACE_DIR/.env" | xargs)
-fi
+# Take a chat lock in one compare-and-set statement: succeeds if the chat
+# is free (or its holder's lease expired) and fewer than MAX_PARALLEL other
+# chats are held. Args: chat ID, holder PID
+acquire_chat_lock() {
+    CHANGED=$(db "
+        INSERT INTO chat_locks (chat_id, locked_at, holder_pid, holder_host, lease_expires)
+        SELECT $1, strftime('%Y-%m-%dT%H:%M:%f', 'now'), $2, '$HOLDER_HOST', $NOW + $LEASE_SECONDS
+        WHERE (SELECT COUNT(*) FROM chat_locks
+               WHERE chat_id != $1 AND lease_expires >= $NOW) < $MAX_PARALLEL
+        ON CONFLICT (chat_id) DO UPDATE
+        SET locked_at = excluded.locked_at, holder_pid = excluded.holder_pid,
+            holder_host = excluded.holder_host, lease_expires = excluded.lease_expires
+        WHERE chat_locks.lease_expires < $NOW;
+        SELECT changes();")
+    [ "$CHANGED" = "1" ]
+}
+
+# Release a chat lock if still held by this holder. Args: chat ID, holder PID
+release_chat_lock() {
+    db "
+        DELETE FROM chat_locks
+        WHERE chat_id = $1 AND holder_pid = $2 AND holder_host = '$HOLDER_HOST';"
+}
+
+# Extend a chat lock's lease. Args: chat ID, holder PID
+renew_chat_lock() {
+    db "
+        UPDATE chat_locks SET lease_expires = $NOW + $LEASE_SECONDS
+        WHERE chat_id = $1 AND holder_pid = $2 AND holder_host = '$HOLDER_HOST';"
+}
+
+# Renew a chat lock every third of its lease while the process running the
+# chat is alive. Args: chat ID, holder PID, chat process PID
+heartbeat() {
+    while sleep $((LEASE_SECONDS > 3 ? LEASE_SECONDS / 3 : 1)) && kill -0 "$3" 2>/dev/null; do
+        renew_chat_lock "$1" "$2"
+    done
+}
 
-# Get unprocessed message count
-if [ -f "$DB_PATH" ]; then
-    UNPROCESSED=$(sqlite3 "$DB_PATH" \
-        "SELECT COUNT(*) FROM messages WHERE processed = 0 AND direction = 'incoming';" 2>/dev/null)
+# Process one chat until it has no new messages; runs in a background
+# subshell and releases the chat lock (taken by the caller) when done.
+# Args: chat ID
+process_chat() {
+    CHAT_ID=$1
+    heartbeat "$CHAT_ID" $$ $BASHPID &
+    HEARTBEAT_PID=$!
+    trap 'kill $HEARTBEAT_PID 2>/dev/null; release_chat_lock "$CHAT_ID" $$' EXIT
+
+    cd "$WORKSPACE_DIR"
+    while true; do
+        NEWEST=$(newest_ready "$CHAT_ID")
+        log "Processing chat $CHAT_ID (PID $BASHPID)"
+
+        TELEGRAM_PROCESS_CHAT_ID=$CHAT_ID IS_SANDBOX=1 timeout "$TIMEOUT" \
+            claude --dangerously-skip-permissions "$WORKSPACE_DIR/claude.md" >> "$LOG_FILE" 2>&1
+        CLAUDE_EXIT=$?
+
+        if [ $CLAUDE_EXIT -eq 124 ]; then
+            log "ERROR: Claude timed out after ${TIMEOUT}s (chat $CHAT_ID)"
+        elif [ $CLAUDE_EXIT -ne 0 ]; then
+            log "ERROR: Claude exited with code $CLAUDE_EXIT (chat $CHAT_ID)"
+        else
+            log "Chat $CHAT_ID processed successfully"
+        fi
+
+        # Go again only for messages that arrived during the run; anything
+        # older left unprocessed waits for the next wake-up
+        LATEST=$(newest_ready "$CHAT_ID")
+        if [ -z "$LATEST" ] || [ -z "$NEWEST" ] || [ "$LATEST" -le "$NEWEST" ]; then
+            break
+        fi
+    done
+    return $CLAUDE_EXIT
+}
+
+# Start a run for every waiting chat that fits under MAX_PARALLEL; sets
+# WAITING to the number of chats left for a later pass
+process_queue() {
+    WAITING=0
+
+    # The OODA wake-up (wake-up.sh) has the workspace to itself
+    if [ -f "$WAKE_LOCK" ]; then
+        LOCK_PID=$(cat "$WAKE_LOCK")
+        if ps -p "$LOCK_PID" > /dev/null 2>&1; then
+            log "Agent already running (PID $LOCK_PID), skipping"
+            return 0
+        else
+            log "Removing stale wake-lock (PID $LOCK_PID)"
+            rm "$WAKE_LOCK"
+        fi
+    fi
+
+    [ -f "$DB_PATH" ] || return 0
 
-    if [ -z "$UNPROCESSED" ] || [ "$UNPROCESSED" -eq 0 ]; then
+    CHATS=$(ready_chats)
+    if [ -z "$CHATS" ]; then
         log "No unprocessed messages"
-        exit 0
+        return 0
     fi
 
-    log "Found $UNPROCESSED unprocessed message(s)"
-fi
+    # Locks are taken here, before the runs start, so the next pass sees
+    # them; this runner ($$) is the holder and each run releases its own
+    for CHAT in $CHATS; do
+        if acquire_chat_lock "$CHAT" $$; then
+            process_chat "$CHAT" &
+        else
+            WAITING=$((WAITING + 1))
+        fi
+    done
+
+    if [ "$WAITING" -gt 0 ]; then
+        log "$WAITING chat(s) waiting for a free slot (max $MAX_PARALLEL)"
+    fi
+}
 
-# Invoke Claude Code
-cd "$WORKSPACE_DIR"
-IS_SANDBOX=1 timeout "$TIMEOUT" claude --dangerously-skip-permissions "$WORKSPACE_DIR/claude.md" >> "$LOG_FILE" 2>&1
-CLAUDE_EXIT=$?
-
-if [ $CLAUDE_EXIT -eq 124 ]; then
-    log "ERROR: Claude timed out after ${TIMEOUT}s"
-    exit 124
-elif [ $CLAUDE_EXIT -ne 0 ]; then
-    log "ERROR: Claude exited with code $CLAUDE_EXIT"
-    exit $CLAUDE_EXIT
+trap 'log "Processing completed with exit code $?"' EXIT
+
+# Listen mode: stay running and process the queue on every line read from
+# stdin (written by the bot's dispatcher); exit when the pipe closes.
+# While chats wait for a slot, the queue is also re-checked every
+# RESCAN_SECONDS so they start as soon as a running chat finishes.
+if [ "$1" = "--listen" ]; then
+    log "Listening for wake-ups (PID $$)"
+    process_queue
+    while true; do
+        if [ "$WAITING" -gt 0 ]; then
+            read -r -t "$RESCAN_SECONDS" _
+        else
+            read -r _
+        fi
+        STATUS=$?
+        # End of input (timeouts return above 128)
+        if [ $STATUS -ne 0 ] && [ $STATUS -le 128 ]; then
+            break
+        fi
+        # Wake-ups that queued up while busy are covered by one pass
+        while read -r -t 0.1 _; do :; done
+        process_queue
+    done
+    log "Wake-up pipe closed, waiting for running chats"
+    wait
+    exit 0
 fi
 
-log "Telegram messages processed successfully"
+process_queue
+wait
 exit 0
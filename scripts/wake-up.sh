@@ -8,6 +8,7 @@ WAKE_LOCK="$WORKSPACE_DIR/.wake-lock"
 LOG_FILE="$WORKSPACE_DIR/logs/wake-up.log"
 TIMEOUT=3600  # 60 minutes
 PLAN_MANAGER="$WORKSPACE_DIR/scripts/plan-manager.sh"
+DB_PATH="$WORKSPACE_DIR/telegram_bot/messages.db"
 
 # Ensure logs directory exists
 mkdir -p "$WORKSPACE_DIR/logs"
@@ -29,6 +30,16 @@ if [ -f "$WAKE_LOCK" ]; then
     fi
 fi
 
+# Telegram chats being processed (telegram-process.sh) hold leased chat locks
+if [ -f "$DB_PATH" ]; then
+    ACTIVE_CHATS=$(sqlite3 "$DB_PATH" \
+        "SELECT COUNT(*) FROM chat_locks WHERE lease_expires >= CAST(strftime('%s', 'now') AS REAL);" 2>/dev/null)
+    if [ -n "$ACTIVE_CHATS" ] && [ "$ACTIVE_CHATS" -gt 0 ]; then
+        log "ERROR: $ACTIVE_CHATS Telegram chat(s) being processed, aborting"
+        exit 1
+    fi
+fi
+
 # Create lockfile with current PID
 echo $$ > "$WAKE_LOCK"
 log "INFO: Wake-up started (PID $$)"
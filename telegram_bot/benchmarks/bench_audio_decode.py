@@ -0,0 +1,71 @@
+"""Benchmark audio preparation for transcription.
+
+Compares the old path (ffmpeg writes a 16 kHz WAV next to the OGG, which
+is then decoded again and deleted) with decode_audio(), which decodes the
+OGG straight to float32 samples in memory. Inference is identical for
+both, so it is left out.
+
+Usage: python benchmarks/bench_audio_decode.py [audio files...]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from voice_transcription import SAMPLE_RATE, convert_to_wav, decode_audio
+
+
+FIXTURES_DIR = Path(__file__).parent.parent / "tests" / "fixtures"
+
+
+def wav_round_trip(audio_path: str):
+    """Previous transcribe_voice preparation: convert, decode WAV, delete."""
+    wav_path = convert_to_wav(audio_path)
+    audio = decode_audio(wav_path)
+    os.remove(wav_path)
+    return audio
+
+
+def time_ms(func, audio_path: str, iterations: int) -> float:
+    """Return median latency of func(audio_path) in milliseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func(audio_path)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Audio files (default: tests/fixtures)")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    files = args.files or sorted(str(p) for p in FIXTURES_DIR.glob("*.ogg"))
+
+    print(f"{'file':<24} {'seconds':>8} {'wav round trip ms':>18} {'in-memory ms':>13} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in files:
+            # Work on a copy so the WAV never lands in the fixtures directory
+            local = os.path.join(tmp, os.path.basename(path))
+            shutil.copy(path, local)
+
+            duration = len(decode_audio(local)) / SAMPLE_RATE
+            old = time_ms(wav_round_trip, local, args.iterations)
+            new = time_ms(decode_audio, local, args.iterations)
+
+            print(f"{os.path.basename(path):<24} {duration:>8.1f} {old:>18.2f} "
+                  f"{new:>13.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark draining a backlog of voice notes with batched inference.
+
+Transcribes the same backlog twice with the configured model, as one
+chat with its language pinned to --language: one transcribe_voice call
+per note, as the service does when it keeps up, and transcribe_batch in
+batches of --batch-size, as it does for a backlog. Reports wall-clock time
+for both and whether the transcripts agree.
+
+Usage: python benchmarks/bench_batch_transcription.py [--notes 24] [--batch-size 8] [--language en] [audio files...]
+"""
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import whisper_config
+import voice_transcription
+from voice_transcription import (SAMPLE_RATE, decode_audio, transcribe_batch, transcribe_voice,
+                                 warm_up_model)
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Audio files (default: WHISPER_PROFILE_SAMPLE)")
+    parser.add_argument("--notes", type=int, default=24, help="Voice notes in the backlog")
+    parser.add_argument("--batch-size", type=int, default=8, help="Notes per batch")
+    parser.add_argument("--language", default="en", help="Language the chat has pinned")
+    args = parser.parse_args()
+
+    files = args.files or [str(whisper_config.profile_sample_path())]
+    backlog = [Path(path).read_bytes() for path in itertools.islice(itertools.cycle(files), args.notes)]
+    seconds = sum(len(decode_audio(path)) for path in files) / SAMPLE_RATE / len(files) * args.notes
+
+    warm_up_model()
+    config = voice_transcription.get_config()
+    print(f"Model {config.model_size} ({config.compute_type}), beam {config.beam_size}, "
+          f"language {args.language}")
+    print(f"Backlog: {args.notes} note(s), {seconds:.1f}s of audio")
+
+    start = time.perf_counter()
+    sequential = [transcribe_voice(audio, language=args.language) for audio in backlog]
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = []
+    for i in range(0, len(backlog), args.batch_size):
+        batch = backlog[i:i + args.batch_size]
+        batched += transcribe_batch(batch, [{'language': args.language}] * len(batch))
+    batched_seconds = time.perf_counter() - start
+
+    same = sum(
+        a.transcription.split() == b.transcription.split()
+        for a, b in zip(sequential, batched)
+    )
+    print(f"{'sequential':<12} {sequential_seconds:>8.2f}s  RTF {sequential_seconds / seconds:.3f}")
+    print(f"{'batched':<12} {batched_seconds:>8.2f}s  RTF {batched_seconds / seconds:.3f}  "
+          f"({sequential_seconds / batched_seconds:.1f}x faster)")
+    print(f"Identical transcripts: {same}/{args.notes}")
+
+
+if __name__ == "__main__":
+    main()
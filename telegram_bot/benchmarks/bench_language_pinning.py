@@ -0,0 +1,85 @@
+"""Benchmark pinning a chat's language and priming it with a prompt.
+
+Transcribes each sample with the configured model three ways: with
+language detection (the default), with the language pinned as /language
+does, and pinned with an initial prompt as /prompt does. Reports the median
+inference time of --runs passes, the time to the first segment (what a
+partial transcript waits for) and whether the transcripts differ.
+
+Usage: python benchmarks/bench_language_pinning.py [--language en] [--prompt "..."] [--runs 5] [audio files...]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import whisper_config
+import voice_transcription
+from voice_transcription import transcribe_voice, warm_up_model
+
+
+def measure(audio: bytes, runs: int, **options):
+    """Median (inference seconds, seconds to first segment) and the result."""
+    inference, first = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        first_segment = []
+
+        def on_partial(text: str) -> None:
+            if not first_segment:
+                first_segment.append(time.perf_counter() - start)
+
+        result = transcribe_voice(audio, on_partial=on_partial, **options)
+        if not result.success:
+            raise SystemExit(f"Transcription failed: {result.error}")
+        inference.append(result.inference_seconds)
+        first.append(first_segment[0] if first_segment else result.inference_seconds)
+    return statistics.median(inference), statistics.median(first), result
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Audio files (default: WHISPER_PROFILE_SAMPLE)")
+    parser.add_argument("--language", help="Language to pin (default: the one detected)")
+    parser.add_argument("--prompt", default="", help="Initial prompt, e.g. names and terms in the note")
+    parser.add_argument("--runs", type=int, default=5, help="Passes per mode (median reported)")
+    args = parser.parse_args()
+
+    files = args.files or [str(whisper_config.profile_sample_path())]
+    warm_up_model()
+    config = voice_transcription.get_config()
+    print(f"Model {config.model_size} ({config.compute_type}), beam {config.beam_size}, "
+          f"{args.runs} run(s) per mode")
+    print(f"{'file':<20} {'mode':<16} {'lang':>5} {'infer s':>8} {'first s':>8} {'saved':>7} {'same text':>10}")
+
+    total_detected = total_pinned = 0.0
+    for path in files:
+        audio = Path(path).read_bytes()
+        detected_seconds, detected_first, detected = measure(audio, args.runs)
+        language = args.language or detected.language
+        modes = [("detected", detected_seconds, detected_first, detected)]
+        modes.append(("pinned", *measure(audio, args.runs, language=language)))
+        if args.prompt:
+            modes.append(("pinned+prompt", *measure(audio, args.runs, language=language,
+                                                    initial_prompt=args.prompt)))
+        total_detected += detected_seconds
+        total_pinned += modes[1][1]
+
+        for mode, seconds, first, result in modes:
+            saved = 1 - seconds / detected_seconds if detected_seconds else 0.0
+            same = result.transcription.split() == detected.transcription.split()
+            print(f"{os.path.basename(path):<20} {mode:<16} {result.language or '-':>5} "
+                  f"{seconds:>8.3f} {first:>8.3f} {saved:>7.0%} {'yes' if same else 'no':>10}")
+
+    print(f"\nInference {total_detected:.3f}s detected -> {total_pinned:.3f}s pinned "
+          f"({total_detected - total_pinned:.3f}s saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark queue polling latency against message history size.
+
+Builds databases with N processed history rows plus a small unprocessed
+queue, then times get_unprocessed_messages() with and without the partial
+queue index created by init_db.
+
+Usage: python benchmarks/bench_queue_poll.py [--sizes 10000,100000,1000000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import close_stores, get_db_connection, get_unprocessed_messages, init_db
+
+
+QUEUE_DEPTH = 20
+BATCH_SIZE = 50_000
+
+
+def build_db(db_path: str, history_rows: int) -> None:
+    """Create a database with processed history and a pending queue.
+
+    Args:
+        db_path: Path to SQLite database file
+        history_rows: Number of processed rows to insert
+    """
+    init_db(db_path)
+    conn = get_db_connection(db_path)
+
+    for start in range(0, history_rows, BATCH_SIZE):
+        count = min(BATCH_SIZE, history_rows - start)
+        conn.executemany(
+            "INSERT INTO messages (chat_id, user_id, message_id, text, direction, processed) "
+            "VALUES (?, ?, ?, ?, ?, 1)",
+            ((1, 1, start + i, "history message", "incoming" if i % 2 else "outgoing")
+             for i in range(count))
+        )
+        conn.commit()
+
+    conn.executemany(
+        "INSERT INTO messages (chat_id, user_id, message_id, text, direction) "
+        "VALUES (1, 1, ?, 'pending message', 'incoming')",
+        ((i,) for i in range(QUEUE_DEPTH))
+    )
+    conn.commit()
+    conn.close()
+
+
+def time_polls(db_path: str, iterations: int) -> float:
+    """Return median get_unprocessed_messages() latency in milliseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        messages = get_unprocessed_messages(db_path)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert len(messages) == QUEUE_DEPTH
+    return statistics.median(samples)
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Comma-separated history row counts")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    print(f"{'history rows':>14} {'indexed ms':>12} {'full scan ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            db_path = os.path.join(tmp, f"bench_{size}.db")
+            build_db(db_path, size)
+
+            indexed = time_polls(db_path, args.iterations)
+
+            conn = get_db_connection(db_path)
+            conn.execute("DROP INDEX idx_messages_queue")
+            conn.commit()
+            conn.close()
+            close_stores()
+
+            scan = time_polls(db_path, args.iterations)
+            close_stores()
+
+            print(f"{size:>14,} {indexed:>12.3f} {scan:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
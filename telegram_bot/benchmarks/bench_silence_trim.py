@@ -0,0 +1,96 @@
+"""Benchmark silence trimming before inference on noisy voice notes.
+
+Builds noisy variants of each sample (speech surrounded by seconds of
+background noise, as in a typical voice note held open too long) and
+transcribes each with the configured model twice: as-is, and trimmed to its
+speech by speech_detection. Reports the real-time factor of both, where the
+trimmed time includes speech detection, and whether the transcripts agree.
+
+Usage: python benchmarks/bench_silence_trim.py [--lead 3] [--tail 5] [--noise 0.005 0.02] [audio files...]
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import whisper_config
+from faster_whisper import WhisperModel
+from voice_transcription import SAMPLE_RATE, decode_audio, get_config, prepare_audio
+
+
+def add_noise(speech: np.ndarray, lead: float, tail: float, level: float,
+              seed: int = 0) -> np.ndarray:
+    """Pad speech with noise before and after, and lay noise under it."""
+    rng = np.random.default_rng(seed)
+    padded = np.concatenate([
+        np.zeros(int(lead * SAMPLE_RATE), dtype=np.float32),
+        speech,
+        np.zeros(int(tail * SAMPLE_RATE), dtype=np.float32),
+    ])
+    noisy = padded + level * rng.standard_normal(len(padded)).astype(np.float32)
+    return np.clip(noisy, -1.0, 1.0)
+
+
+def transcribe(model: WhisperModel, config, audio: np.ndarray):
+    """Transcribe audio as the bot would; returns (seconds, text)."""
+    start = time.perf_counter()
+    speech, spans = prepare_audio(audio, config)
+    texts = []
+    if spans != []:
+        segments, _ = model.transcribe(speech, **config.transcribe_kwargs())
+        texts = [seg.text.strip() for seg in segments]
+    return time.perf_counter() - start, " ".join(texts)
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Audio files (default: WHISPER_PROFILE_SAMPLE)")
+    parser.add_argument("--lead", type=float, default=3.0, help="Seconds of noise before speech")
+    parser.add_argument("--tail", type=float, default=5.0, help="Seconds of noise after speech")
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.005, 0.02],
+                        help="Noise amplitudes to test (0 = digital silence)")
+    args = parser.parse_args()
+
+    files = args.files or [str(whisper_config.profile_sample_path())]
+    base = replace(get_config(), vad_filter=False)
+    full, trimmed = replace(base, trim_silence=False), replace(base, trim_silence=True)
+
+    print(f"Model {base.model_size} ({base.compute_type}), beam {base.beam_size}")
+    model = WhisperModel(base.model_size, **base.model_kwargs())
+    model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), **base.transcribe_kwargs())
+
+    print(f"{'file':<20} {'noise':>6} {'audio s':>8} {'kept s':>7} "
+          f"{'RTF full':>9} {'RTF trim':>9} {'speedup':>8} {'same text':>10}")
+    total_full = total_trimmed = total_audio = 0.0
+    for path in files:
+        speech = decode_audio(path)
+        for level in args.noise:
+            audio = add_noise(speech, args.lead, args.tail, level)
+            kept, _ = prepare_audio(audio, trimmed)
+            duration = len(audio) / SAMPLE_RATE
+
+            full_seconds, full_text = transcribe(model, full, audio)
+            trim_seconds, trim_text = transcribe(model, trimmed, audio)
+            total_full += full_seconds
+            total_trimmed += trim_seconds
+            total_audio += duration
+
+            print(f"{os.path.basename(path):<20} {level:>6.3f} {duration:>8.1f} "
+                  f"{len(kept) / SAMPLE_RATE:>7.1f} {full_seconds / duration:>9.3f} "
+                  f"{trim_seconds / duration:>9.3f} {full_seconds / trim_seconds:>7.1f}x "
+                  f"{'yes' if full_text == trim_text else 'no':>10}")
+
+    print(f"\nOverall RTF {total_full / total_audio:.3f} -> {total_trimmed / total_audio:.3f} "
+          f"({total_full / total_trimmed:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Load-test webhook mode locally, without Telegram access.
+
+Starts the bot's application with its webhook server on localhost, using an
+offline Bot API backend that answers getMe/setWebhook/sendMessage itself,
+then POSTs synthetic text-message updates from concurrent clients. Reports
+webhook requests per second with p50/p95/p99 latency, and how fast the
+handlers stored the messages in a scratch database.
+
+Usage: python benchmarks/bench_webhook.py [--updates 2000] [--concurrency 32] [--chats 8]
+                                          [--concurrent-updates N]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import bot_server
+from async_database import close_async_stores, get_async_store
+from database import close_stores, init_db
+from telegram.request import BaseRequest, RequestData
+
+
+SECRET = "bench-secret"
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class OfflineRequest(BaseRequest):
+    """Bot API backend that answers locally instead of calling Telegram."""
+
+    async def initialize(self) -> None:
+        """Nothing to set up."""
+
+    async def shutdown(self) -> None:
+        """Nothing to tear down."""
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None
+    ) -> Tuple[int, bytes]:
+        """Return a canned successful response for the called endpoint."""
+        endpoint = url.rsplit("/", 1)[-1]
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "sendMessage":
+            params = request_data.parameters if request_data else {}
+            result = {
+                "message_id": 1, "date": int(time.time()), "text": params.get("text", ""),
+                "chat": {"id": params.get("chat_id", 0), "type": "private"}, "from": BOT_USER,
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    """Build a text-message update payload as Telegram would post it."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load", "username": "load"},
+            "text": f"load test message {update_id}",
+        },
+    }
+
+
+async def _client_loop(port: int, path: str, update_ids, chats: int,
+                       latencies: List[float]) -> None:
+    """Send updates one after another over one keep-alive connection."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for update_id in update_ids:
+            body = json.dumps(make_update(update_id, 1000 + update_id % chats)).encode()
+            head = (
+                f"POST /{path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                f"Content-Type: application/json\r\n"
+                f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n"
+            ).encode()
+            start = time.perf_counter()
+            writer.write(head + body)
+            status = await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if b" 200 " not in status:
+                raise RuntimeError(f"Webhook answered {status.decode().strip()}")
+    finally:
+        writer.close()
+
+
+def post_updates(port: int, path: str, updates: int, concurrency: int,
+                 chats: int) -> List[float]:
+    """POST updates from concurrent clients; returns latencies in seconds.
+
+    Runs in its own process so the load generator does not compete with
+    the server for the event loop.
+    """
+    latencies: List[float] = []
+    update_ids = iter(range(1, updates + 1))
+
+    async def drive():
+        await asyncio.gather(*(
+            _client_loop(port, path, update_ids, chats, latencies)
+            for _ in range(concurrency)
+        ))
+
+    asyncio.run(drive())
+    return latencies
+
+
+async def wait_for_rows(db_path: str, expected: int, timeout: float = 60) -> None:
+    """Wait until the handlers have stored the expected number of messages."""
+    store = get_async_store(db_path)
+    deadline = time.monotonic() + timeout
+    while await store.count_unprocessed() < expected:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Handlers did not store every update in time")
+        await asyncio.sleep(0.01)
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Return a percentile of sorted samples."""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(args, db_path: str) -> None:
+    """Serve the webhook, drive load at it and print the results."""
+    bot_server.DB_PATH = db_path
+    bot_server.BOT_TOKEN = "123456:offline"
+    bot_server.CONCURRENT_UPDATES = args.concurrent_updates
+    application = bot_server.build_application(request=OfflineRequest())
+    # Only the update handlers are measured: no runner or transcription service
+    application.post_init = None
+    application.post_shutdown = None
+
+    url = f"http://127.0.0.1:{args.port}/{bot_server.WEBHOOK_PATH}"
+    async with application:
+        await application.updater.start_webhook(
+            listen="127.0.0.1", port=args.port, url_path=bot_server.WEBHOOK_PATH,
+            webhook_url=url, secret_token=SECRET
+        )
+        await application.start()
+
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Start the load process before timing
+            await loop.run_in_executor(pool, time.sleep, 0)
+            start = time.perf_counter()
+            latencies = await loop.run_in_executor(
+                pool, post_updates, args.port, bot_server.WEBHOOK_PATH,
+                args.updates, args.concurrency, args.chats
+            )
+            posted = time.perf_counter() - start
+        await wait_for_rows(db_path, args.updates)
+        handled = time.perf_counter() - start
+
+        await application.updater.stop()
+        await application.stop()
+
+    ordered = sorted(latencies)
+    print(f"updates:        {args.updates} from {args.concurrency} client(s), {args.chats} chat(s)")
+    print(f"concurrency:    {bot_server.CONCURRENT_UPDATES} update(s) handled at once")
+    print(f"webhook:        {args.updates / posted:,.0f} req/s")
+    print(f"latency:        p50 {statistics.median(ordered) * 1000:.2f} ms, "
+          f"p95 {percentile(ordered, 0.95) * 1000:.2f} ms, "
+          f"p99 {percentile(ordered, 0.99) * 1000:.2f} ms")
+    print(f"handled:        {args.updates / handled:,.0f} updates/s stored end to end")
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="Simultaneous HTTP clients")
+    parser.add_argument("--chats", type=int, default=8,
+                        help="Distinct chats the updates are spread over")
+    parser.add_argument("--concurrent-updates", type=int, default=bot_server.CONCURRENT_UPDATES,
+                        help="Updates the application handles at once")
+    parser.add_argument("--port", type=int, default=18443)
+    args = parser.parse_args()
+
+    os.environ["ALLOWED_CHAT_IDS"] = ",".join(str(1000 + i) for i in range(args.chats))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        init_db(db_path)
+        try:
+            asyncio.run(run(args, db_path))
+        finally:
+            asyncio.run(close_async_stores())
+            close_stores()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark Whisper profiles on sample audio.
+
+Times every profile in whisper_config.PROFILES (with WHISPER_* overrides
+applied) and reports model load time, inference time and real-time factor,
+so each deployment can trade accuracy for latency. With --select, also
+stores the auto profile choice for WHISPER_PROFILE=auto.
+
+Usage: python benchmarks/bench_whisper_profiles.py [--target-rtf 0.5] [--select] [audio files...]
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import whisper_config
+from voice_transcription import SAMPLE_RATE, decode_audio, measure_profile
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Audio files (default: WHISPER_PROFILE_SAMPLE)")
+    parser.add_argument("--target-rtf", type=float, default=whisper_config.target_rtf())
+    parser.add_argument("--select", action="store_true",
+                        help="Cache the most accurate profile meeting --target-rtf")
+    args = parser.parse_args()
+
+    files = args.files or [str(whisper_config.profile_sample_path())]
+    clips = {path: decode_audio(path) for path in files}
+    total_seconds = sum(len(audio) for audio in clips.values()) / SAMPLE_RATE
+
+    print(f"Audio: {len(clips)} file(s), {total_seconds:.1f}s, target RTF {args.target_rtf}")
+    print(f"{'profile':<10} {'model':<8} {'beam':>4} {'vad':>5} {'load s':>7} {'infer s':>8} {'RTF':>6}")
+
+    rtfs = {}
+    for name, base in whisper_config.PROFILES.items():
+        config = whisper_config.apply_env_overrides(base)
+        load = infer = 0.0
+        for audio in clips.values():
+            result = measure_profile(config, audio)
+            load = max(load, result['load_seconds'])
+            infer += result['inference_seconds']
+        rtfs[name] = infer / total_seconds
+        marker = "  ok" if rtfs[name] <= args.target_rtf else ""
+        print(f"{name:<10} {config.model_size:<8} {config.beam_size:>4} {str(config.vad_filter):>5} "
+              f"{load:>7.2f} {infer:>8.2f} {rtfs[name]:>6.3f}{marker}")
+
+    chosen = next((name for name, rtf in rtfs.items() if rtf <= args.target_rtf),
+                  list(whisper_config.PROFILES)[-1])
+    print(f"\nAuto profile for target RTF {args.target_rtf}: {chosen}")
+
+    if args.select:
+        whisper_config.save_cached_profile(args.target_rtf, chosen, rtfs)
+        print(f"Saved to {whisper_config.profile_cache_path()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""CLI for consuming the message queue with claim/ack/nack semantics.
+
+Claimed messages are hidden from other consumers until acked or nacked,
+or until the visibility timeout passes (then they are delivered again).
+
+Usage:
+    python claim_messages.py claim [--limit N] [--worker ID] [--timeout SECONDS] [--chat ID]
+    python claim_messages.py ack --worker ID <message row id>...
+    python claim_messages.py nack --worker ID [--error TEXT] <message row id>...
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from database import VISIBILITY_TIMEOUT_SECONDS, ack, claim_batch, nack
+
+
+# Configuration
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "/root/workspace")
+DB_PATH = os.path.join(WORKSPACE_DIR, "telegram_bot", "messages.db")
+# Set by telegram-process.sh for each per-chat agent run
+PROCESS_CHAT_ID = os.getenv("TELEGRAM_PROCESS_CHAT_ID") or None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command-line parser."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    claim = commands.add_parser("claim", help="Claim ready messages (printed as JSON)")
+    claim.add_argument("--limit", type=int, default=50)
+    claim.add_argument("--worker", default=f"{socket.gethostname()}:{os.getpid()}",
+                       help="Consumer ID to ack or nack with later")
+    claim.add_argument("--timeout", type=float, default=VISIBILITY_TIMEOUT_SECONDS,
+                       help="Visibility timeout in seconds")
+    claim.add_argument("--chat", type=int, default=PROCESS_CHAT_ID,
+                       help="Only claim this chat's messages (default: the chat "
+                            "telegram-process.sh is running for, if any)")
+
+    for name in ("ack", "nack"):
+        command = commands.add_parser(name)
+        command.add_argument("--worker", required=True)
+        command.add_argument("ids", type=int, nargs="+")
+    commands.choices["nack"].add_argument("--error", help="Reason for the failure")
+
+    return parser
+
+
+def main(argv=None):
+    """Main entry point for CLI."""
+    args = build_parser().parse_args(argv)
+
+    if args.command == "claim":
+        messages = claim_batch(DB_PATH, args.limit, args.worker, args.timeout,
+                               chat_id=args.chat)
+        print(json.dumps({'worker_id': args.worker, 'messages': messages}, indent=2))
+        return 0
+
+    if args.command == "ack":
+        count = ack(DB_PATH, args.ids, args.worker)
+    else:
+        count = nack(DB_PATH, args.ids, args.worker, args.error)
+
+    if count < len(args.ids):
+        print(f"{len(args.ids) - count} message(s) were no longer claimed by {args.worker}",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,153 @@
 """CLI utility for sending Telegram messages.
 
-Usage: python send_message.py <chat_id> <message text>
+Messages are handed to the running bot's outbound sender over a local
+socket; it stores them in the outbox and delivers them over its open Bot
+API connections. If the bot is not running, the message is stored and
+sent directly with a new Bot client; if that fails with a temporary error
+it stays in the outbox and the bot delivers it once it runs.
+
+Usage:
+    python send_message.py <chat_id> <message text>
+    python send_message.py --batch < messages.jsonl   (lines of {"chat_id": ..., "text": ...})
 """
 import asyncio
+import json
 import os
 import sys
+import time
 from pathlib import Path
+from typing import Dict, List, Optional
 
 from telegram import Bot
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
-from database import add_outgoing_message
+from database import complete_delivery, enqueue_outgoing_message, fail_delivery, retry_delivery
+from outbound_formatter import split_message
+from outbound_sender import WAIT_SECONDS, retry_delay, sender_socket_path
 
 
 # Configuration
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "/root/workspace")
 DB_PATH = os.path.join(WORKSPACE_DIR, "telegram_bot", "messages.db")
+# The sender answers within WAIT_SECONDS; allow for a busy bot on top
+REPLY_TIMEOUT_SECONDS = WAIT_SECONDS + 30
+
+
+async def send_via_service(messages: List[Dict]) -> Optional[List[Dict]]:
+    """Hand messages to the bot's outbound sender.
+
+    Args:
+        messages: Dicts with chat_id and text
+
+    Returns:
+        One reply per message, in the same order (ok, message_id or
+        error, queued if still in the outbox), or None if no sender is
+        listening
+    """
+    try:
+        reader, writer = await asyncio.open_unix_connection(sender_socket_path(DB_PATH))
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+    try:
+        for index, message in enumerate(messages):
+            request = {'id': index, 'chat_id': message['chat_id'], 'text': message['text']}
+            writer.write(json.dumps(request).encode() + b"\n")
+        writer.write_eof()
+        await writer.drain()
+
+        replies: List[Optional[Dict]] = [None] * len(messages)
+        deadline = time.monotonic() + REPLY_TIMEOUT_SECONDS
+        missing = "Sender closed the connection"
+        while True:
+            try:
+                line = await asyncio.wait_for(reader.readline(),
+                                              max(deadline - time.monotonic(), 0.0))
+            except asyncio.TimeoutError:
+                missing = "Sender did not reply"
+                break
+            if not line:
+                break
+            reply = json.loads(line)
+            replies[reply['id']] = reply
+    finally:
+        writer.close()
+
+    # A reply missing because the bot stopped mid-batch or hung counts as
+    # failed here; if the bot had stored the message, it delivers it later
+    return [reply or {'ok': False, 'error': missing} for reply in replies]
+
+
+async def send_direct(chat_id: int, message: str) -> bool:
+    """Store message in the outbox, then send it with a new Bot client.
+
+    Text over Telegram's limit is stored and sent in parts. After a
+    temporary error the remaining parts are left in the outbox, behind the
+    failed one, for the bot to deliver in order.
+
+    Args:
+        chat_id: Telegram chat ID
+        message: Message text to send
+
+    Returns:
+        True if sent, or left in the outbox after a temporary error;
+        False if it failed for good
+    """
+    parts = split_message(message)
+    bot = None
+    for index, part in enumerate(parts):
+        try:
+            row_id = enqueue_outgoing_message(DB_PATH, chat_id, part, claim=True)
+        except Exception as e:
+            print(f"Error storing message: {e}", file=sys.stderr)
+            return False
+
+        try:
+            bot = bot or Bot(token=BOT_TOKEN)
+            sent = await bot.send_message(chat_id=chat_id, text=part)
+        except Exception as e:
+            delay = retry_delay(e, 1)
+            if delay is None:
+                fail_delivery(DB_PATH, row_id, str(e))
+                print(f"Error sending message: {e}", file=sys.stderr)
+                return False
+            retry_delivery(DB_PATH, row_id, str(e), delay)
+            for rest in parts[index + 1:]:
+                enqueue_outgoing_message(DB_PATH, chat_id, rest)
+            print(f"Message queued, the bot will deliver it: {e}", file=sys.stderr)
+            return True
+
+        complete_delivery(DB_PATH, row_id, sent.message_id)
+    return True
+
+
+async def send_messages(messages: List[Dict]) -> int:
+    """Send messages through the outbound sender, or directly as a fallback.
+
+    Args:
+        messages: Dicts with chat_id and text
+
+    Returns:
+        Number of messages that failed
+    """
+    replies = await send_via_service(messages)
+    if replies is None:
+        results = [await send_direct(m['chat_id'], m['text']) for m in messages]
+        return results.count(False)
+
+    for reply in replies:
+        if not reply['ok']:
+            print(f"Error sending message: {reply['error']}", file=sys.stderr)
+        elif reply.get('queued'):
+            print("Message queued, the bot will deliver it", file=sys.stderr)
+    return sum(1 for reply in replies if not reply['ok'])
 
 
 async def send_telegram_message(chat_id: int, message: str) -> bool:
-    """Send message via Telegram and log to database.
+    """Send message via Telegram, recording it in the outbox.
 
     Args:
         chat_id: Telegram chat ID
@@ -31,22 +156,25 @@ async def send_telegram_message(chat_id: int, message: str) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    try:
-        bot = Bot(token=BOT_TOKEN)
-        await bot.send_message(chat_id=chat_id, text=message)
-
-        # Log to database
-        add_outgoing_message(DB_PATH, chat_id, message)
+    return await send_messages([{'chat_id': chat_id, 'text': message}]) == 0
 
-        return True
 
-    except Exception as e:
-        print(f"Error sending message: {e}", file=sys.stderr)
-        return False
+def read_batch(lines) -> List[Dict]:
+    """Parse JSON lines with chat_id and text, skipping blank lines."""
+    messages = []
+    for line in lines:
+        if line.strip():
+            message = json.loads(line)
+            messages.append({'chat_id': int(message['chat_id']), 'text': message['text']})
+    return messages
 
 
 def main():
     """Main entry point for CLI."""
+    if len(sys.argv) == 2 and sys.argv[1] == "--batch":
+        failed = asyncio.run(send_messages(read_batch(sys.stdin)))
+        sys.exit(0 if failed == 0 else 1)
+
     if len(sys.argv) < 3:
         print("Usage: python send_message.py <chat_id> <message text>", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,303 @@
+"""Asyncio adapter for the SQLite message queue.
+
+Like aiosqlite, each database gets one dedicated thread that owns its
+connection; coroutines hand calls to that thread and await the result, so
+the bot's event loop never blocks on SQLite I/O.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from database import (LOCK_LEASE_SECONDS, MAX_DELIVERY_ATTEMPTS, MAX_PARALLEL_CHATS,
+                      VISIBILITY_TIMEOUT_SECONDS, get_store)
+
+
+class AsyncMessageStore:
+    """Awaitable counterpart of database.MessageStore."""
+
+    def __init__(self, db_path: str):
+        """Create an adapter for a database file.
+
+        Args:
+            db_path: Path to SQLite database file
+        """
+        self.db_path = db_path
+        self._store = get_store(db_path)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a MessageStore call on the database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def add_incoming_message(
+        self,
+        chat_id: int,
+        user_id: int,
+        username: str,
+        message_id: int,
+        text: Optional[str] = None,
+        voice_file_path: Optional[str] = None,
+        voice_transcription: Optional[str] = None
+    ) -> int:
+        """Insert an incoming message and return its row ID."""
+        return await self._run(
+            self._store.add_incoming_message, chat_id, user_id, username,
+            message_id, text, voice_file_path, voice_transcription
+        )
+
+    async def add_outgoing_message(self, chat_id: int, text: str) -> int:
+        """Insert an outgoing message that was already sent and return its row ID."""
+        return await self._run(self._store.add_outgoing_message, chat_id, text)
+
+    async def enqueue_outgoing_message(self, chat_id: int, text: str, claim: bool = False) -> int:
+        """Store a message to send in the outbox and return its row ID."""
+        return await self._run(self._store.enqueue_outgoing_message, chat_id, text, claim)
+
+    async def claim_deliveries(self, limit: int) -> List[Dict]:
+        """Move up to limit due outbox messages (one per chat) to sending."""
+        return await self._run(self._store.claim_deliveries, limit)
+
+    async def get_following_deliveries(self, chat_id: int, after_id: int,
+                                       limit: int) -> List[Dict]:
+        """Return due outbox messages of a chat queued after a given one."""
+        return await self._run(self._store.get_following_deliveries, chat_id, after_id, limit)
+
+    async def claim_delivery_ids(self, row_ids: List[int]) -> List[Dict]:
+        """Move the given pending outbox messages to sending."""
+        return await self._run(self._store.claim_delivery_ids, row_ids)
+
+    async def complete_delivery(self, row_id: int, telegram_message_id: Optional[int]) -> None:
+        """Mark a message being sent as delivered."""
+        await self._run(self._store.complete_delivery, row_id, telegram_message_id)
+
+    async def retry_delivery(self, row_id: int, error: str, delay: float) -> None:
+        """Return a message being sent to the outbox, due in delay seconds."""
+        await self._run(self._store.retry_delivery, row_id, error, delay)
+
+    async def fail_delivery(self, row_id: int, error: str) -> None:
+        """Give up on a message being sent."""
+        await self._run(self._store.fail_delivery, row_id, error)
+
+    async def get_delivery(self, row_id: int) -> Optional[Dict]:
+        """Return an outgoing message's delivery state."""
+        return await self._run(self._store.get_delivery, row_id)
+
+    async def next_delivery_at(self) -> Optional[float]:
+        """Return when the earliest pending outbox message is due, if any."""
+        return await self._run(self._store.next_delivery_at)
+
+    async def count_pending_deliveries(self) -> int:
+        """Return the number of outbox messages not yet delivered or failed."""
+        return await self._run(self._store.count_pending_deliveries)
+
+    async def requeue_deliveries(self, unleased: bool = True) -> int:
+        """Return messages left sending by a crashed process to the outbox."""
+        return await self._run(self._store.requeue_deliveries, unleased)
+
+    async def get_unprocessed_messages(self, chat_id: Optional[int] = None) -> List[Dict]:
+        """Return unprocessed incoming messages ordered by created_at."""
+        return await self._run(self._store.get_unprocessed_messages, chat_id)
+
+    async def claim_batch(self, limit: int, worker_id: str,
+                          visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS,
+                          max_attempts: int = MAX_DELIVERY_ATTEMPTS,
+                          chat_id: Optional[int] = None) -> List[Dict]:
+        """Claim up to limit ready messages for worker_id."""
+        return await self._run(
+            self._store.claim_batch, limit, worker_id, visibility_timeout, max_attempts, chat_id
+        )
+
+    async def ack(self, message_ids: List[int], worker_id: str) -> int:
+        """Mark claimed messages processed."""
+        return await self._run(self._store.ack, message_ids, worker_id)
+
+    async def nack(self, message_ids: List[int], worker_id: str, error: Optional[str] = None,
+                   max_attempts: int = MAX_DELIVERY_ATTEMPTS) -> int:
+        """Return claimed messages to the queue."""
+        return await self._run(self._store.nack, message_ids, worker_id, error, max_attempts)
+
+    async def count_unprocessed(self) -> int:
+        """Return the number of messages ready for processing."""
+        return await self._run(self._store.count_unprocessed)
+
+    async def mark_messages_processed(self, message_ids: List[int]) -> None:
+        """Mark the given message rows as processed."""
+        await self._run(self._store.mark_messages_processed, message_ids)
+
+    async def acquire_lock(self, holder_pid: Optional[int] = None,
+                           holder_host: Optional[str] = None,
+                           lease_seconds: float = LOCK_LEASE_SECONDS) -> bool:
+        """Take the processing lock; False if another holder's lease is live."""
+        return await self._run(self._store.acquire_lock, holder_pid, holder_host, lease_seconds)
+
+    async def renew_lock(self, holder_pid: Optional[int] = None,
+                         holder_host: Optional[str] = None,
+                         lease_seconds: float = LOCK_LEASE_SECONDS) -> bool:
+        """Extend the holder's lease; False if it no longer holds the lock."""
+        return await self._run(self._store.renew_lock, holder_pid, holder_host, lease_seconds)
+
+    async def release_lock(self, holder_pid: Optional[int] = None,
+                           holder_host: Optional[str] = None) -> None:
+        """Release the processing lock (only the holder's, if given)."""
+        await self._run(self._store.release_lock, holder_pid, holder_host)
+
+    async def is_locked(self) -> bool:
+        """Return True if the processing lock is held under a live lease."""
+        return await self._run(self._store.is_locked)
+
+    async def get_lock_info(self) -> Dict:
+        """Return the lock state, holder and lease expiry."""
+        return await self._run(self._store.get_lock_info)
+
+    async def get_ready_chats(self) -> List[int]:
+        """Return chats with ready messages and no live chat lock."""
+        return await self._run(self._store.get_ready_chats)
+
+    async def acquire_chat_lock(self, chat_id: int, holder_pid: Optional[int] = None,
+                                holder_host: Optional[str] = None,
+                                lease_seconds: float = LOCK_LEASE_SECONDS,
+                                max_parallel: int = MAX_PARALLEL_CHATS) -> bool:
+        """Take one chat's lock; False if held or no parallel slot is free."""
+        return await self._run(
+            self._store.acquire_chat_lock, chat_id, holder_pid, holder_host,
+            lease_seconds, max_parallel
+        )
+
+    async def renew_chat_lock(self, chat_id: int, holder_pid: Optional[int] = None,
+                              holder_host: Optional[str] = None,
+                              lease_seconds: float = LOCK_LEASE_SECONDS) -> bool:
+        """Extend a chat lock's lease; False if the holder lost it."""
+        return await self._run(
+            self._store.renew_chat_lock, chat_id, holder_pid, holder_host, lease_seconds
+        )
+
+    async def release_chat_lock(self, chat_id: int, holder_pid: Optional[int] = None,
+                                holder_host: Optional[str] = None) -> None:
+        """Release a chat lock (only the holder's, if given)."""
+        await self._run(self._store.release_chat_lock, chat_id, holder_pid, holder_host)
+
+    async def get_chat_lock_info(self, chat_id: int) -> Dict:
+        """Return one chat's lock state, holder and lease expiry."""
+        return await self._run(self._store.get_chat_lock_info, chat_id)
+
+    async def get_chat_locks(self) -> List[Dict]:
+        """Return the chat locks held under a live lease."""
+        return await self._run(self._store.get_chat_locks)
+
+    async def enqueue_transcription_job(
+        self,
+        message_row_id: int,
+        voice_file_path: str,
+        audio_hash: Optional[str] = None,
+        config_key: Optional[str] = None,
+        language: Optional[str] = None,
+        initial_prompt: Optional[str] = None
+    ) -> int:
+        """Queue a voice file for transcription and return the job ID."""
+        return await self._run(
+            self._store.enqueue_transcription_job, message_row_id, voice_file_path,
+            audio_hash, config_key, language, initial_prompt
+        )
+
+    async def claim_transcription_jobs(self, limit: int) -> List[Dict]:
+        """Move up to limit pending jobs to running and return them."""
+        return await self._run(self._store.claim_transcription_jobs, limit)
+
+    async def count_pending_transcription_jobs(self) -> int:
+        """Return the number of jobs waiting for a worker."""
+        return await self._run(self._store.count_pending_transcription_jobs)
+
+    async def get_transcription_job(self, job_id: int) -> Optional[Dict]:
+        """Return a job joined with its message's chat details."""
+        return await self._run(self._store.get_transcription_job, job_id)
+
+    async def set_partial_transcription(self, job_id: int, transcription: str) -> None:
+        """Store the transcript decoded so far on the job's message."""
+        await self._run(self._store.set_partial_transcription, job_id, transcription)
+
+    async def complete_transcription_job(self, job_id: int, transcription: str,
+                                         stats: Optional[Dict] = None) -> None:
+        """Mark a job done and write the transcript and telemetry to its message."""
+        await self._run(self._store.complete_transcription_job, job_id, transcription, stats)
+
+    async def fail_transcription_job(self, job_id: int, error: str, max_attempts: int) -> bool:
+        """Record a failed attempt; True if the job failed for good."""
+        return await self._run(
+            self._store.fail_transcription_job, job_id, error, max_attempts
+        )
+
+    async def get_cached_transcription(self, audio_hash: str, config_key: str) -> Optional[str]:
+        """Return a cached transcript and count the hit, or None."""
+        return await self._run(self._store.get_cached_transcription, audio_hash, config_key)
+
+    async def put_cached_transcription(self, audio_hash: str, config_key: str,
+                                       transcription: str) -> None:
+        """Store or refresh a cached transcript."""
+        await self._run(
+            self._store.put_cached_transcription, audio_hash, config_key, transcription
+        )
+
+    async def evict_transcription_cache(self, max_entries: int, max_age_days: float) -> int:
+        """Trim the cache by age and size; returns entries removed."""
+        return await self._run(
+            self._store.evict_transcription_cache, max_entries, max_age_days
+        )
+
+    async def requeue_transcription_jobs(self) -> int:
+        """Return jobs left running by a crashed process to pending."""
+        return await self._run(self._store.requeue_transcription_jobs)
+
+    async def get_chat_settings(self, chat_id: int) -> Dict:
+        """Return a chat's transcription settings (defaults if never set)."""
+        return await self._run(self._store.get_chat_settings, chat_id)
+
+    async def set_chat_language(self, chat_id: int, language: Optional[str]) -> None:
+        """Pin a chat's transcription language, or unpin it with None."""
+        await self._run(self._store.set_chat_language, chat_id, language)
+
+    async def set_chat_prompt_history(self, chat_id: int, enabled: bool) -> None:
+        """Turn priming transcription with a chat's recent messages on or off."""
+        await self._run(self._store.set_chat_prompt_history, chat_id, enabled)
+
+    async def get_recent_texts(self, chat_id: int, limit: int) -> List[str]:
+        """Return the last limit texts and transcripts of a chat, oldest first."""
+        return await self._run(self._store.get_recent_texts, chat_id, limit)
+
+    async def close(self) -> None:
+        """Close the thread's connection and stop the database thread."""
+        await self._run(self._store.close)
+        self._executor.shutdown(wait=False)
+
+
+_async_stores: Dict[str, AsyncMessageStore] = {}
+_async_stores_lock = threading.Lock()
+
+
+def get_async_store(db_path: str) -> AsyncMessageStore:
+    """Get the shared AsyncMessageStore for a database path.
+
+    Args:
+        db_path: Path to SQLite database file
+
+    Returns:
+        AsyncMessageStore reused by every caller in this process
+    """
+    store = _async_stores.get(db_path)
+    if store is None:
+        with _async_stores_lock:
+            store = _async_stores.setdefault(db_path, AsyncMessageStore(db_path))
+    return store
+
+
+async def close_async_stores() -> None:
+    """Close all adapters and their database threads."""
+    with _async_stores_lock:
+        stores = list(_async_stores.values())
+        _async_stores.clear()
+    for store in stores:
+        await store.close()
@@ -1,18 +1,27 @@
 """Telegram bot server - main bot handlers."""
+import asyncio
+import functools
 import os
-import subprocess
+import time
 from pathlib import Path
+from typing import Dict, Optional
 
-from telegram import Update
+from telegram import Bot, Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-
-from database import (
-    add_incoming_message,
-    is_locked,
-    init_db
-)
-from voice_transcription import transcribe_voice
+from telegram.request import BaseRequest
+
+from async_database import close_async_stores, get_async_store
+from chat_settings import describe_settings, parse_language, transcription_options
+from database import MAX_PARALLEL_CHATS, init_db
+from dispatcher import ProcessingDispatcher
+from outbound_sender import OutboundSender
+from queue_watcher import METRICS_PATH, PID_PATH, QueueWatcher, build_dispatcher
+from transcription_cache import TranscriptionCache, hash_audio_bytes
+from transcription_service import WHISPER_PRELOAD, TranscriptionService
+from update_processor import CONCURRENT_UPDATES, ChatOrderedUpdateProcessor
+from voice_transcription import TranscriptionResult, get_config
 from whitelist import is_whitelisted
+from workers import run_in_worker, shutdown_workers
 
 
 # Configuration from environment
@@ -21,6 +30,23 @@ WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "/root/workspace")
 DB_PATH = os.path.join(WORKSPACE_DIR, "telegram_bot", "messages.db")
 VOICE_DIR = os.path.join(WORKSPACE_DIR, "telegram_bot", "voice_files")
 
+# Webhook mode (opt-in): set TELEGRAM_WEBHOOK_URL to the public HTTPS base
+# URL that forwards to WEBHOOK_LISTEN:WEBHOOK_PORT; otherwise the bot polls
+WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+# Simultaneous HTTPS connections Telegram may open to the webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Started in post_init once the event loop is running
+_transcription_service: Optional[TranscriptionService] = None
+_transcription_cache: Optional[TranscriptionCache] = None
+_dispatcher: Optional[ProcessingDispatcher] = None
+_watcher: Optional[QueueWatcher] = None
+_sender: Optional[OutboundSender] = None
+
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command.
@@ -37,24 +63,135 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /status command.
 
-    Shows processing lock status and system health.
+    Shows the chats being processed (this one and overall), voice model
+    readiness, transcription cache effectiveness and system health.
 
     Args:
         update: Telegram update
         context: Telegram context
     """
-    lock_status = "locked" if is_locked(DB_PATH) else "unlocked"
+    store = get_async_store(DB_PATH)
+    chat_lock = await store.get_chat_lock_info(update.effective_chat.id)
+    active_chats = await store.get_chat_locks()
 
     status_msg = f"""📊 Agent Status
 
-Processing lock: {lock_status}
+This chat: {describe_lock_status(chat_lock)}
+Chats in progress: {len(active_chats)} of {MAX_PARALLEL_CHATS}
+Voice model: {describe_model_status()}
+Transcription cache: {describe_cache_status()}
 
-The agent is {"currently processing messages" if is_locked(DB_PATH) else "ready to process messages"}.
+The agent is {"currently processing messages" if active_chats else "ready to process messages"}.
 """
 
     await update.message.reply_text(status_msg)
 
 
+async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /language: show or pin the language voice notes are in.
+
+    "/language de" skips language detection for this chat's voice notes;
+    "/language auto" goes back to detecting it per message.
+
+    Args:
+        update: Telegram update
+        context: Telegram context (args holds the language code)
+    """
+    chat_id = update.effective_chat.id
+    if not is_whitelisted(chat_id):
+        return
+
+    store = get_async_store(DB_PATH)
+    if context.args:
+        try:
+            language = parse_language(context.args[0])
+        except ValueError as e:
+            await update.message.reply_text(
+                f"{e}. Use a Whisper language code such as en or de, or auto."
+            )
+            return
+        await store.set_chat_language(chat_id, language)
+
+    await update.message.reply_text(describe_settings(await store.get_chat_settings(chat_id)))
+
+
+async def prompt_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /prompt: turn priming voice notes with recent messages on or off.
+
+    Args:
+        update: Telegram update
+        context: Telegram context (args holds "on" or "off")
+    """
+    chat_id = update.effective_chat.id
+    if not is_whitelisted(chat_id):
+        return
+
+    store = get_async_store(DB_PATH)
+    if context.args:
+        choice = context.args[0].strip().lower()
+        if choice not in ("on", "off"):
+            await update.message.reply_text("Usage: /prompt on|off")
+            return
+        await store.set_chat_prompt_history(chat_id, choice == "on")
+
+    await update.message.reply_text(describe_settings(await store.get_chat_settings(chat_id)))
+
+
+def describe_lock_status(lock_info: Dict) -> str:
+    """Summarize a chat lock and its holder for /status.
+
+    Args:
+        lock_info: Result of get_chat_lock_info()
+
+    Returns:
+        Human-readable lock state
+    """
+    if not lock_info['is_locked']:
+        return "unlocked"
+    if lock_info['holder_pid'] is None:
+        return "locked"
+
+    holder = f"PID {lock_info['holder_pid']} on {lock_info['holder_host']}"
+    if lock_info['expired']:
+        return f"lease expired (was {holder}), free to reclaim"
+    remaining = lock_info['lease_expires'] - time.time()
+    return f"locked by {holder} (lease {remaining:.0f}s left)"
+
+
+def describe_model_status() -> str:
+    """Summarize transcription model readiness for /status.
+
+    Returns:
+        Human-readable model state with warm-up timing when available
+    """
+    if _transcription_service is None:
+        return "not started"
+
+    status = _transcription_service.model_status
+    if status['state'] == 'ready':
+        return (f"ready (warm-up {status['warmup_seconds']:.1f}s, "
+                f"{status['workers']} worker(s))")
+    if status['state'] == 'failed':
+        return f"warm-up failed: {status['error']}"
+    if status['state'] == 'warming':
+        return "warming up"
+    return "loads on first voice message"
+
+
+def describe_cache_status() -> str:
+    """Summarize transcription cache hits and misses for /status.
+
+    Returns:
+        Human-readable hit/miss counters since startup
+    """
+    if _transcription_cache is None:
+        return "not started"
+
+    stats = _transcription_cache.stats()
+    return (f"{stats['hits']} hit(s), {stats['misses']} miss(es) "
+            f"({stats['hit_rate']:.0%} hit rate)")
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming text messages.
 
@@ -82,8 +219,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
 
     # Store in database
-    add_incoming_message(
-        DB_PATH,
+    store = get_async_store(DB_PATH)
+    await store.add_incoming_message(
         chat_id,
         user_id,
         username,
@@ -91,15 +228,36 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text
     )
 
-    # Trigger processing if unlocked
-    if not is_locked(DB_PATH):
-        trigger_processing()
+    # Wake the runner; it re-checks the queue and lock itself
+    trigger_processing()
+
+
+def write_voice_file(voice_path: str, audio: bytes) -> None:
+    """Write a downloaded voice file, replacing it in one step.
+
+    A crash mid-write leaves no truncated file for a resumed transcription
+    job to decode.
+
+    Args:
+        voice_path: Destination path
+        audio: Voice file contents
+    """
+    tmp_path = voice_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(audio)
+    os.replace(tmp_path, voice_path)
 
 
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming voice messages.
 
-    Downloads voice file, transcribes it, and stores both in database.
+    Downloads the voice file into memory and looks its content hash up in
+    the transcription cache. On a hit the message is stored with the cached
+    transcript right away; otherwise it is queued for the transcription
+    service, which decodes the downloaded bytes directly in the chat's
+    pinned language and with its prompt (see chat_settings), and the
+    transcript is filled in when the job ends. The archival copy on disk
+    is written while this happens rather than before it.
 
     Args:
         update: Telegram update
@@ -123,24 +281,26 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.effective_user.username
     message_id = update.message.message_id
 
-    # Download voice file
+    # Download voice file into memory
     voice_file = await update.message.voice.get_file()
+    audio = bytes(await voice_file.download_as_bytearray())
 
     # Ensure voice directory exists
     os.makedirs(VOICE_DIR, exist_ok=True)
 
+    # Archive to disk in parallel with hashing, storing and transcription
     voice_path = os.path.join(VOICE_DIR, f"voice_{message_id}.ogg")
-    await voice_file.download_to_drive(voice_path)
-
-    # Transcribe
-    result = transcribe_voice(voice_path)
-
-    if result['success']:
-        transcription = result['transcription']
-
-        # Store in database with transcription
-        add_incoming_message(
-            DB_PATH,
+    archived = asyncio.ensure_future(run_in_worker(write_voice_file, voice_path, audio))
+    try:
+        # Same audio seen before: skip decoding and inference entirely
+        audio_hash = await run_in_worker(hash_audio_bytes, audio)
+        store = get_async_store(DB_PATH)
+        # The chat's settings pick the cache entry and how a miss is transcribed
+        options = await transcription_options(store, chat_id)
+        transcription = await _transcription_cache.lookup(audio_hash, **options)
+
+        # Without a transcription the row stays hidden from the queue
+        row_id = await store.add_incoming_message(
             chat_id,
             user_id,
             username,
@@ -150,49 +310,176 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
             transcription
         )
 
-        # Trigger processing if unlocked
-        if not is_locked(DB_PATH):
+        if transcription is not None:
             trigger_processing()
+        else:
+            await _transcription_service.enqueue(row_id, voice_path, audio_hash, audio=audio,
+                                                 **options)
+    finally:
+        # The chat's next update runs only once the file is on disk
+        await archived
+
+
+async def transcription_finished(bot: Bot, job: Dict, result: TranscriptionResult):
+    """Act on a finished transcription job.
+
+    Triggers processing once the transcript is stored, or tells the user
+    the voice message could not be transcribed.
 
+    Args:
+        bot: Telegram bot used to report failures
+        job: Job details including chat_id
+        result: Outcome of the transcription
+    """
+    if result.success:
+        trigger_processing()
     else:
         # Transcription failed
-        await update.message.reply_text(
-            f"Sorry, I couldn't transcribe your voice message. Error: {result['error']}"
+        await bot.send_message(
+            chat_id=job['chat_id'],
+            text=f"Sorry, I couldn't transcribe your voice message. Error: {result.error}",
+            reply_to_message_id=job['message_id']
         )
 
 
+async def transcription_progressed(job: Dict):
+    """Let processing start on a long voice note's partial transcript.
+
+    The message is queued again once the final transcript replaces it.
+
+    Args:
+        job: Job details including chat_id
+    """
+    trigger_processing()
+
+
 def trigger_processing():
-    """Trigger telegram message processing via subprocess.
+    """Ask the processing runner to drain the message queue.
 
-    Spawns telegram-process.sh script in background.
+    Bursts of calls are coalesced by the dispatcher into one wake-up of
+    the long-lived telegram-process.sh runner.
     """
-    script_path = os.path.join(WORKSPACE_DIR, "scripts", "telegram-process.sh")
+    if _dispatcher is not None:
+        _dispatcher.trigger()
+
+
+async def startup(application: Application):
+    """Start the processing runner, outbound sender and transcription
+    service once the event loop is running.
 
-    subprocess.Popen(
-        [script_path],
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-        start_new_session=True
+    Args:
+        application: Telegram application being started
+    """
+    global _transcription_service, _transcription_cache, _dispatcher, _watcher, _sender
+
+    # send_message.py hands replies to this bot's pooled connections
+    _sender = OutboundSender(DB_PATH, application.bot)
+    await _sender.start()
+
+    # The bot owns the one processing runner; its queue watcher wakes the
+    # runner for messages queued by other processes too
+    _dispatcher = build_dispatcher(os.path.join(WORKSPACE_DIR, "scripts", "telegram-process.sh"))
+    _watcher = QueueWatcher(DB_PATH, _dispatcher, metrics_path=METRICS_PATH, pid_path=PID_PATH)
+    _dispatcher.on_wake = _watcher.on_wake
+    await _watcher.start()
+
+    # Resolve the Whisper configuration (may time profiles) off the loop
+    config = await run_in_worker(get_config)
+    _transcription_cache = TranscriptionCache(DB_PATH, config)
+    _transcription_service = TranscriptionService(
+        DB_PATH,
+        on_complete=functools.partial(transcription_finished, application.bot),
+        cache=_transcription_cache,
+        on_partial=transcription_progressed
     )
+    await _transcription_service.start()
 
+    # Warm up in the background so the bot answers immediately
+    if WHISPER_PRELOAD:
+        application.create_task(_transcription_service.warm_up())
+
+
+async def shutdown(application: Application):
+    """Release the runner and its watcher, sender, database threads and
+    workers when the bot stops.
+
+    Args:
+        application: Telegram application being shut down
+    """
+    if _sender is not None:
+        await _sender.stop()
+    if _transcription_service is not None:
+        await _transcription_service.stop()
+    if _watcher is not None:
+        await _watcher.stop()
+    shutdown_workers()
+    await close_async_stores()
 
-def main():
-    """Run the Telegram bot."""
-    # Initialize database
-    init_db(DB_PATH)
 
-    # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+def build_application(request: Optional[BaseRequest] = None) -> Application:
+    """Create the application with lifecycle hooks and handlers registered.
+
+    Up to CONCURRENT_UPDATES updates from different chats are handled at
+    once; each chat's updates are handled one at a time, in order.
+
+    Args:
+        request: Networking backend for Bot API calls (default: httpx)
+
+    Returns:
+        Application ready to run
+    """
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(startup)
+        .post_shutdown(shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    application = builder.build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("language", language_command))
+    application.add_handler(CommandHandler("prompt", prompt_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # Voice handling awaits the download; other chats carry on meanwhile,
+    # while later updates from the same chat wait so the queue stays in order
     application.add_handler(MessageHandler(filters.VOICE, handle_voice))
 
+    return application
+
+
+def webhook_url() -> str:
+    """Public URL Telegram posts updates to."""
+    return f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH.lstrip('/')}"
+
+
+def main():
+    """Run the Telegram bot."""
+    # Initialize database
+    init_db(DB_PATH)
+
+    application = build_application()
+
     # Run bot
     print(f"Bot starting... Database: {DB_PATH}")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        # Telegram pushes updates to an embedded HTTP server; no long poll
+        print(f"Webhook mode: {webhook_url()} -> {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=webhook_url(),
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+"""Per-chat transcription settings: a pinned language and prompt priming.
+
+Whisper detects the language of every voice note from its first 30
+seconds, which costs an extra decoder pass and sometimes guesses wrong on
+short notes. A chat that always speaks one language can pin it (/language)
+to skip detection. A chat can also have its voice notes primed with its
+own recent messages (/prompt), so names and domain terms already written
+there are spelled the same way in transcripts.
+
+Settings are read when a voice note is queued and stored on its
+transcription job, so retries transcribe it the same way.
+"""
+import os
+from typing import Dict, List, Optional
+
+from async_database import AsyncMessageStore
+
+
+# Recent messages a primed chat's prompt is built from
+PROMPT_MESSAGES = int(os.getenv("TRANSCRIPTION_PROMPT_MESSAGES", "5"))
+# Whisper reads at most 224 prompt tokens; a character budget keeps well
+# under that for most languages
+PROMPT_MAX_CHARS = int(os.getenv("TRANSCRIPTION_PROMPT_MAX_CHARS", "600"))
+
+AUTO_LANGUAGE = "auto"
+
+# Language codes Whisper models accept (as of faster-whisper 1.0; "yue"
+# needs a large-v3 model)
+LANGUAGES = frozenset("""
+    af am ar as az ba be bg bn bo br bs ca cs cy da de el en es et eu fa fi fo fr
+    gl gu ha haw he hi hr ht hu hy id is it ja jw ka kk km kn ko la lb ln lo lt lv
+    mg mi mk ml mn mr ms mt my ne nl nn no oc pa pl ps pt ro ru sa sd si sk sl sn
+    so sq sr su sv sw ta te tg th tk tl tr tt uk ur uz vi yi yo yue zh
+""".split())
+
+
+def parse_language(value: str) -> Optional[str]:
+    """Parse a /language argument.
+
+    Args:
+        value: Whisper language code, or "auto" to detect per message
+
+    Returns:
+        Normalized language code, or None for auto
+
+    Raises:
+        ValueError: If Whisper does not know the language
+    """
+    code = value.strip().lower()
+    if code == AUTO_LANGUAGE:
+        return None
+    if code not in LANGUAGES:
+        raise ValueError(f"Unknown language '{value}'")
+    return code
+
+
+def build_prompt(texts: List[str], max_chars: int = PROMPT_MAX_CHARS) -> Optional[str]:
+    """Join recent messages into an initial prompt.
+
+    Whisper weighs the end of a prompt most, so when the messages are too
+    long the oldest text is dropped, cutting at a word boundary.
+
+    Args:
+        texts: Messages, oldest first
+        max_chars: Longest prompt allowed
+
+    Returns:
+        Prompt text, or None if there is nothing to prime with
+    """
+    prompt = " ".join(" ".join(text.split()) for text in texts if text.strip())
+    if len(prompt) > max_chars:
+        cut = prompt[-max_chars:]
+        # Drop the word the cut went through, unless it fell between words
+        if prompt[-max_chars - 1] != " " and " " in cut:
+            cut = cut.split(" ", 1)[1]
+        prompt = cut.strip()
+    return prompt or None
+
+
+async def transcription_options(store: AsyncMessageStore, chat_id: int) -> Dict:
+    """Work out how a chat's next voice note is transcribed.
+
+    Args:
+        store: Store for the messages database
+        chat_id: Telegram chat ID
+
+    Returns:
+        Dictionary with language (None = detect) and initial_prompt (None
+        = no priming)
+    """
+    settings = await store.get_chat_settings(chat_id)
+    initial_prompt = None
+    if settings['prompt_history']:
+        initial_prompt = build_prompt(await store.get_recent_texts(chat_id, PROMPT_MESSAGES))
+    return {'language': settings['language'], 'initial_prompt': initial_prompt}
+
+
+def describe_settings(settings: Dict) -> str:
+    """Summarize a chat's transcription settings for /language and /prompt."""
+    language = settings['language'] or "detected per message"
+    prompt = "on" if settings['prompt_history'] else "off"
+    return f"Voice language: {language}\nPriming with recent messages: {prompt}"
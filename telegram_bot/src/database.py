@@ -1,27 +1,1141 @@
-"""SQLite database operations for message queue and processing lock."""
+"""SQLite database operations for message queue, processing lock and
+transcription jobs."""
+import json
+import os
+import socket
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 
 
+# Prepared statements kept per connection; the SQL below is written as
+# constant strings so every call hits the cache.
+STATEMENT_CACHE_SIZE = 64
+
+# Per-connection tuning. WAL lets the agent read while the bot writes, so
+# NORMAL sync is durable enough and writers wait instead of failing.
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Processing lock holders must renew within this many seconds, or anyone
+# may take the lock over (crashed holders are reclaimed automatically)
+LOCK_LEASE_SECONDS = float(os.getenv("PROCESSING_LOCK_LEASE_SECONDS", "60"))
+
+# Claimed messages return to the queue if not acked within this many
+# seconds; after MAX_DELIVERY_ATTEMPTS claims they are dead-lettered
+VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT_SECONDS", "900"))
+MAX_DELIVERY_ATTEMPTS = int(os.getenv("QUEUE_MAX_DELIVERY_ATTEMPTS", "3"))
+
+# An outbox row a process outside the bot stores as already being sent
+# (send_message.py) goes back to the outbox if still sending this much later
+OUTBOX_CLAIM_LEASE_SECONDS = 120.0
+
+# Chats processed concurrently, each under its own leased chat lock
+MAX_PARALLEL_CHATS = int(os.getenv("PROCESSING_MAX_PARALLEL_CHATS", "3"))
+
+_INSERT_INCOMING_SQL = """
+    INSERT INTO messages (
+        chat_id, user_id, username, message_id, text,
+        voice_file_path, voice_transcription, direction, processed
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, 'incoming', 0)
+"""
+
+# Logs a message that has already been sent
+_INSERT_OUTGOING_SQL = """
+    INSERT INTO messages (chat_id, text, direction, delivery_status)
+    VALUES (?, ?, 'outgoing', 'delivered')
+"""
+
+# Outbox: replies are stored before they are sent. delivery_status moves
+# pending -> sending -> delivered, or back to pending with next_attempt_at
+# for a retry, or to failed. Only pending rows have next_attempt_at. A row
+# inserted as 'sending' is already being sent by its writer, under a lease
+# in claim_expires; rows the bot sends have none. Queries repeat the outbox
+# index's WHERE term so SQLite uses it.
+_INSERT_OUTBOX_SQL = """
+    INSERT INTO messages (chat_id, text, direction, delivery_status, attempts,
+                          next_attempt_at, claim_expires)
+    VALUES (?, ?, 'outgoing', ?, ?, ?, ?)
+"""
+
+# Due messages that are first in their chat's outbox, so each chat's
+# replies go out one at a time and in order, even across retries. No ORDER
+# BY: at most one row per chat qualifies, and sorting by id would make
+# SQLite scan the whole table instead of the outbox index.
+_CLAIM_DELIVERIES_SQL = """
+    UPDATE messages
+    SET delivery_status = 'sending', attempts = attempts + 1, next_attempt_at = NULL,
+        claim_expires = NULL
+    WHERE id IN (
+        SELECT id FROM messages AS m
+        WHERE delivery_status IN ('pending', 'sending') AND next_attempt_at <= ?
+          AND NOT EXISTS (
+              SELECT 1 FROM messages AS e
+              WHERE e.delivery_status IN ('pending', 'sending')
+                AND e.chat_id = m.chat_id AND e.id < m.id
+          )
+        LIMIT ?
+    )
+    RETURNING id, chat_id, text, attempts
+"""
+
+# Messages queued behind a chat's message being sent, for coalescing
+_SELECT_FOLLOWING_DELIVERIES_SQL = """
+    SELECT id, text
+    FROM messages
+    WHERE delivery_status IN ('pending', 'sending') AND next_attempt_at <= ?
+      AND chat_id = ? AND id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+_CLAIM_DELIVERY_IDS_SQL = """
+    UPDATE messages
+    SET delivery_status = 'sending', attempts = attempts + 1, next_attempt_at = NULL,
+        claim_expires = NULL
+    WHERE id IN (SELECT value FROM json_each(?)) AND delivery_status = 'pending'
+    RETURNING id, chat_id, text, attempts
+"""
+
+_COMPLETE_DELIVERY_SQL = """
+    UPDATE messages
+    SET delivery_status = 'delivered', telegram_message_id = ?,
+        next_attempt_at = NULL, last_error = NULL
+    WHERE id = ? AND delivery_status = 'sending'
+"""
+
+_RETRY_DELIVERY_SQL = """
+    UPDATE messages
+    SET delivery_status = 'pending', next_attempt_at = ?, last_error = ?
+    WHERE id = ? AND delivery_status = 'sending'
+"""
+
+_FAIL_DELIVERY_SQL = """
+    UPDATE messages
+    SET delivery_status = 'failed', next_attempt_at = NULL, last_error = ?
+    WHERE id = ? AND delivery_status = 'sending'
+"""
+
+_SELECT_DELIVERY_SQL = """
+    SELECT id, chat_id, text, delivery_status, attempts, last_error,
+           telegram_message_id, next_attempt_at
+    FROM messages
+    WHERE id = ? AND direction = 'outgoing'
+"""
+
+_NEXT_DELIVERY_SQL = """
+    SELECT MIN(next_attempt_at) FROM messages WHERE delivery_status IN ('pending', 'sending')
+"""
+
+_COUNT_PENDING_DELIVERIES_SQL = """
+    SELECT COUNT(*) FROM messages WHERE delivery_status IN ('pending', 'sending')
+"""
+
+# Unleased rows count as expired when the second parameter is 0 (at bot
+# start) and never when it is infinite
+_REQUEUE_DELIVERIES_SQL = """
+    UPDATE messages
+    SET delivery_status = 'pending', next_attempt_at = ?, claim_expires = NULL
+    WHERE delivery_status = 'sending' AND COALESCE(claim_expires, ?) < ?
+"""
+
+_SELECT_UNPROCESSED_SQL = """
+    SELECT id, chat_id, user_id, username, message_id, text,
+           voice_file_path, voice_transcription, transcription_partial, created_at
+    FROM messages
+    WHERE direction = 'incoming' AND processed = 0
+      AND (voice_file_path IS NULL OR voice_transcription IS NOT NULL)
+      AND (claim_expires IS NULL OR claim_expires < ?)
+      AND (? IS NULL OR chat_id = ?)
+    ORDER BY created_at ASC, id ASC
+"""
+
+# Messages whose claim expired too often leave the queue with an error
+_DEAD_LETTER_SQL = """
+    UPDATE messages
+    SET processed = 1, claimed_by = NULL, claim_expires = NULL,
+        last_error = 'visibility timeout expired after ' || attempts || ' claim(s)'
+    WHERE direction = 'incoming' AND processed = 0
+      AND claim_expires < ? AND attempts >= ?
+"""
+
+# Oldest visible messages, skipping chats with a message still in flight so
+# each chat is handled in order by one consumer at a time
+_CLAIM_BATCH_SQL = """
+    UPDATE messages
+    SET claimed_by = ?, claim_expires = ?, attempts = attempts + 1
+    WHERE id IN (
+        SELECT id FROM messages
+        WHERE direction = 'incoming' AND processed = 0
+          AND (voice_file_path IS NULL OR voice_transcription IS NOT NULL)
+          AND (claim_expires IS NULL OR claim_expires < ?)
+          AND (? IS NULL OR chat_id = ?)
+          AND chat_id NOT IN (
+              SELECT chat_id FROM messages
+              WHERE direction = 'incoming' AND processed = 0 AND claim_expires >= ?
+          )
+        ORDER BY created_at ASC, id ASC
+        LIMIT ?
+    )
+    RETURNING id, chat_id, user_id, username, message_id, text,
+              voice_file_path, voice_transcription, transcription_partial, created_at,
+              attempts
+"""
+
+_ACK_SQL = """
+    UPDATE messages
+    SET processed = 1, claimed_by = NULL, claim_expires = NULL, last_error = NULL
+    WHERE id IN (SELECT value FROM json_each(?)) AND claimed_by = ? AND processed = 0
+"""
+
+_NACK_SQL = """
+    UPDATE messages
+    SET claimed_by = NULL, claim_expires = NULL, last_error = ?,
+        processed = CASE WHEN attempts >= ? THEN 1 ELSE 0 END
+    WHERE id IN (SELECT value FROM json_each(?)) AND claimed_by = ? AND processed = 0
+"""
+
+_COUNT_UNPROCESSED_SQL = """
+    SELECT COUNT(*)
+    FROM messages
+    WHERE direction = 'incoming' AND processed = 0
+      AND (voice_file_path IS NULL OR voice_transcription IS NOT NULL)
+      AND (claim_expires IS NULL OR claim_expires < ?)
+"""
+
+# Ids are passed as one JSON array so the statement text never changes
+_MARK_PROCESSED_SQL = """
+    UPDATE messages
+    SET processed = 1
+    WHERE id IN (SELECT value FROM json_each(?))
+"""
+
+_SELECT_LOCK_SQL = """
+    SELECT is_locked, locked_at, holder_pid, holder_host, lease_expires
+    FROM processing_lock WHERE id = 1
+"""
+
+# Compare-and-set: succeeds only if the lock is free or its lease ran out
+_ACQUIRE_LOCK_SQL = """
+    UPDATE processing_lock
+    SET is_locked = 1, locked_at = ?, holder_pid = ?, holder_host = ?, lease_expires = ?
+    WHERE id = 1 AND (is_locked = 0 OR lease_expires < ?)
+"""
+
+_RENEW_LOCK_SQL = """
+    UPDATE processing_lock
+    SET lease_expires = ?
+    WHERE id = 1 AND is_locked = 1 AND holder_pid = ? AND holder_host = ?
+"""
+
+_RELEASE_LOCK_SQL = """
+    UPDATE processing_lock
+    SET is_locked = 0, locked_at = NULL, holder_pid = NULL, holder_host = NULL,
+        lease_expires = NULL
+    WHERE id = 1
+"""
+
+_RELEASE_HELD_LOCK_SQL = _RELEASE_LOCK_SQL + " AND holder_pid = ? AND holder_host = ?"
+
+# Chats with ready messages and no live chat lock, oldest message first
+_SELECT_READY_CHATS_SQL = """
+    SELECT chat_id
+    FROM messages
+    WHERE direction = 'incoming' AND processed = 0
+      AND (voice_file_path IS NULL OR voice_transcription IS NOT NULL)
+      AND chat_id NOT IN (SELECT chat_id FROM chat_locks WHERE lease_expires >= ?)
+    GROUP BY chat_id
+    ORDER BY MIN(created_at) ASC, MIN(id) ASC
+"""
+
+# Compare-and-set on one chat's lock row, also checking the number of other
+# chats held under a live lease; SQLite runs it under the write lock, so two
+# acquirers can never both take the last slot
+_ACQUIRE_CHAT_LOCK_SQL = """
+    INSERT INTO chat_locks (chat_id, locked_at, holder_pid, holder_host, lease_expires)
+    SELECT ?, ?, ?, ?, ?
+    WHERE (SELECT COUNT(*) FROM chat_locks WHERE chat_id != ? AND lease_expires >= ?) < ?
+    ON CONFLICT (chat_id) DO UPDATE
+    SET locked_at = excluded.locked_at, holder_pid = excluded.holder_pid,
+        holder_host = excluded.holder_host, lease_expires = excluded.lease_expires
+    WHERE chat_locks.lease_expires < ?
+"""
+
+_RENEW_CHAT_LOCK_SQL = """
+    UPDATE chat_locks
+    SET lease_expires = ?
+    WHERE chat_id = ? AND holder_pid = ? AND holder_host = ?
+"""
+
+_RELEASE_CHAT_LOCK_SQL = "DELETE FROM chat_locks WHERE chat_id = ?"
+
+_RELEASE_HELD_CHAT_LOCK_SQL = _RELEASE_CHAT_LOCK_SQL + " AND holder_pid = ? AND holder_host = ?"
+
+_SELECT_CHAT_LOCK_SQL = """
+    SELECT chat_id, locked_at, holder_pid, holder_host, lease_expires
+    FROM chat_locks WHERE chat_id = ?
+"""
+
+_SELECT_LIVE_CHAT_LOCKS_SQL = """
+    SELECT chat_id, locked_at, holder_pid, holder_host, lease_expires
+    FROM chat_locks WHERE lease_expires >= ?
+    ORDER BY locked_at ASC
+"""
+
+_INSERT_JOB_SQL = """
+    INSERT INTO transcription_jobs (message_row_id, voice_file_path, audio_hash, config_key,
+                                    language, initial_prompt)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+_CLAIM_JOBS_SQL = """
+    UPDATE transcription_jobs
+    SET status = 'running', attempts = attempts + 1, started_at = ?
+    WHERE id IN (
+        SELECT id FROM transcription_jobs
+        WHERE status = 'pending'
+        ORDER BY id
+        LIMIT ?
+    )
+    RETURNING id, message_row_id, voice_file_path, attempts, language, initial_prompt,
+              (SELECT chat_id FROM messages WHERE messages.id = message_row_id)
+"""
+
+_COUNT_PENDING_JOBS_SQL = "SELECT COUNT(*) FROM transcription_jobs WHERE status = 'pending'"
+
+_SELECT_JOB_SQL = """
+    SELECT j.id, j.message_row_id, j.voice_file_path, j.status, j.attempts,
+           j.error, j.audio_hash, m.chat_id, m.message_id
+    FROM transcription_jobs j
+    JOIN messages m ON m.id = j.message_row_id
+    WHERE j.id = ?
+"""
+
+_FINISH_JOB_SQL = """
+    UPDATE transcription_jobs
+    SET status = ?, error = ?, finished_at = ?
+    WHERE id = ?
+"""
+
+# A final transcript replaces any partial one; if the partial was already
+# processed the message is queued again so the full text is seen
+_SET_TRANSCRIPTION_SQL = """
+    UPDATE messages
+    SET voice_transcription = ?, transcription_stats = ?,
+        processed = CASE WHEN transcription_partial = 1 THEN 0 ELSE processed END,
+        transcription_partial = 0
+    WHERE id = (SELECT message_row_id FROM transcription_jobs WHERE id = ?)
+"""
+
+_SET_PARTIAL_TRANSCRIPTION_SQL = """
+    UPDATE messages
+    SET voice_transcription = ?, transcription_partial = 1
+    WHERE id = (SELECT message_row_id FROM transcription_jobs WHERE id = ? AND status = 'running')
+"""
+
+# A voice note that cannot be transcribed leaves the queue
+_DROP_JOB_MESSAGE_SQL = """
+    UPDATE messages
+    SET processed = 1
+    WHERE id = (SELECT message_row_id FROM transcription_jobs WHERE id = ?)
+"""
+
+# Finished jobs that know their audio hash seed the transcription cache
+_CACHE_JOB_RESULT_SQL = """
+    INSERT INTO transcription_cache (audio_hash, config_key, transcription,
+                                     created_at, last_used_at)
+    SELECT audio_hash, config_key, ?, ?, ?
+    FROM transcription_jobs
+    WHERE id = ? AND audio_hash IS NOT NULL AND config_key IS NOT NULL
+    ON CONFLICT (audio_hash, config_key) DO UPDATE
+    SET transcription = excluded.transcription, last_used_at = excluded.last_used_at
+"""
+
+_CACHE_LOOKUP_SQL = """
+    UPDATE transcription_cache
+    SET hits = hits + 1, last_used_at = ?
+    WHERE audio_hash = ? AND config_key = ?
+    RETURNING transcription
+"""
+
+_CACHE_PUT_SQL = """
+    INSERT INTO transcription_cache (audio_hash, config_key, transcription,
+                                     created_at, last_used_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (audio_hash, config_key) DO UPDATE
+    SET transcription = excluded.transcription, last_used_at = excluded.last_used_at
+"""
+
+_CACHE_EVICT_AGE_SQL = "DELETE FROM transcription_cache WHERE last_used_at < ?"
+
+_CACHE_EVICT_SIZE_SQL = """
+    DELETE FROM transcription_cache
+    WHERE rowid IN (
+        SELECT rowid FROM transcription_cache
+        ORDER BY last_used_at DESC
+        LIMIT -1 OFFSET ?
+    )
+"""
+
+_SELECT_CHAT_SETTINGS_SQL = """
+    SELECT language, prompt_history FROM chat_settings WHERE chat_id = ?
+"""
+
+_SET_CHAT_LANGUAGE_SQL = """
+    INSERT INTO chat_settings (chat_id, language, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT (chat_id) DO UPDATE
+    SET language = excluded.language, updated_at = excluded.updated_at
+"""
+
+_SET_CHAT_PROMPT_HISTORY_SQL = """
+    INSERT INTO chat_settings (chat_id, prompt_history, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT (chat_id) DO UPDATE
+    SET prompt_history = excluded.prompt_history, updated_at = excluded.updated_at
+"""
+
+# Latest texts and final transcripts of a chat, in either direction
+_SELECT_RECENT_TEXTS_SQL = """
+    SELECT COALESCE(text, voice_transcription)
+    FROM messages
+    WHERE chat_id = ? AND COALESCE(text, voice_transcription) IS NOT NULL
+      AND transcription_partial = 0
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+_REQUEUE_JOBS_SQL = """
+    UPDATE transcription_jobs
+    SET status = 'pending', started_at = NULL
+    WHERE status = 'running'
+"""
+
+
 def get_db_connection(db_path: str) -> sqlite3.Connection:
     """Get SQLite database connection.
 
+    Returns a new connection owned by the caller. Queue operations use the
+    long-lived connections held by MessageStore instead.
+
     Args:
         db_path: Path to SQLite database file
 
     Returns:
         Database connection
     """
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
     return conn
 
 
+class MessageStore:
+    """Long-lived connections to one messages database.
+
+    Each thread gets its own connection, opened on first use and reused for
+    every later call, so a burst of messages does not pay connect/close and
+    schema reads per operation. Connections are reopened after a fork.
+    """
+
+    def __init__(self, db_path: str):
+        """Create a store for a database file.
+
+        Args:
+            db_path: Path to SQLite database file
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._notify_path = notify_socket_path(db_path)
+        self._notify_socket: Optional[socket.socket] = None
+        self._notify_lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection for the calling thread, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = get_db_connection(self.db_path)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Close every connection opened by this store in this process."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Connection belongs to another thread; it dies with it
+                pass
+        self._local = threading.local()
+        with self._notify_lock:
+            if self._notify_socket is not None:
+                self._notify_socket.close()
+                self._notify_socket = None
+
+    def add_incoming_message(
+        self,
+        chat_id: int,
+        user_id: int,
+        username: str,
+        message_id: int,
+        text: Optional[str] = None,
+        voice_file_path: Optional[str] = None,
+        voice_transcription: Optional[str] = None
+    ) -> int:
+        """Insert an incoming message and return its row ID."""
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_INSERT_INCOMING_SQL, (
+                chat_id, user_id, username, message_id, text,
+                voice_file_path, voice_transcription
+            ))
+        # Voice notes join the queue once transcribed
+        if voice_file_path is None or voice_transcription is not None:
+            self._notify_queued()
+        return cursor.lastrowid
+
+    def add_outgoing_message(self, chat_id: int, text: str) -> int:
+        """Insert an outgoing message that was already sent and return its row ID."""
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_INSERT_OUTGOING_SQL, (chat_id, text))
+        return cursor.lastrowid
+
+    def enqueue_outgoing_message(self, chat_id: int, text: str, claim: bool = False) -> int:
+        """Store a message to send and return its row ID.
+
+        With claim, the row is stored as already being sent by the caller,
+        which must then complete, retry or fail it within
+        OUTBOX_CLAIM_LEASE_SECONDS; after that the bot sends it instead.
+        """
+        now = time.time()
+        if claim:
+            status, attempts, due, lease = 'sending', 1, None, now + OUTBOX_CLAIM_LEASE_SECONDS
+        else:
+            status, attempts, due, lease = 'pending', 0, now, None
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_INSERT_OUTBOX_SQL,
+                                  (chat_id, text, status, attempts, due, lease))
+        return cursor.lastrowid
+
+    def claim_deliveries(self, limit: int) -> List[Dict]:
+        """Move up to limit due outbox messages to sending and return them.
+
+        At most one message per chat is returned, the chat's oldest
+        undelivered one, and only if no earlier one is still being sent.
+        """
+        conn = self.connection
+        with conn:
+            rows = conn.execute(_CLAIM_DELIVERIES_SQL, (time.time(), limit)).fetchall()
+        return sorted(
+            ({'id': row[0], 'chat_id': row[1], 'text': row[2], 'attempts': row[3]}
+             for row in rows),
+            key=lambda delivery: delivery['id']
+        )
+
+    def get_following_deliveries(self, chat_id: int, after_id: int, limit: int) -> List[Dict]:
+        """Return due outbox messages of a chat queued after a given one."""
+        rows = self.connection.execute(
+            _SELECT_FOLLOWING_DELIVERIES_SQL, (time.time(), chat_id, after_id, limit)
+        ).fetchall()
+        return [{'id': row[0], 'text': row[1]} for row in rows]
+
+    def claim_delivery_ids(self, row_ids: List[int]) -> List[Dict]:
+        """Move the given pending outbox messages to sending and return them."""
+        if not row_ids:
+            return []
+        conn = self.connection
+        with conn:
+            rows = conn.execute(_CLAIM_DELIVERY_IDS_SQL, (_json_ids(row_ids),)).fetchall()
+        return sorted(
+            ({'id': row[0], 'chat_id': row[1], 'text': row[2], 'attempts': row[3]}
+             for row in rows),
+            key=lambda delivery: delivery['id']
+        )
+
+    def complete_delivery(self, row_id: int, telegram_message_id: Optional[int]) -> None:
+        """Mark a message being sent as delivered."""
+        conn = self.connection
+        with conn:
+            conn.execute(_COMPLETE_DELIVERY_SQL, (telegram_message_id, row_id))
+
+    def retry_delivery(self, row_id: int, error: str, delay: float) -> None:
+        """Return a message being sent to the outbox, due in delay seconds."""
+        conn = self.connection
+        with conn:
+            conn.execute(_RETRY_DELIVERY_SQL, (time.time() + delay, error, row_id))
+
+    def fail_delivery(self, row_id: int, error: str) -> None:
+        """Give up on a message being sent."""
+        conn = self.connection
+        with conn:
+            conn.execute(_FAIL_DELIVERY_SQL, (error, row_id))
+
+    def get_delivery(self, row_id: int) -> Optional[Dict]:
+        """Return an outgoing message's delivery state."""
+        row = self.connection.execute(_SELECT_DELIVERY_SQL, (row_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'chat_id': row[1],
+            'text': row[2],
+            'delivery_status': row[3],
+            'attempts': row[4],
+            'error': row[5],
+            'telegram_message_id': row[6],
+            'next_attempt_at': row[7]
+        }
+
+    def next_delivery_at(self) -> Optional[float]:
+        """Return when the earliest pending outbox message is due, if any."""
+        return self.connection.execute(_NEXT_DELIVERY_SQL).fetchone()[0]
+
+    def count_pending_deliveries(self) -> int:
+        """Return the number of outbox messages not yet delivered or failed."""
+        return self.connection.execute(_COUNT_PENDING_DELIVERIES_SQL).fetchone()[0]
+
+    def requeue_deliveries(self, unleased: bool = True) -> int:
+        """Return messages left sending by a crashed process to the outbox.
+
+        Messages stored as being sent by another process come back once
+        their lease runs out. Messages the bot was sending have no lease;
+        with unleased (only right as the bot starts) they come back too.
+        """
+        now = time.time()
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_REQUEUE_DELIVERIES_SQL,
+                                  (now, 0 if unleased else float('inf'), now))
+        return cursor.rowcount
+
+    def get_unprocessed_messages(self, chat_id: Optional[int] = None) -> List[Dict]:
+        """Return unprocessed incoming messages ordered by created_at.
+
+        Messages claimed by a consumer are left out until their claim
+        expires. With chat_id, only that chat's messages are returned.
+        """
+        rows = self.connection.execute(
+            _SELECT_UNPROCESSED_SQL, (time.time(), chat_id, chat_id)
+        ).fetchall()
+        return [_message_from_row(row) for row in rows]
+
+    def claim_batch(
+        self,
+        limit: int,
+        worker_id: str,
+        visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS,
+        max_attempts: int = MAX_DELIVERY_ATTEMPTS,
+        chat_id: Optional[int] = None
+    ) -> List[Dict]:
+        """Claim up to limit ready messages for worker_id.
+
+        Claimed messages are invisible to other consumers until acked,
+        nacked or visibility_timeout seconds pass. Messages whose claim has
+        expired max_attempts times are dead-lettered first. With chat_id,
+        only that chat's messages are claimed.
+        """
+        now = time.time()
+        conn = self.connection
+        with conn:
+            conn.execute(_DEAD_LETTER_SQL, (now, max_attempts))
+            rows = conn.execute(
+                _CLAIM_BATCH_SQL,
+                (worker_id, now + visibility_timeout, now, chat_id, chat_id, now, limit)
+            ).fetchall()
+        messages = []
+        for row in rows:
+            message = _message_from_row(row)
+            message['attempts'] = row[10]
+            messages.append(message)
+        messages.sort(key=lambda m: (m['created_at'], m['id']))
+        return messages
+
+    def ack(self, message_ids: List[int], worker_id: str) -> int:
+        """Mark claimed messages processed; returns how many were still held."""
+        if not message_ids:
+            return 0
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_ACK_SQL, (_json_ids(message_ids), worker_id))
+        return cursor.rowcount
+
+    def nack(
+        self,
+        message_ids: List[int],
+        worker_id: str,
+        error: Optional[str] = None,
+        max_attempts: int = MAX_DELIVERY_ATTEMPTS
+    ) -> int:
+        """Return claimed messages to the queue right away.
+
+        Messages that have used max_attempts deliveries are dead-lettered
+        (marked processed with last_error) instead. Returns how many were
+        still held.
+        """
+        if not message_ids:
+            return 0
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(
+                _NACK_SQL, (error, max_attempts, _json_ids(message_ids), worker_id)
+            )
+        return cursor.rowcount
+
+    def count_unprocessed(self) -> int:
+        """Return the number of messages ready for processing (not claimed)."""
+        return self.connection.execute(_COUNT_UNPROCESSED_SQL, (time.time(),)).fetchone()[0]
+
+    def _notify_queued(self) -> None:
+        """Tell a listening queue watcher that messages are ready.
+
+        Sends one datagram carrying the current time to the database's
+        notification socket; silently does nothing if no watcher listens.
+        The socket is shared by all threads, so it is created, used and
+        closed under one lock.
+        """
+        with self._notify_lock:
+            if self._notify_socket is None:
+                self._notify_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._notify_socket.setblocking(False)
+            try:
+                self._notify_socket.sendto(repr(time.time()).encode(), self._notify_path)
+            except OSError:
+                pass
+
+    def mark_messages_processed(self, message_ids: List[int]) -> None:
+        """Mark the given message rows as processed."""
+        if not message_ids:
+            return
+
+        conn = self.connection
+        with conn:
+            conn.execute(_MARK_PROCESSED_SQL, (_json_ids(message_ids),))
+
+    def acquire_lock(
+        self,
+        holder_pid: Optional[int] = None,
+        holder_host: Optional[str] = None,
+        lease_seconds: float = LOCK_LEASE_SECONDS
+    ) -> bool:
+        """Take the processing lock; False if another holder's lease is live.
+
+        Holder defaults to this process on this host.
+        """
+        holder_pid, holder_host = _lock_holder(holder_pid, holder_host)
+        now = time.time()
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_ACQUIRE_LOCK_SQL, (
+                datetime.utcnow().isoformat(), holder_pid, holder_host,
+                now + lease_seconds, now
+            ))
+        return cursor.rowcount == 1
+
+    def renew_lock(
+        self,
+        holder_pid: Optional[int] = None,
+        holder_host: Optional[str] = None,
+        lease_seconds: float = LOCK_LEASE_SECONDS
+    ) -> bool:
+        """Extend the holder's lease; False if it no longer holds the lock."""
+        holder_pid, holder_host = _lock_holder(holder_pid, holder_host)
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(
+                _RENEW_LOCK_SQL, (time.time() + lease_seconds, holder_pid, holder_host)
+            )
+        return cursor.rowcount == 1
+
+    def release_lock(self, holder_pid: Optional[int] = None,
+                     holder_host: Optional[str] = None) -> None:
+        """Release the processing lock.
+
+        With a holder given, only that holder's lock is released.
+        """
+        conn = self.connection
+        with conn:
+            if holder_pid is None:
+                conn.execute(_RELEASE_LOCK_SQL)
+            else:
+                conn.execute(_RELEASE_HELD_LOCK_SQL, _lock_holder(holder_pid, holder_host))
+
+    def is_locked(self) -> bool:
+        """Return True if the processing lock is held under a live lease."""
+        info = self.get_lock_info()
+        return info['is_locked'] and not info['expired']
+
+    def get_lock_info(self) -> Dict:
+        """Return the lock state, holder and lease expiry (epoch seconds)."""
+        row = self.connection.execute(_SELECT_LOCK_SQL).fetchone()
+        is_locked, locked_at, holder_pid, holder_host, lease_expires = row
+        return {
+            'is_locked': bool(is_locked),
+            'locked_at': locked_at,
+            'holder_pid': holder_pid,
+            'holder_host': holder_host,
+            'lease_expires': lease_expires,
+            # Locks taken before leases existed never expire on their own
+            'expired': bool(is_locked) and lease_expires is not None
+                       and lease_expires < time.time()
+        }
+
+    def get_ready_chats(self) -> List[int]:
+        """Return chats with ready messages and no live chat lock.
+
+        Ordered by each chat's oldest waiting message.
+        """
+        rows = self.connection.execute(_SELECT_READY_CHATS_SQL, (time.time(),)).fetchall()
+        return [row[0] for row in rows]
+
+    def acquire_chat_lock(
+        self,
+        chat_id: int,
+        holder_pid: Optional[int] = None,
+        holder_host: Optional[str] = None,
+        lease_seconds: float = LOCK_LEASE_SECONDS,
+        max_parallel: int = MAX_PARALLEL_CHATS
+    ) -> bool:
+        """Take one chat's processing lock.
+
+        Fails if another holder's lease on the chat is live, or if
+        max_parallel other chats are already being processed. Holder
+        defaults to this process on this host.
+        """
+        holder_pid, holder_host = _lock_holder(holder_pid, holder_host)
+        now = time.time()
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_ACQUIRE_CHAT_LOCK_SQL, (
+                chat_id, datetime.utcnow().isoformat(), holder_pid, holder_host,
+                now + lease_seconds, chat_id, now, max_parallel, now
+            ))
+        return cursor.rowcount == 1
+
+    def renew_chat_lock(
+        self,
+        chat_id: int,
+        holder_pid: Optional[int] = None,
+        holder_host: Optional[str] = None,
+        lease_seconds: float = LOCK_LEASE_SECONDS
+    ) -> bool:
+        """Extend a chat lock's lease; False if the holder lost it."""
+        holder_pid, holder_host = _lock_holder(holder_pid, holder_host)
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_RENEW_CHAT_LOCK_SQL, (
+                time.time() + lease_seconds, chat_id, holder_pid, holder_host
+            ))
+        return cursor.rowcount == 1
+
+    def release_chat_lock(self, chat_id: int, holder_pid: Optional[int] = None,
+                          holder_host: Optional[str] = None) -> None:
+        """Release a chat lock.
+
+        With a holder given, only that holder's lock is released.
+        """
+        conn = self.connection
+        with conn:
+            if holder_pid is None:
+                conn.execute(_RELEASE_CHAT_LOCK_SQL, (chat_id,))
+            else:
+                conn.execute(_RELEASE_HELD_CHAT_LOCK_SQL,
+                             (chat_id,) + _lock_holder(holder_pid, holder_host))
+
+    def get_chat_lock_info(self, chat_id: int) -> Dict:
+        """Return one chat's lock in the same shape as get_lock_info()."""
+        row = self.connection.execute(_SELECT_CHAT_LOCK_SQL, (chat_id,)).fetchone()
+        if row is None:
+            return _chat_lock_from_row((chat_id, None, None, None, None))
+        return _chat_lock_from_row(row)
+
+    def get_chat_locks(self) -> List[Dict]:
+        """Return the chat locks currently held under a live lease."""
+        rows = self.connection.execute(_SELECT_LIVE_CHAT_LOCKS_SQL, (time.time(),)).fetchall()
+        return [_chat_lock_from_row(row) for row in rows]
+
+    def enqueue_transcription_job(
+        self,
+        message_row_id: int,
+        voice_file_path: str,
+        audio_hash: Optional[str] = None,
+        config_key: Optional[str] = None,
+        language: Optional[str] = None,
+        initial_prompt: Optional[str] = None
+    ) -> int:
+        """Queue a voice file for transcription and return the job ID.
+
+        When audio_hash and config_key are given, the finished transcript
+        is also stored in the transcription cache. language and
+        initial_prompt are passed to the model on every attempt.
+        """
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(
+                _INSERT_JOB_SQL, (message_row_id, voice_file_path, audio_hash, config_key,
+                                  language, initial_prompt)
+            )
+        return cursor.lastrowid
+
+    def claim_transcription_jobs(self, limit: int) -> List[Dict]:
+        """Move up to limit pending jobs to running and return them."""
+        now = datetime.utcnow().isoformat()
+        conn = self.connection
+        with conn:
+            rows = conn.execute(_CLAIM_JOBS_SQL, (now, limit)).fetchall()
+        return sorted(
+            (
+                {
+                    'id': row[0],
+                    'message_row_id': row[1],
+                    'voice_file_path': row[2],
+                    'attempts': row[3],
+                    'language': row[4],
+                    'initial_prompt': row[5],
+                    'chat_id': row[6]
+                }
+                for row in rows
+            ),
+            key=lambda job: job['id']
+        )
+
+    def count_pending_transcription_jobs(self) -> int:
+        """Return the number of jobs waiting for a worker."""
+        return self.connection.execute(_COUNT_PENDING_JOBS_SQL).fetchone()[0]
+
+    def get_transcription_job(self, job_id: int) -> Optional[Dict]:
+        """Return a job joined with its message's chat details."""
+        row = self.connection.execute(_SELECT_JOB_SQL, (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'message_row_id': row[1],
+            'voice_file_path': row[2],
+            'status': row[3],
+            'attempts': row[4],
+            'error': row[5],
+            'audio_hash': row[6],
+            'chat_id': row[7],
+            'message_id': row[8]
+        }
+
+    def set_partial_transcription(self, job_id: int, transcription: str) -> None:
+        """Store the transcript decoded so far, making the message visible."""
+        conn = self.connection
+        with conn:
+            conn.execute(_SET_PARTIAL_TRANSCRIPTION_SQL, (transcription, job_id))
+        self._notify_queued()
+
+    def complete_transcription_job(self, job_id: int, transcription: str,
+                                   stats: Optional[Dict] = None) -> None:
+        """Mark a job done and write the transcript (and its telemetry) to
+        its message."""
+        now = datetime.utcnow().isoformat()
+        stats_json = json.dumps(stats) if stats is not None else None
+        conn = self.connection
+        with conn:
+            conn.execute(_SET_TRANSCRIPTION_SQL, (transcription, stats_json, job_id))
+            conn.execute(_FINISH_JOB_SQL, ('done', None, now, job_id))
+            conn.execute(_CACHE_JOB_RESULT_SQL, (transcription, now, now, job_id))
+        self._notify_queued()
+
+    def fail_transcription_job(self, job_id: int, error: str, max_attempts: int) -> bool:
+        """Record a failed attempt.
+
+        The job goes back to pending until it has run max_attempts times,
+        after which it is marked failed and its message leaves the queue.
+
+        Returns:
+            True if the job failed for good, False if it will be retried
+        """
+        now = datetime.utcnow().isoformat()
+        conn = self.connection
+        with conn:
+            attempts = conn.execute(
+                "SELECT attempts FROM transcription_jobs WHERE id = ?", (job_id,)
+            ).fetchone()[0]
+            if attempts < max_attempts:
+                conn.execute(_FINISH_JOB_SQL, ('pending', error, None, job_id))
+                return False
+            conn.execute(_FINISH_JOB_SQL, ('failed', error, now, job_id))
+            conn.execute(_DROP_JOB_MESSAGE_SQL, (job_id,))
+        return True
+
+    def get_cached_transcription(self, audio_hash: str, config_key: str) -> Optional[str]:
+        """Return a cached transcript and count the hit, or None."""
+        now = datetime.utcnow().isoformat()
+        conn = self.connection
+        with conn:
+            row = conn.execute(_CACHE_LOOKUP_SQL, (now, audio_hash, config_key)).fetchone()
+        return row[0] if row else None
+
+    def put_cached_transcription(self, audio_hash: str, config_key: str, transcription: str) -> None:
+        """Store or refresh a cached transcript."""
+        now = datetime.utcnow().isoformat()
+        conn = self.connection
+        with conn:
+            conn.execute(_CACHE_PUT_SQL, (audio_hash, config_key, transcription, now, now))
+
+    def evict_transcription_cache(self, max_entries: int, max_age_days: float) -> int:
+        """Drop entries unused for max_age_days, then the least recently
+        used beyond max_entries. Returns the number of entries removed."""
+        cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+        conn = self.connection
+        with conn:
+            removed = conn.execute(_CACHE_EVICT_AGE_SQL, (cutoff,)).rowcount
+            removed += conn.execute(_CACHE_EVICT_SIZE_SQL, (max_entries,)).rowcount
+        return removed
+
+    def requeue_transcription_jobs(self) -> int:
+        """Return jobs left running by a crashed process to pending."""
+        conn = self.connection
+        with conn:
+            cursor = conn.execute(_REQUEUE_JOBS_SQL)
+        return cursor.rowcount
+
+    def get_chat_settings(self, chat_id: int) -> Dict:
+        """Return a chat's transcription settings (defaults if never set)."""
+        row = self.connection.execute(_SELECT_CHAT_SETTINGS_SQL, (chat_id,)).fetchone()
+        return {
+            'chat_id': chat_id,
+            'language': row[0] if row else None,
+            'prompt_history': bool(row[1]) if row else False
+        }
+
+    def set_chat_language(self, chat_id: int, language: Optional[str]) -> None:
+        """Pin a chat's transcription language, or unpin it with None."""
+        now = datetime.utcnow().isoformat()
+        conn = self.connection
+        with conn:
+            conn.execute(_SET_CHAT_LANGUAGE_SQL, (chat_id, language, now))
+
+    def set_chat_prompt_history(self, chat_id: int, enabled: bool) -> None:
+        """Turn priming transcription with a chat's recent messages on or off."""
+        now = datetime.utcnow().isoformat()
+        conn = self.connection
+        with conn:
+            conn.execute(_SET_CHAT_PROMPT_HISTORY_SQL, (chat_id, enabled, now))
+
+    def get_recent_texts(self, chat_id: int, limit: int) -> List[str]:
+        """Return the last limit texts and transcripts of a chat, oldest first."""
+        rows = self.connection.execute(_SELECT_RECENT_TEXTS_SQL, (chat_id, limit)).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+
+_stores: Dict[str, MessageStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path: str) -> MessageStore:
+    """Get the shared MessageStore for a database path.
+
+    Args:
+        db_path: Path to SQLite database file
+
+    Returns:
+        MessageStore reused by every caller in this process
+    """
+    key = os.path.abspath(db_path)
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(key, MessageStore(db_path))
+    return store
+
+
+def close_stores() -> None:
+    """Close all pooled connections (e.g. at shutdown)."""
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
+
+
+def _json_ids(ids: List[int]) -> str:
+    """Encode row IDs as a JSON array for json_each() parameters."""
+    return "[" + ",".join(str(int(i)) for i in ids) + "]"
+
+
+def _message_from_row(row: tuple) -> Dict:
+    """Build a message dictionary from a queue query row."""
+    return {
+        'id': row[0],
+        'chat_id': row[1],
+        'user_id': row[2],
+        'username': row[3],
+        'message_id': row[4],
+        'text': row[5],
+        'voice_file_path': row[6],
+        'voice_transcription': row[7],
+        'transcription_partial': bool(row[8]),
+        'created_at': row[9]
+    }
+
+
+def _chat_lock_from_row(row: tuple) -> Dict:
+    """Build a lock dictionary from a chat_locks row (None fields if free)."""
+    chat_id, locked_at, holder_pid, holder_host, lease_expires = row
+    is_locked = lease_expires is not None
+    return {
+        'chat_id': chat_id,
+        'is_locked': is_locked,
+        'locked_at': locked_at,
+        'holder_pid': holder_pid,
+        'holder_host': holder_host,
+        'lease_expires': lease_expires,
+        'expired': is_locked and lease_expires < time.time()
+    }
+
+
+def notify_socket_path(db_path: str) -> str:
+    """Unix socket a queue watcher listens on for this database.
+
+    Args:
+        db_path: Path to SQLite database file
+
+    Returns:
+        Socket path next to the database file
+    """
+    return db_path + ".notify"
+
+
+def _lock_holder(holder_pid: Optional[int], holder_host: Optional[str]):
+    """Fill in this process and host for unspecified lock holder fields."""
+    if holder_pid is None:
+        holder_pid = os.getpid()
+    if holder_host is None:
+        holder_host = socket.gethostname()
+    return holder_pid, holder_host
+
+
+def _ensure_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> None:
+    """Add a column to an existing table if an older schema lacks it."""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 def init_db(db_path: str) -> None:
     """Initialize database with required tables.
 
     Creates messages and processing_lock tables if they don't exist.
+    Safe to run against an existing database: it switches the journal to
+    WAL and adds any missing indexes in place.
 
     Args:
         db_path: Path to SQLite database file
@@ -29,6 +1143,13 @@ def init_db(db_path: str) -> None:
     conn = get_db_connection(db_path)
     cursor = conn.cursor()
 
+    # Lets retention return freed pages without a full VACUUM; takes effect
+    # on new databases only (retention.py converts existing ones)
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # WAL is persistent, so this also migrates rollback-journal databases
+    cursor.execute("PRAGMA journal_mode = WAL")
+
     # Messages table for incoming/outgoing message queue
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS messages (
@@ -42,18 +1163,58 @@ def init_db(db_path: str) -> None:
             voice_transcription TEXT,
             direction TEXT NOT NULL,
             processed BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            transcription_partial BOOLEAN NOT NULL DEFAULT 0,
+            claimed_by TEXT,
+            claim_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            delivery_status TEXT,
+            next_attempt_at REAL,
+            telegram_message_id INTEGER,
+            transcription_stats TEXT
         )
     """)
+    _ensure_column(cursor, "messages", "transcription_partial", "BOOLEAN NOT NULL DEFAULT 0")
+    # Delivery state for claim_batch/ack/nack consumers
+    _ensure_column(cursor, "messages", "claimed_by", "TEXT")
+    _ensure_column(cursor, "messages", "claim_expires", "REAL")
+    _ensure_column(cursor, "messages", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    _ensure_column(cursor, "messages", "last_error", "TEXT")
+    # Outbox state for outgoing messages (NULL on rows logged before it)
+    _ensure_column(cursor, "messages", "delivery_status", "TEXT")
+    _ensure_column(cursor, "messages", "next_attempt_at", "REAL")
+    _ensure_column(cursor, "messages", "telegram_message_id", "INTEGER")
+    # Timing telemetry of the transcription, as JSON (query with json_extract)
+    _ensure_column(cursor, "messages", "transcription_stats", "TEXT")
+
+    # Partial index covering only the unprocessed incoming queue, so polls
+    # stay proportional to queue depth rather than message history
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_queue
+        ON messages (created_at)
+        WHERE direction = 'incoming' AND processed = 0
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_outbox
+        ON messages (chat_id, id)
+        WHERE delivery_status IN ('pending', 'sending')
+    """)
 
     # Processing lock table (singleton pattern)
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS processing_lock (
             id INTEGER PRIMARY KEY CHECK (id = 1),
             is_locked BOOLEAN DEFAULT 0,
-            locked_at TIMESTAMP
+            locked_at TIMESTAMP,
+            holder_pid INTEGER,
+            holder_host TEXT,
+            lease_expires REAL
         )
     """)
+    _ensure_column(cursor, "processing_lock", "holder_pid", "INTEGER")
+    _ensure_column(cursor, "processing_lock", "holder_host", "TEXT")
+    _ensure_column(cursor, "processing_lock", "lease_expires", "REAL")
 
     # Initialize lock row if doesn't exist
     cursor.execute("""
@@ -61,7 +1222,78 @@ def init_db(db_path: str) -> None:
         VALUES (1, 0)
     """)
 
+    # Per-chat processing locks; a row exists only while a chat is held
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_locks (
+            chat_id INTEGER PRIMARY KEY,
+            locked_at TIMESTAMP,
+            holder_pid INTEGER,
+            holder_host TEXT,
+            lease_expires REAL NOT NULL
+        )
+    """)
+
+    # Persistent queue for the transcription worker pool
+    # status: pending -> running -> done | failed
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transcription_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_row_id INTEGER NOT NULL REFERENCES messages(id),
+            voice_file_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            audio_hash TEXT,
+            config_key TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            language TEXT,
+            initial_prompt TEXT
+        )
+    """)
+    _ensure_column(cursor, "transcription_jobs", "audio_hash", "TEXT")
+    _ensure_column(cursor, "transcription_jobs", "config_key", "TEXT")
+    # Chat settings in force when the job was queued (see chat_settings.py)
+    _ensure_column(cursor, "transcription_jobs", "language", "TEXT")
+    _ensure_column(cursor, "transcription_jobs", "initial_prompt", "TEXT")
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transcription_jobs_pending
+        ON transcription_jobs (id)
+        WHERE status = 'pending'
+    """)
+
+    # Transcripts keyed by audio content hash and model configuration
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transcription_cache (
+            audio_hash TEXT NOT NULL,
+            config_key TEXT NOT NULL,
+            transcription TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP,
+            last_used_at TIMESTAMP,
+            PRIMARY KEY (audio_hash, config_key)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_transcription_cache_last_used
+        ON transcription_cache (last_used_at)
+    """)
+
+    # Per-chat transcription settings; chats without a row use the defaults
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_settings (
+            chat_id INTEGER PRIMARY KEY,
+            language TEXT,
+            prompt_history BOOLEAN NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP
+        )
+    """)
+
     conn.commit()
+    cursor.execute("PRAGMA optimize")
     conn.close()
 
 
@@ -90,22 +1322,10 @@ def add_incoming_message(
     Returns:
         Database row ID of inserted message
     """
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        INSERT INTO messages (
-            chat_id, user_id, username, message_id, text,
-            voice_file_path, voice_transcription, direction, processed
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, 'incoming', 0)
-    """, (chat_id, user_id, username, message_id, text,
-          voice_file_path, voice_transcription))
-
-    message_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-
-    return message_id
+    return get_store(db_path).add_incoming_message(
+        chat_id, user_id, username, message_id, text,
+        voice_file_path, voice_transcription
+    )
 
 
 def add_outgoing_message(db_path: str, chat_id: int, text: str) -> int:
@@ -119,134 +1339,258 @@ def add_outgoing_message(db_path: str, chat_id: int, text: str) -> int:
     Returns:
         Database row ID of inserted message
     """
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
+    return get_store(db_path).add_outgoing_message(chat_id, text)
 
-    cursor.execute("""
-        INSERT INTO messages (chat_id, text, direction)
-        VALUES (?, ?, 'outgoing')
-    """, (chat_id, text))
 
-    message_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+def enqueue_outgoing_message(db_path: str, chat_id: int, text: str, claim: bool = False) -> int:
+    """Store an outgoing message in the outbox before it is sent.
+
+    Args:
+        db_path: Path to database
+        chat_id: Telegram chat ID
+        text: Message text
+        claim: Store it as being sent by the caller instead of pending
 
-    return message_id
+    Returns:
+        Database row ID of inserted message
+    """
+    return get_store(db_path).enqueue_outgoing_message(chat_id, text, claim)
 
 
-def get_unprocessed_messages(db_path: str) -> List[Dict]:
-    """Get all unprocessed incoming messages.
+def claim_deliveries(db_path: str, limit: int) -> List[Dict]:
+    """Claim due outbox messages for sending, at most one per chat.
 
     Args:
         db_path: Path to database
+        limit: Maximum number of messages to claim
+
+    Returns:
+        List of message dictionaries (id, chat_id, text, attempts)
+    """
+    return get_store(db_path).claim_deliveries(limit)
+
+
+def complete_delivery(db_path: str, row_id: int, telegram_message_id: Optional[int]) -> None:
+    """Mark an outbox message delivered.
+
+    Args:
+        db_path: Path to database
+        row_id: Database row ID of the message
+        telegram_message_id: Message ID Telegram assigned
+    """
+    get_store(db_path).complete_delivery(row_id, telegram_message_id)
+
+
+def retry_delivery(db_path: str, row_id: int, error: str, delay: float) -> None:
+    """Put an outbox message back for another attempt.
+
+    Args:
+        db_path: Path to database
+        row_id: Database row ID of the message
+        error: Error from the failed attempt
+        delay: Seconds until the message is due again
+    """
+    get_store(db_path).retry_delivery(row_id, error, delay)
+
+
+def fail_delivery(db_path: str, row_id: int, error: str) -> None:
+    """Mark an outbox message failed for good.
+
+    Args:
+        db_path: Path to database
+        row_id: Database row ID of the message
+        error: Error from the last attempt
+    """
+    get_store(db_path).fail_delivery(row_id, error)
+
+
+def get_delivery(db_path: str, row_id: int) -> Optional[Dict]:
+    """Get an outgoing message's delivery state.
+
+    Args:
+        db_path: Path to database
+        row_id: Database row ID of the message
+
+    Returns:
+        Dictionary with delivery_status, attempts, error and
+        telegram_message_id, or None if not found
+    """
+    return get_store(db_path).get_delivery(row_id)
+
+
+def count_pending_deliveries(db_path: str) -> int:
+    """Count outbox messages not yet delivered or failed.
+
+    Args:
+        db_path: Path to database
+
+    Returns:
+        Number of pending or sending messages
+    """
+    return get_store(db_path).count_pending_deliveries()
+
+
+def get_unprocessed_messages(db_path: str, chat_id: Optional[int] = None) -> List[Dict]:
+    """Get unprocessed incoming messages.
+
+    Args:
+        db_path: Path to database
+        chat_id: Only return this chat's messages. If None, the chat
+            telegram-process.sh is running for (TELEGRAM_PROCESS_CHAT_ID),
+            or all chats outside such a run
 
     Returns:
         List of message dictionaries ordered by created_at
     """
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
+    if chat_id is None:
+        # Set by telegram-process.sh for each per-chat agent run
+        process_chat = os.getenv("TELEGRAM_PROCESS_CHAT_ID")
+        chat_id = int(process_chat) if process_chat else None
+    return get_store(db_path).get_unprocessed_messages(chat_id)
 
-    cursor.execute("""
-        SELECT id, chat_id, user_id, username, message_id, text,
-               voice_file_path, voice_transcription, created_at
-        FROM messages
-        WHERE direction = 'incoming' AND processed = 0
-        ORDER BY created_at ASC
-    """)
 
-    messages = []
-    for row in cursor.fetchall():
-        messages.append({
-            'id': row[0],
-            'chat_id': row[1],
-            'user_id': row[2],
-            'username': row[3],
-            'message_id': row[4],
-            'text': row[5],
-            'voice_file_path': row[6],
-            'voice_transcription': row[7],
-            'created_at': row[8]
-        })
+def claim_batch(
+    db_path: str,
+    limit: int,
+    worker_id: str,
+    visibility_timeout: float = VISIBILITY_TIMEOUT_SECONDS,
+    max_attempts: int = MAX_DELIVERY_ATTEMPTS,
+    chat_id: Optional[int] = None
+) -> List[Dict]:
+    """Claim the oldest ready messages for one consumer.
 
-    conn.close()
-    return messages
+    Chats with a message already in flight are skipped, so several
+    consumers can drain the queue in parallel while each chat stays in
+    order.
+
+    Args:
+        db_path: Path to database
+        limit: Maximum number of messages to claim
+        worker_id: Consumer identifier; needed to ack or nack
+        visibility_timeout: Seconds before unacked messages are redelivered
+        max_attempts: Deliveries before a message is dead-lettered
+        chat_id: Only claim this chat's messages (optional)
+
+    Returns:
+        Message dictionaries (with attempts) ordered by created_at
+    """
+    return get_store(db_path).claim_batch(
+        limit, worker_id, visibility_timeout, max_attempts, chat_id
+    )
 
 
-def mark_messages_processed(db_path: str, message_ids: List[int]) -> None:
-    """Mark messages as processed.
+def ack(db_path: str, message_ids: List[int], worker_id: str) -> int:
+    """Acknowledge claimed messages as processed.
 
     Args:
         db_path: Path to database
-        message_ids: List of message IDs to mark as processed
+        message_ids: Claimed message row IDs
+        worker_id: Consumer that claimed them
+
+    Returns:
+        Number of messages acked (claims that expired are not)
     """
-    if not message_ids:
-        return
+    return get_store(db_path).ack(message_ids, worker_id)
 
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
 
-    placeholders = ','.join('?' * len(message_ids))
-    cursor.execute(f"""
-        UPDATE messages
-        SET processed = 1
-        WHERE id IN ({placeholders})
-    """, message_ids)
+def nack(
+    db_path: str,
+    message_ids: List[int],
+    worker_id: str,
+    error: Optional[str] = None,
+    max_attempts: int = MAX_DELIVERY_ATTEMPTS
+) -> int:
+    """Release claimed messages for redelivery.
 
-    conn.commit()
-    conn.close()
+    Args:
+        db_path: Path to database
+        message_ids: Claimed message row IDs
+        worker_id: Consumer that claimed them
+        error: Reason, kept in last_error
+        max_attempts: Deliveries before a message is dead-lettered
+
+    Returns:
+        Number of messages released
+    """
+    return get_store(db_path).nack(message_ids, worker_id, error, max_attempts)
 
 
-def acquire_lock(db_path: str) -> bool:
-    """Attempt to acquire processing lock.
+def count_unprocessed(db_path: str) -> int:
+    """Count messages ready for processing.
 
     Args:
         db_path: Path to database
 
     Returns:
-        True if lock acquired, False if already locked
+        Number of unprocessed incoming messages with text or a transcript
+        that no consumer has claimed
     """
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
+    return get_store(db_path).count_unprocessed()
 
-    # Check if already locked
-    cursor.execute("SELECT is_locked FROM processing_lock WHERE id = 1")
-    row = cursor.fetchone()
 
-    if row and row[0] == 1:
-        conn.close()
-        return False
+def mark_messages_processed(db_path: str, message_ids: List[int]) -> None:
+    """Mark messages as processed.
 
-    # Acquire lock
-    now = datetime.utcnow().isoformat()
-    cursor.execute("""
-        UPDATE processing_lock
-        SET is_locked = 1, locked_at = ?
-        WHERE id = 1
-    """, (now,))
+    Args:
+        db_path: Path to database
+        message_ids: List of message IDs to mark as processed
+    """
+    get_store(db_path).mark_messages_processed(message_ids)
 
-    conn.commit()
-    conn.close()
 
-    return True
+def acquire_lock(
+    db_path: str,
+    holder_pid: Optional[int] = None,
+    holder_host: Optional[str] = None,
+    lease_seconds: float = LOCK_LEASE_SECONDS
+) -> bool:
+    """Attempt to acquire processing lock.
 
+    A single compare-and-set UPDATE takes the lock if it is free or the
+    current holder's lease has expired.
 
-def release_lock(db_path: str) -> None:
-    """Release processing lock.
+    Args:
+        db_path: Path to database
+        holder_pid: Holder process ID (default: this process)
+        holder_host: Holder hostname (default: this host)
+        lease_seconds: Seconds until the lock may be reclaimed unless renewed
+
+    Returns:
+        True if lock acquired, False if already locked
+    """
+    return get_store(db_path).acquire_lock(holder_pid, holder_host, lease_seconds)
+
+
+def renew_lock(
+    db_path: str,
+    holder_pid: Optional[int] = None,
+    holder_host: Optional[str] = None,
+    lease_seconds: float = LOCK_LEASE_SECONDS
+) -> bool:
+    """Extend the processing lock lease (heartbeat).
 
     Args:
         db_path: Path to database
+        holder_pid: Holder process ID (default: this process)
+        holder_host: Holder hostname (default: this host)
+        lease_seconds: New lease length from now
+
+    Returns:
+        True if renewed, False if the lock is no longer held by this holder
     """
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
+    return get_store(db_path).renew_lock(holder_pid, holder_host, lease_seconds)
 
-    cursor.execute("""
-        UPDATE processing_lock
-        SET is_locked = 0, locked_at = NULL
-        WHERE id = 1
-    """)
 
-    conn.commit()
-    conn.close()
+def release_lock(db_path: str, holder_pid: Optional[int] = None,
+                 holder_host: Optional[str] = None) -> None:
+    """Release processing lock.
+
+    Args:
+        db_path: Path to database
+        holder_pid: Only release if held by this process ID (optional)
+        holder_host: Hostname for holder_pid (default: this host)
+    """
+    get_store(db_path).release_lock(holder_pid, holder_host)
 
 
 def is_locked(db_path: str) -> bool:
@@ -258,14 +1602,331 @@ def is_locked(db_path: str) -> bool:
     Returns:
         True if locked, False otherwise
     """
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
+    return get_store(db_path).is_locked()
 
-    cursor.execute("SELECT is_locked FROM processing_lock WHERE id = 1")
-    row = cursor.fetchone()
 
-    conn.close()
+def get_lock_info(db_path: str) -> Dict:
+    """Get processing lock state and holder.
 
-    if row and row[0] == 1:
-        return True
-    return False
+    Args:
+        db_path: Path to database
+
+    Returns:
+        Dictionary with is_locked, locked_at, holder_pid, holder_host,
+        lease_expires (epoch seconds) and expired
+    """
+    return get_store(db_path).get_lock_info()
+
+
+def get_ready_chats(db_path: str) -> List[int]:
+    """Get chats waiting to be processed.
+
+    Args:
+        db_path: Path to database
+
+    Returns:
+        Chat IDs with ready messages and no live chat lock, oldest
+        waiting message first
+    """
+    return get_store(db_path).get_ready_chats()
+
+
+def acquire_chat_lock(
+    db_path: str,
+    chat_id: int,
+    holder_pid: Optional[int] = None,
+    holder_host: Optional[str] = None,
+    lease_seconds: float = LOCK_LEASE_SECONDS,
+    max_parallel: int = MAX_PARALLEL_CHATS
+) -> bool:
+    """Attempt to acquire one chat's processing lock.
+
+    Different chats are processed concurrently, up to max_parallel at a
+    time; one chat is only ever processed by one holder, which keeps its
+    messages in order.
+
+    Args:
+        db_path: Path to database
+        chat_id: Chat to lock
+        holder_pid: Holder process ID (default: this process)
+        holder_host: Holder hostname (default: this host)
+        lease_seconds: Seconds until the lock may be reclaimed unless renewed
+        max_parallel: Maximum chats held under live leases at once
+
+    Returns:
+        True if lock acquired, False if the chat is held or no slot is free
+    """
+    return get_store(db_path).acquire_chat_lock(
+        chat_id, holder_pid, holder_host, lease_seconds, max_parallel
+    )
+
+
+def renew_chat_lock(
+    db_path: str,
+    chat_id: int,
+    holder_pid: Optional[int] = None,
+    holder_host: Optional[str] = None,
+    lease_seconds: float = LOCK_LEASE_SECONDS
+) -> bool:
+    """Extend a chat lock lease (heartbeat).
+
+    Args:
+        db_path: Path to database
+        chat_id: Locked chat
+        holder_pid: Holder process ID (default: this process)
+        holder_host: Holder hostname (default: this host)
+        lease_seconds: New lease length from now
+
+    Returns:
+        True if renewed, False if the lock is no longer held by this holder
+    """
+    return get_store(db_path).renew_chat_lock(chat_id, holder_pid, holder_host, lease_seconds)
+
+
+def release_chat_lock(db_path: str, chat_id: int, holder_pid: Optional[int] = None,
+                      holder_host: Optional[str] = None) -> None:
+    """Release a chat lock.
+
+    Args:
+        db_path: Path to database
+        chat_id: Locked chat
+        holder_pid: Only release if held by this process ID (optional)
+        holder_host: Hostname for holder_pid (default: this host)
+    """
+    get_store(db_path).release_chat_lock(chat_id, holder_pid, holder_host)
+
+
+def get_chat_lock_info(db_path: str, chat_id: int) -> Dict:
+    """Get one chat's lock state and holder.
+
+    Args:
+        db_path: Path to database
+        chat_id: Chat to look up
+
+    Returns:
+        Dictionary with chat_id plus the get_lock_info() fields
+    """
+    return get_store(db_path).get_chat_lock_info(chat_id)
+
+
+def get_chat_locks(db_path: str) -> List[Dict]:
+    """Get the chats currently being processed.
+
+    Args:
+        db_path: Path to database
+
+    Returns:
+        Lock dictionaries for chat locks with a live lease
+    """
+    return get_store(db_path).get_chat_locks()
+
+
+def enqueue_transcription_job(
+    db_path: str,
+    message_row_id: int,
+    voice_file_path: str,
+    audio_hash: Optional[str] = None,
+    config_key: Optional[str] = None,
+    language: Optional[str] = None,
+    initial_prompt: Optional[str] = None
+) -> int:
+    """Queue a stored voice message for transcription.
+
+    Args:
+        db_path: Path to database
+        message_row_id: Row ID of the voice message in messages
+        voice_file_path: Path to the downloaded voice file
+        audio_hash: Content hash of the audio (optional, enables caching)
+        config_key: Model configuration key (optional, enables caching)
+        language: Language to transcribe in instead of detecting it (optional)
+        initial_prompt: Text to prime the model with (optional)
+
+    Returns:
+        Job ID
+    """
+    return get_store(db_path).enqueue_transcription_job(
+        message_row_id, voice_file_path, audio_hash, config_key, language, initial_prompt
+    )
+
+
+def claim_transcription_jobs(db_path: str, limit: int) -> List[Dict]:
+    """Claim pending transcription jobs for running.
+
+    Args:
+        db_path: Path to database
+        limit: Maximum number of jobs to claim
+
+    Returns:
+        List of job dictionaries ordered by job ID
+    """
+    return get_store(db_path).claim_transcription_jobs(limit)
+
+
+def count_pending_transcription_jobs(db_path: str) -> int:
+    """Count transcription jobs waiting for a worker.
+
+    Args:
+        db_path: Path to database
+
+    Returns:
+        Number of pending jobs
+    """
+    return get_store(db_path).count_pending_transcription_jobs()
+
+
+def get_transcription_job(db_path: str, job_id: int) -> Optional[Dict]:
+    """Get a transcription job with its message's chat details.
+
+    Args:
+        db_path: Path to database
+        job_id: Transcription job ID
+
+    Returns:
+        Job dictionary, or None if not found
+    """
+    return get_store(db_path).get_transcription_job(job_id)
+
+
+def complete_transcription_job(db_path: str, job_id: int, transcription: str,
+                               stats: Optional[Dict] = None) -> None:
+    """Mark a transcription job done and store its transcript.
+
+    Args:
+        db_path: Path to database
+        job_id: Transcription job ID
+        transcription: Transcribed text for the message
+        stats: Timing telemetry, stored with the message as JSON
+    """
+    get_store(db_path).complete_transcription_job(job_id, transcription, stats)
+
+
+def fail_transcription_job(db_path: str, job_id: int, error: str, max_attempts: int) -> bool:
+    """Record a failed transcription attempt.
+
+    Args:
+        db_path: Path to database
+        job_id: Transcription job ID
+        error: Error message from the attempt
+        max_attempts: Attempts allowed before the job fails for good
+
+    Returns:
+        True if the job failed for good, False if it will be retried
+    """
+    return get_store(db_path).fail_transcription_job(job_id, error, max_attempts)
+
+
+def requeue_transcription_jobs(db_path: str) -> int:
+    """Reset jobs left running by a previous process to pending.
+
+    Args:
+        db_path: Path to database
+
+    Returns:
+        Number of jobs requeued
+    """
+    return get_store(db_path).requeue_transcription_jobs()
+
+
+def set_partial_transcription(db_path: str, job_id: int, transcription: str) -> None:
+    """Store a running job's transcript so far on its message.
+
+    The message becomes visible to processing with transcription_partial
+    set; the final transcript replaces it when the job completes.
+
+    Args:
+        db_path: Path to database
+        job_id: Running transcription job ID
+        transcription: Text of the segments decoded so far
+    """
+    get_store(db_path).set_partial_transcription(job_id, transcription)
+
+
+def get_cached_transcription(db_path: str, audio_hash: str, config_key: str) -> Optional[str]:
+    """Look up a cached transcript, counting the hit.
+
+    Args:
+        db_path: Path to database
+        audio_hash: Content hash of the audio
+        config_key: Model configuration key
+
+    Returns:
+        Cached transcription, or None on a miss
+    """
+    return get_store(db_path).get_cached_transcription(audio_hash, config_key)
+
+
+def put_cached_transcription(db_path: str, audio_hash: str, config_key: str,
+                             transcription: str) -> None:
+    """Store a transcript in the cache.
+
+    Args:
+        db_path: Path to database
+        audio_hash: Content hash of the audio
+        config_key: Model configuration key
+        transcription: Transcribed text
+    """
+    get_store(db_path).put_cached_transcription(audio_hash, config_key, transcription)
+
+
+def evict_transcription_cache(db_path: str, max_entries: int, max_age_days: float) -> int:
+    """Trim the transcription cache by age and size.
+
+    Args:
+        db_path: Path to database
+        max_entries: Entries to keep (most recently used first)
+        max_age_days: Remove entries unused for longer than this
+
+    Returns:
+        Number of entries removed
+    """
+    return get_store(db_path).evict_transcription_cache(max_entries, max_age_days)
+
+
+def get_chat_settings(db_path: str, chat_id: int) -> Dict:
+    """Get a chat's transcription settings.
+
+    Args:
+        db_path: Path to database
+        chat_id: Telegram chat ID
+
+    Returns:
+        Dictionary with chat_id, language (None = detect) and
+        prompt_history
+    """
+    return get_store(db_path).get_chat_settings(chat_id)
+
+
+def set_chat_language(db_path: str, chat_id: int, language: Optional[str]) -> None:
+    """Pin the language a chat's voice messages are transcribed in.
+
+    Args:
+        db_path: Path to database
+        chat_id: Telegram chat ID
+        language: Whisper language code, or None to detect it per message
+    """
+    get_store(db_path).set_chat_language(chat_id, language)
+
+
+def set_chat_prompt_history(db_path: str, chat_id: int, enabled: bool) -> None:
+    """Turn priming a chat's transcriptions with its recent messages on or off.
+
+    Args:
+        db_path: Path to database
+        chat_id: Telegram chat ID
+        enabled: Prime with recent messages
+    """
+    get_store(db_path).set_chat_prompt_history(chat_id, enabled)
+
+
+def get_recent_texts(db_path: str, chat_id: int, limit: int) -> List[str]:
+    """Get a chat's latest message texts and voice transcripts.
+
+    Args:
+        db_path: Path to database
+        chat_id: Telegram chat ID
+        limit: Most messages to return
+
+    Returns:
+        Texts, oldest first
+    """
+    return get_store(db_path).get_recent_texts(chat_id, limit)
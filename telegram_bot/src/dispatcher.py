@@ -0,0 +1,117 @@
+"""Event-driven wake-ups for the message processing runner.
+
+Instead of spawning telegram-process.sh for every message, the bot keeps
+one long-lived runner (telegram-process.sh --listen) and writes a line to
+its stdin to wake it. Triggers within a short debounce window are
+coalesced into a single wake-up, and the runner drains any wake-ups that
+queued while it was busy before checking the queue again.
+"""
+import asyncio
+import os
+from typing import Callable, Dict, Optional, Set
+
+
+DISPATCH_DEBOUNCE_SECONDS = float(os.getenv("DISPATCH_DEBOUNCE_SECONDS", "1.0"))
+
+WAKE_LINE = b"wake\n"
+
+
+class ProcessingDispatcher:
+    """Coalesces processing triggers and signals one runner over a pipe."""
+
+    def __init__(
+        self,
+        script_path: str,
+        debounce: float = DISPATCH_DEBOUNCE_SECONDS,
+        on_wake: Optional[Callable[[], None]] = None
+    ):
+        """Create a dispatcher for a runner script.
+
+        Args:
+            script_path: Script started with --listen; reads wake lines on stdin
+            debounce: Seconds to collect triggers before waking the runner
+            on_wake: Called after each wake line has been written
+        """
+        self.script_path = script_path
+        self.debounce = debounce
+        self.on_wake = on_wake
+        self._runner: Optional[asyncio.subprocess.Process] = None
+        self._pending: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.triggers = 0
+        self.wakeups = 0
+        self.runner_starts = 0
+
+    async def start(self) -> None:
+        """Start the runner so it catches up on anything already queued."""
+        await self._ensure_runner()
+
+    async def stop(self) -> None:
+        """Drop pending wake-ups and close the runner's pipe.
+
+        The runner exits once it sees end of input; a batch already in
+        progress is allowed to finish.
+        """
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._runner is not None and self._runner.returncode is None:
+            self._runner.stdin.close()
+        self._runner = None
+
+    def trigger(self) -> None:
+        """Request processing; returns immediately.
+
+        Must be called from the event loop. Calls within the debounce
+        window share one wake-up.
+        """
+        self.triggers += 1
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().call_later(self.debounce, self._fire)
+
+    def stats(self) -> Dict:
+        """Return trigger and wake-up counters since startup."""
+        return {
+            'triggers': self.triggers,
+            'wakeups': self.wakeups,
+            'runner_starts': self.runner_starts,
+        }
+
+    def _fire(self) -> None:
+        """End the debounce window and wake the runner."""
+        self._pending = None
+        task = asyncio.create_task(self._wake())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _wake(self) -> None:
+        """Write one wake line, restarting the runner if it has exited."""
+        for _ in range(2):
+            runner = await self._ensure_runner()
+            try:
+                runner.stdin.write(WAKE_LINE)
+                await runner.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # Runner died since the last check; start a new one
+                self._runner = None
+                continue
+            self.wakeups += 1
+            if self.on_wake is not None:
+                self.on_wake()
+            return
+        print("Processing runner keeps exiting; wake-up dropped")
+
+    async def _ensure_runner(self) -> asyncio.subprocess.Process:
+        """Return the running runner, starting one if needed."""
+        if self._runner is None or self._runner.returncode is not None:
+            self._runner = await asyncio.create_subprocess_exec(
+                self.script_path, "--listen",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                start_new_session=True
+            )
+            self.runner_starts += 1
+        return self._runner
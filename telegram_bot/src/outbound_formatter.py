@@ -0,0 +1,159 @@
+"""Outbound formatting: fit agent replies into Telegram messages.
+
+Telegram rejects texts longer than 4096 characters (counted in UTF-16
+code units), so long replies are split into parts, preferring paragraph
+breaks, then line breaks, then spaces. Code blocks are kept whole when they
+fit; a code block that does not fit is split between lines and every part
+is re-fenced so it still reads as code.
+
+The reverse also happens: short replies sent to one chat in quick
+succession are joined into one message (see coalesce_count), saving a
+round trip and a notification per reply.
+"""
+import os
+from typing import List
+
+
+# Telegram's limit for one text message
+MESSAGE_LIMIT = 4096
+# Replies to a chat that arrive within this many seconds of its previous
+# message are held this long and joined with any that follow
+COALESCE_SECONDS = float(os.getenv("OUTBOX_COALESCE_SECONDS", "0.5"))
+
+PARAGRAPH_SEPARATOR = "\n\n"
+FENCE = "```"
+
+
+def telegram_length(text: str) -> int:
+    """Length of text as Telegram counts it (UTF-16 code units)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _blocks(text: str) -> List[str]:
+    """Split text into paragraphs and whole code blocks.
+
+    Blank lines separate paragraphs except inside a fenced code block.
+    """
+    blocks: List[str] = []
+    current: List[str] = []
+    in_code = False
+    for line in text.split("\n"):
+        if line.lstrip().startswith(FENCE):
+            if not in_code and current:
+                blocks.append("\n".join(current))
+                current = []
+            current.append(line)
+            if in_code:
+                blocks.append("\n".join(current))
+                current = []
+            in_code = not in_code
+        elif not in_code and not line.strip():
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+        else:
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _hard_cut(text: str, limit: int) -> List[str]:
+    """Cut text into pieces of at most limit, with no regard for words."""
+    pieces = []
+    while text:
+        end = min(len(text), limit)
+        while telegram_length(text[:end]) > limit:
+            end -= 1
+        pieces.append(text[:end])
+        text = text[end:]
+    return pieces
+
+
+def _pack(pieces: List[str], separator: str, limit: int) -> List[str]:
+    """Join consecutive pieces while the result stays within limit."""
+    parts: List[str] = []
+    for piece in pieces:
+        if parts and telegram_length(parts[-1] + separator + piece) <= limit:
+            parts[-1] += separator + piece
+        else:
+            parts.append(piece)
+    return parts
+
+
+def _split_text(text: str, limit: int) -> List[str]:
+    """Split prose at line breaks, then spaces, then anywhere."""
+    if telegram_length(text) <= limit:
+        return [text]
+    for separator in ("\n", " "):
+        pieces = text.split(separator)
+        if len(pieces) > 1:
+            split: List[str] = []
+            for piece in pieces:
+                split.extend(_split_text(piece, limit) if piece else [piece])
+            return [part for part in _pack(split, separator, limit) if part.strip()]
+    return _hard_cut(text, limit)
+
+
+def _split_code(block: str, limit: int) -> List[str]:
+    """Split a fenced code block between lines, fencing every part."""
+    lines = block.split("\n")
+    opening = lines[0]
+    closed = len(lines) > 1 and lines[-1].strip() == FENCE
+    body = lines[1:-1] if closed else lines[1:]
+    budget = limit - telegram_length(opening) - len(FENCE) - 2
+    if budget <= 0:
+        return _split_text(block, limit)
+
+    pieces: List[str] = []
+    for line in body:
+        pieces.extend(_hard_cut(line, budget) if telegram_length(line) > budget else [line])
+    return [f"{opening}\n{part}\n{FENCE}" for part in _pack(pieces, "\n", budget)]
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split a reply into parts Telegram accepts.
+
+    Args:
+        text: Reply text of any length
+        limit: Longest part allowed, in UTF-16 code units
+
+    Returns:
+        Parts in order; just [text] if it already fits
+    """
+    if telegram_length(text) <= limit:
+        return [text]
+
+    pieces: List[str] = []
+    for block in _blocks(text):
+        if telegram_length(block) <= limit:
+            pieces.append(block)
+        elif block.lstrip().startswith(FENCE):
+            pieces.extend(_split_code(block, limit))
+        else:
+            pieces.extend(_split_text(block, limit))
+    return _pack(pieces, PARAGRAPH_SEPARATOR, limit)
+
+
+def join_messages(texts: List[str]) -> str:
+    """Join replies into one message, one paragraph each."""
+    return PARAGRAPH_SEPARATOR.join(texts)
+
+
+def coalesce_count(texts: List[str], limit: int = MESSAGE_LIMIT) -> int:
+    """How many leading replies fit into one message together.
+
+    Args:
+        texts: Replies to one chat, oldest first
+        limit: Longest message allowed, in UTF-16 code units
+
+    Returns:
+        Number of texts from the start that join_messages keeps within
+        limit (at least 1 if texts is not empty)
+    """
+    length = 0
+    for count, text in enumerate(texts):
+        length += telegram_length(text) + (len(PARAGRAPH_SEPARATOR) if count else 0)
+        if count and length > limit:
+            return count
+    return len(texts)
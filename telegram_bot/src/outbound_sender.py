@@ -0,0 +1,485 @@
+"""Outbound message service: delivers replies from the outbox.
+
+Replies are stored in the messages table first (delivery_status 'pending')
+and then sent by the bot process, over the connection pool it already
+keeps open to the Bot API. A message is never lost to a failed send: it
+stays in the outbox and is retried with backoff, or marked failed.
+
+Long replies are split into parts that fit a Telegram message, each part
+its own outbox row; replies queued for a chat while it is receiving a
+burst are joined into one message (see outbound_formatter).
+
+Sends are spread over token buckets, one shared and one per chat, to stay
+under Telegram's limits (about 30 messages per second overall and one per
+second per chat); a 429 flood wait pauses the chat for the retry_after
+Telegram asks for.
+
+send_message.py hands messages over a Unix socket next to the database
+(sender_socket_path). Protocol: newline-delimited JSON. Each request line
+is {"id": ..., "chat_id": ..., "text": ...}; each reply line is
+{"id": ..., "ok": true, "message_id": ...} or {"id": ..., "ok": false,
+"error": ...}, written once the message is delivered or has failed. A
+message still in the outbox after OUTBOX_WAIT_SECONDS (a long flood wait,
+say) is answered {"id": ..., "ok": true, "message_id": null, "queued":
+true} and delivered later. A client may write many requests before
+reading replies; they are sent concurrently, and each chat's messages are
+delivered in the order they were written.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from async_database import get_async_store
+from outbound_formatter import COALESCE_SECONDS, coalesce_count, join_messages, split_message
+
+
+# Messages being sent at once across chats
+SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "8"))
+# Sustained messages per second overall and per chat; a chat may burst
+# up to OUTBOX_CHAT_BURST messages before its rate applies
+GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "30"))
+CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+CHAT_BURST = int(os.getenv("OUTBOX_CHAT_BURST", "3"))
+# Sends tried per message before it is marked failed
+MAX_SEND_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# Longest a socket client waits for a reply before it is told the message
+# is still queued
+WAIT_SECONDS = float(os.getenv("OUTBOX_WAIT_SECONDS", "120"))
+
+# Backoff after network errors: 1s, 2s, 4s, ... up to the cap
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 300.0
+# Longest the worker sleeps without checking the outbox, for messages
+# left there by other processes
+SWEEP_SECONDS = 30.0
+# Most queued replies considered for joining into one message
+COALESCE_MAX_MESSAGES = 50
+
+
+class DeliveryError(Exception):
+    """A message failed for good and will not be retried."""
+
+
+def sender_socket_path(db_path: str) -> str:
+    """Unix socket the outbound sender listens on for this database.
+
+    Args:
+        db_path: Path to SQLite database file
+
+    Returns:
+        Socket path next to the database file
+    """
+    return db_path + ".send"
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff after a message's attempts-th failed try."""
+    return min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+
+
+def retry_delay(error: Exception, attempts: int) -> Optional[float]:
+    """Seconds to wait before sending again after an error.
+
+    Args:
+        error: Exception raised by the send
+        attempts: Sends tried so far, including the failed one
+
+    Returns:
+        Telegram's retry_after for flood waits, exponential backoff for
+        other network errors, or None if retrying cannot help
+    """
+    if isinstance(error, RetryAfter):
+        return float(error.retry_after)
+    # BadRequest is a NetworkError subclass but will fail the same way again
+    if isinstance(error, NetworkError) and not isinstance(error, BadRequest):
+        return backoff_delay(attempts)
+    return None
+
+
+class TokenBucket:
+    """Allows rate events per second on average and bursts up to capacity."""
+
+    def __init__(self, rate: float, capacity: int):
+        """Create a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Most tokens the bucket holds
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0.0)
+
+    def take(self) -> None:
+        """Use one token; call only when wait_time() is 0."""
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """Hand out no tokens for the next seconds (e.g. a flood wait)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class OutboundSender:
+    """Delivers outbox messages with one shared Bot and serves local clients."""
+
+    def __init__(
+        self,
+        db_path: str,
+        bot: Bot,
+        concurrency: int = SEND_CONCURRENCY,
+        global_rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: int = CHAT_BURST,
+        max_attempts: int = MAX_SEND_ATTEMPTS,
+        coalesce_window: float = COALESCE_SECONDS
+    ):
+        """Create a sender for a bot and messages database.
+
+        Args:
+            db_path: Path to SQLite database file holding the outbox
+            bot: Initialized bot whose HTTP client is reused
+            concurrency: Messages being sent at once
+            global_rate: Messages per second across all chats
+            chat_rate: Messages per second to one chat
+            chat_burst: Messages one chat may receive back to back
+            max_attempts: Sends tried per message before it fails
+            coalesce_window: Seconds to hold a reply to a chat that was
+                just sent a message, collecting replies to join with it
+                (0 disables joining)
+        """
+        self.db_path = db_path
+        self.bot = bot
+        self.socket_path = sender_socket_path(db_path)
+        self.concurrency = concurrency
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.coalesce_window = coalesce_window
+        self._store = get_async_store(db_path)
+        self._global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # When each chat was last sent a message (monotonic clock)
+        self._last_sent: Dict[int, float] = {}
+        # Clients waiting for a message's outcome, by row ID
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._in_flight: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._server = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.coalesced = 0
+
+    async def start(self) -> None:
+        """Start delivering and listen on the sender socket.
+
+        Messages a previous bot was sending when it stopped go back to
+        the outbox first; they may reach the chat twice if that send had in
+        fact succeeded. Messages send_message.py is sending itself are left
+        to it until their lease runs out.
+        """
+        await self._store.requeue_deliveries()
+        self._worker = asyncio.create_task(self._run())
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+
+    async def stop(self) -> None:
+        """Stop delivering and drop clients.
+
+        Undelivered messages stay in the outbox for the next start.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._in_flight):
+            task.cancel()
+        for writer in list(self._clients):
+            writer.close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict:
+        """Return counters since startup.
+
+        sent and failed count outbox rows; coalesced counts rows that went
+        out joined to an earlier one instead of as their own message.
+        """
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'coalesced': self.coalesced,
+        }
+
+    async def send(self, chat_id: int, text: str,
+                   timeout: Optional[float] = None) -> Optional[int]:
+        """Store a message in the outbox and wait until it is delivered.
+
+        Messages to the same chat are delivered one at a time, in call
+        order. Text over Telegram's limit is stored and sent in parts.
+
+        Args:
+            chat_id: Telegram chat ID
+            text: Message text
+            timeout: Longest to wait for all parts, or None to wait until
+                they are delivered or failed
+
+        Returns:
+            Telegram message ID of the (last part of the) sent message, or
+            None if a part is still queued when the timeout runs out
+
+        Raises:
+            DeliveryError: If the message failed for good
+        """
+        row_ids = [
+            await self._store.enqueue_outgoing_message(chat_id, part)
+            for part in split_message(text)
+        ]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for row_id in row_ids:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            try:
+                message_id = await self.wait_for(row_id, remaining)
+            except asyncio.TimeoutError:
+                return None
+        return message_id
+
+    async def wait_for(self, row_id: int, timeout: Optional[float] = None) -> int:
+        """Wait until an outbox message is delivered.
+
+        Args:
+            row_id: Database row ID of the message
+            timeout: Longest to wait, or None for no limit
+
+        Returns:
+            Telegram message ID of the sent message
+
+        Raises:
+            DeliveryError: If the message failed for good
+            asyncio.TimeoutError: If it is still queued after timeout
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[row_id] = future
+        self._wake.set()
+        try:
+            # It may have been settled before we started waiting
+            delivery = await self._store.get_delivery(row_id)
+            if delivery['delivery_status'] == 'delivered':
+                return delivery['telegram_message_id']
+            if delivery['delivery_status'] == 'failed':
+                raise DeliveryError(delivery['error'])
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._waiters.pop(row_id, None)
+
+    async def _run(self) -> None:
+        """Claim due messages whenever a slot frees up or one falls due."""
+        next_sweep = time.monotonic() + SWEEP_SECONDS
+        while True:
+            self._wake.clear()
+            if time.monotonic() >= next_sweep:
+                # Messages another process stopped sending come back once
+                # their lease runs out
+                await self._store.requeue_deliveries(unleased=False)
+                next_sweep = time.monotonic() + SWEEP_SECONDS
+            free = self.concurrency - len(self._in_flight)
+            if free > 0:
+                for delivery in await self._store.claim_deliveries(free):
+                    task = asyncio.create_task(self._deliver(delivery))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._delivery_done)
+
+            # Due messages that were not claimed wait behind their chat's
+            # message in flight, whose completion wakes us
+            timeout = SWEEP_SECONDS
+            due = await self._store.next_delivery_at()
+            if due is not None and due > time.time():
+                timeout = min(timeout, due - time.time())
+            timer = asyncio.get_running_loop().call_later(timeout, self._wake.set)
+            try:
+                await self._wake.wait()
+            finally:
+                timer.cancel()
+
+    def _delivery_done(self, task: asyncio.Task) -> None:
+        """Free the task's slot and let the worker claim more."""
+        self._in_flight.discard(task)
+        self._wake.set()
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Outbox delivery crashed: {task.exception()}")
+
+    async def _take_tokens(self, chat_id: int) -> None:
+        """Wait until both the chat's and the shared bucket allow a send."""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        while True:
+            now = time.monotonic()
+            wait = max(bucket.wait_time(now), self._global_bucket.wait_time(now))
+            if wait <= 0:
+                bucket.take()
+                self._global_bucket.take()
+                return
+            await asyncio.sleep(wait)
+
+    async def _claim_followers(self, delivery: Dict) -> List[Dict]:
+        """Claim the replies queued behind a claimed one that fit beside it."""
+        following = await self._store.get_following_deliveries(
+            delivery['chat_id'], delivery['id'], COALESCE_MAX_MESSAGES
+        )
+        count = coalesce_count([delivery['text']] + [f['text'] for f in following]) - 1
+        return await self._store.claim_delivery_ids([f['id'] for f in following[:count]])
+
+    async def _deliver(self, delivery: Dict) -> None:
+        """Send one claimed message, joined with any queued behind it, and
+        record the outcome.
+
+        Any error, not only a failed send, puts the claimed messages back
+        in the outbox (or fails them), so none is left sending and blocking
+        its chat's later replies.
+        """
+        deliveries = [delivery]
+        settled: Set[int] = set()
+        try:
+            await self._send_claimed(deliveries, settled)
+        except Exception as e:
+            print(f"Outbox delivery crashed: {e}")
+            for unsettled in deliveries:
+                if unsettled['id'] not in settled:
+                    await self._release(unsettled, e, backoff_delay(unsettled['attempts']))
+
+    async def _send_claimed(self, deliveries: List[Dict], settled: Set[int]) -> None:
+        """Send claimed messages as one, adding the followers it claims to
+        deliveries and the IDs whose outcome is recorded to settled."""
+        delivery = deliveries[0]
+        chat_id = delivery['chat_id']
+        if self.coalesce_window > 0:
+            last_sent = self._last_sent.get(chat_id)
+            if last_sent is not None and time.monotonic() - last_sent < self.coalesce_window:
+                # The agent is replying in a burst; let its next replies queue up
+                await asyncio.sleep(self.coalesce_window)
+            deliveries += await self._claim_followers(delivery)
+
+        await self._take_tokens(chat_id)
+        try:
+            message = await self.bot.send_message(
+                chat_id=chat_id, text=join_messages([d['text'] for d in deliveries])
+            )
+        except Exception as e:
+            for failed in deliveries:
+                await self._record_failure(failed, e)
+                settled.add(failed['id'])
+            return
+
+        self._last_sent[chat_id] = time.monotonic()
+        for sent in deliveries:
+            await self._store.complete_delivery(sent['id'], message.message_id)
+            settled.add(sent['id'])
+            self._settle(sent['id'], message_id=message.message_id)
+        self.sent += len(deliveries)
+        self.coalesced += len(deliveries) - 1
+
+    async def _record_failure(self, delivery: Dict, error: Exception) -> None:
+        """Schedule a retry for a message whose send failed, or fail it."""
+        delay = retry_delay(error, delivery['attempts'])
+        if isinstance(error, RetryAfter):
+            self._chat_buckets[delivery['chat_id']].block(delay)
+        await self._release(delivery, error, delay)
+
+    async def _release(self, delivery: Dict, error: Exception,
+                       delay: Optional[float]) -> None:
+        """Put a claimed message back in the outbox after delay, or fail it
+        if delay is None or it is out of attempts.
+
+        If even that cannot be stored, its waiting client is told it
+        failed; the row is requeued when the bot next starts.
+        """
+        row_id = delivery['id']
+        try:
+            if delay is not None and delivery['attempts'] < self.max_attempts:
+                await self._store.retry_delivery(row_id, str(error), delay)
+                self.retried += 1
+                return
+            await self._store.fail_delivery(row_id, str(error))
+            self.failed += 1
+        except Exception as e:
+            print(f"Could not record outbox message {row_id}: {e}")
+        self._settle(row_id, error=str(error))
+
+    def _settle(self, row_id: int, message_id: Optional[int] = None,
+                error: Optional[str] = None) -> None:
+        """Wake the client waiting for a message, if any."""
+        future = self._waiters.get(row_id)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(message_id)
+        else:
+            future.set_exception(DeliveryError(error))
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handle one client connection until it closes."""
+        self._clients.add(writer)
+        pending: Set[asyncio.Task] = set()
+        write_lock = asyncio.Lock()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._answer(line, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            # Client finished writing; reply to everything it sent
+            if pending:
+                await asyncio.gather(*pending)
+        except ConnectionError:
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+            self._clients.discard(writer)
+
+    async def _answer(self, line: bytes, writer: asyncio.StreamWriter,
+                      write_lock: asyncio.Lock) -> None:
+        """Queue one requested message and write its outcome as a reply line."""
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            message_id = await self.send(int(request['chat_id']), str(request['text']),
+                                         timeout=WAIT_SECONDS)
+            reply = {'id': request_id, 'ok': True, 'message_id': message_id}
+            if message_id is None:
+                reply['queued'] = True
+        except Exception as e:
+            reply = {'id': request_id, 'ok': False, 'error': str(e)}
+        async with write_lock:
+            writer.write(json.dumps(reply).encode() + b"\n")
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
@@ -0,0 +1,276 @@
+"""Queue watcher daemon: starts processing as soon as messages are queued.
+
+Every write that makes a message ready for processing sends a datagram to
+the database's notification socket (see database.notify_socket_path). The
+watcher blocks on that socket and wakes the processing runner within
+milliseconds, replacing the 5-minute cron poll. A low-frequency sweep
+still checks the queue in case a notification was lost (e.g. the watcher
+was restarted), and latency metrics are written to a JSON file.
+
+The bot runs a watcher over its own dispatcher, so one process owns the
+runner. Run this daemon only where the bot does not run; it will not start
+while another watcher listens on the socket.
+
+Usage: python src/queue_watcher.py
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from async_database import close_async_stores, get_async_store
+from database import notify_socket_path
+from dispatcher import ProcessingDispatcher
+
+
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "/root/workspace")
+DB_PATH = os.path.join(WORKSPACE_DIR, "telegram_bot", "messages.db")
+METRICS_PATH = os.path.join(WORKSPACE_DIR, "telegram_bot", "queue_watcher_metrics.json")
+PID_PATH = os.path.join(WORKSPACE_DIR, ".queue-watcher.pid")
+
+SWEEP_SECONDS = float(os.getenv("QUEUE_WATCHER_SWEEP_SECONDS", "60"))
+DEBOUNCE_SECONDS = float(os.getenv("QUEUE_WATCHER_DEBOUNCE_SECONDS", "0.05"))
+
+# Latency samples kept for percentiles
+LATENCY_WINDOW = 1000
+# Minimum seconds between metrics file writes
+METRICS_INTERVAL = 1.0
+
+
+class WatcherRunningError(RuntimeError):
+    """Another watcher is already listening for this database."""
+
+
+def _listening(socket_path: str) -> bool:
+    """Whether a live process is bound to a datagram socket path."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+class QueueWatcher:
+    """Wakes the processing runner on queue notifications and sweeps."""
+
+    def __init__(
+        self,
+        db_path: str,
+        dispatcher: ProcessingDispatcher,
+        sweep_seconds: float = SWEEP_SECONDS,
+        metrics_path: Optional[str] = None,
+        pid_path: Optional[str] = None
+    ):
+        """Create a watcher for a messages database.
+
+        Args:
+            db_path: Path to SQLite database file
+            dispatcher: Dispatcher that wakes the runner; started and
+                stopped with the watcher
+            sweep_seconds: Seconds between fallback queue checks
+            metrics_path: JSON file to keep metrics in (optional)
+            pid_path: File to hold this process's PID while watching, so
+                poll-telegram.sh stands down (optional)
+        """
+        self.db_path = db_path
+        self.dispatcher = dispatcher
+        self.sweep_seconds = sweep_seconds
+        self.metrics_path = metrics_path
+        self.pid_path = pid_path
+        self.socket_path = notify_socket_path(db_path)
+        self._store = get_async_store(db_path)
+        self._socket: Optional[socket.socket] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+        # Insert times of notifications not yet followed by a wake-up
+        self._pending: List[float] = []
+        self._notify_latency: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._wake_latency: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._metrics_written = 0.0
+        self.notifications = 0
+        self.sweeps = 0
+        self.sweep_hits = 0
+
+    async def start(self) -> None:
+        """Listen on the notification socket and start sweeping.
+
+        Raises:
+            WatcherRunningError: If another watcher listens on the socket
+        """
+        if os.path.exists(self.socket_path):
+            if _listening(self.socket_path):
+                raise WatcherRunningError(
+                    f"A queue watcher is already listening on {self.socket_path}"
+                )
+            os.unlink(self.socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(self.socket_path)
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._on_readable)
+
+        await self.dispatcher.start()
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+        if self.pid_path is not None:
+            with open(self.pid_path, "w") as f:
+                f.write(str(os.getpid()))
+
+    async def stop(self) -> None:
+        """Stop listening and sweeping, and stop the runner."""
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        if self._socket is not None:
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        await self.dispatcher.stop()
+        self.write_metrics(force=True)
+        if self.pid_path is not None and os.path.exists(self.pid_path):
+            os.unlink(self.pid_path)
+
+    def on_wake(self) -> None:
+        """Record insert-to-wake latency for notifications just served."""
+        now = time.time()
+        self._wake_latency.extend(now - sent for sent in self._pending)
+        self._pending.clear()
+        self.write_metrics()
+
+    def _on_readable(self) -> None:
+        """Drain queued notifications and trigger one wake-up."""
+        received = 0
+        while True:
+            try:
+                data = self._socket.recv(64)
+            except (BlockingIOError, InterruptedError):
+                break
+            received += 1
+            try:
+                sent = float(data)
+            except ValueError:
+                continue
+            self._pending.append(sent)
+            self._notify_latency.append(time.time() - sent)
+
+        if received:
+            self.notifications += received
+            self.dispatcher.trigger()
+
+    async def _sweep_loop(self) -> None:
+        """Periodically check the queue in case a notification was missed."""
+        while True:
+            await self.sweep()
+            await asyncio.sleep(self.sweep_seconds)
+
+    async def sweep(self) -> int:
+        """Check the queue once and wake the runner if anything is waiting.
+
+        Returns:
+            Number of messages ready for processing
+        """
+        self.sweeps += 1
+        count = await self._store.count_unprocessed()
+        if count:
+            self.sweep_hits += 1
+            self.dispatcher.trigger()
+        self.write_metrics()
+        return count
+
+    def metrics(self) -> Dict:
+        """Return counters and latency percentiles in milliseconds."""
+        return {
+            'pid': os.getpid(),
+            'notifications': self.notifications,
+            'sweeps': self.sweeps,
+            'sweep_hits': self.sweep_hits,
+            'notify_latency_ms': _percentiles(self._notify_latency),
+            'wake_latency_ms': _percentiles(self._wake_latency),
+            'dispatcher': self.dispatcher.stats(),
+            'updated_at': time.time(),
+        }
+
+    def write_metrics(self, force: bool = False) -> None:
+        """Write metrics to metrics_path, at most once per METRICS_INTERVAL."""
+        if self.metrics_path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._metrics_written < METRICS_INTERVAL:
+            return
+        self._metrics_written = now
+        tmp_path = self.metrics_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.metrics(), f, indent=2)
+        os.replace(tmp_path, self.metrics_path)
+
+
+def _percentiles(samples: Deque[float]) -> Dict:
+    """Summarize latency samples (seconds) as p50/p95/max milliseconds."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50': statistics.median(ordered) * 1000,
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'max': ordered[-1] * 1000,
+    }
+
+
+def build_dispatcher(script_path: Optional[str] = None) -> ProcessingDispatcher:
+    """Create the dispatcher a watcher wakes the processing runner with.
+
+    Used by this daemon and by the bot, so the runner wakes within
+    DEBOUNCE_SECONDS of an insert whichever process owns it.
+
+    Args:
+        script_path: Runner script (default: scripts/telegram-process.sh)
+
+    Returns:
+        Dispatcher, not yet started
+    """
+    return ProcessingDispatcher(
+        script_path or os.path.join(WORKSPACE_DIR, "scripts", "telegram-process.sh"),
+        debounce=DEBOUNCE_SECONDS
+    )
+
+
+async def run() -> None:
+    """Run the watcher until SIGINT or SIGTERM."""
+    dispatcher = build_dispatcher()
+    watcher = QueueWatcher(DB_PATH, dispatcher, metrics_path=METRICS_PATH, pid_path=PID_PATH)
+    dispatcher.on_wake = watcher.on_wake
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await watcher.start()
+    except WatcherRunningError as e:
+        print(f"{e}; not starting a second runner")
+        await close_async_stores()
+        return
+    print(f"Queue watcher listening on {watcher.socket_path}")
+    try:
+        await stop.wait()
+    finally:
+        await watcher.stop()
+        await close_async_stores()
+
+
+def main():
+    """Main entry point for CLI."""
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
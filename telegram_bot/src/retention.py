@@ -0,0 +1,272 @@
+"""Retention for the messages database: archive old rows, prune voice files.
+
+Processed messages older than MESSAGE_RETENTION_DAYS move to one SQLite
+archive per month (archive/messages-YYYY-MM.db, same columns as the hot
+table) and are deleted from messages.db together with their finished
+transcription jobs. Their voice files are deleted, or moved next to the
+archive with VOICE_RETENTION_MODE=archive. Freed pages are then returned to
+the filesystem with incremental vacuum, so the hot database, its scans and
+its backups stay proportional to recent traffic.
+
+Usage: python src/retention.py [--days N] [--dry-run]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from database import get_db_connection, init_db
+
+
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "/root/workspace")
+DB_PATH = os.path.join(WORKSPACE_DIR, "telegram_bot", "messages.db")
+ARCHIVE_DIR = os.getenv(
+    "MESSAGE_ARCHIVE_DIR", os.path.join(WORKSPACE_DIR, "telegram_bot", "archive")
+)
+
+RETENTION_DAYS = float(os.getenv("MESSAGE_RETENTION_DAYS", "30"))
+# "delete" removes voice files of archived messages; "archive" moves them
+# to ARCHIVE_DIR/voice/YYYY-MM/ (Opus audio gains nothing from gzip)
+VOICE_RETENTION_MODE = os.getenv("VOICE_RETENTION_MODE", "delete")
+
+# Rows moved per transaction, so the bot never waits long on the write lock
+BATCH_SIZE = 1000
+
+# Finished messages only: outgoing replies that left the outbox (delivered
+# or failed; NULL on rows from before it), and incoming messages the agent
+# has processed (their transcription is done by then)
+_FINISHED_SQL = """
+    ((direction = 'outgoing' AND COALESCE(delivery_status, 'delivered') IN ('delivered', 'failed'))
+     OR (direction = 'incoming' AND processed = 1))
+"""
+
+_SELECT_MONTHS_SQL = f"""
+    SELECT DISTINCT strftime('%Y-%m', created_at)
+    FROM messages
+    WHERE {_FINISHED_SQL} AND created_at < ?
+    ORDER BY 1
+"""
+
+_SELECT_BATCH_SQL = f"""
+    SELECT id, voice_file_path
+    FROM messages
+    WHERE {_FINISHED_SQL} AND created_at < ?
+      AND strftime('%Y-%m', created_at) = ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+_DELETE_JOBS_SQL = """
+    DELETE FROM transcription_jobs
+    WHERE message_row_id IN (SELECT value FROM json_each(?))
+"""
+
+_DELETE_MESSAGES_SQL = "DELETE FROM messages WHERE id IN (SELECT value FROM json_each(?))"
+
+
+def archive_path(archive_dir: str, month: str) -> str:
+    """Archive database for one month.
+
+    Args:
+        archive_dir: Directory holding the archives
+        month: Month as YYYY-MM
+
+    Returns:
+        Path to the month's archive database
+    """
+    return os.path.join(archive_dir, f"messages-{month}.db")
+
+
+def ensure_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """Switch a database to incremental auto-vacuum if it is not already.
+
+    Changing the mode on a database that has tables needs one full VACUUM,
+    so this is slow once and a no-op afterwards.
+
+    Args:
+        conn: Connection to the database (outside a transaction)
+
+    Returns:
+        True if the database was converted
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def _prepare_archive(conn: sqlite3.Connection) -> List[str]:
+    """Create the attached archive's messages table to match the hot one.
+
+    Columns added to the hot table since an archive was created are added
+    to the archive too.
+
+    Returns:
+        Column names to copy
+    """
+    schema = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'messages'"
+    ).fetchone()[0]
+    conn.execute(schema.replace(
+        "CREATE TABLE messages", "CREATE TABLE IF NOT EXISTS archive.messages", 1
+    ))
+
+    columns = [(row[1], row[2]) for row in conn.execute("PRAGMA main.table_info(messages)")]
+    archived = {row[1] for row in conn.execute("PRAGMA archive.table_info(messages)")}
+    for name, declared_type in columns:
+        if name not in archived:
+            conn.execute(f"ALTER TABLE archive.messages ADD COLUMN {name} {declared_type}")
+    return [name for name, _ in columns]
+
+
+def _voice_archive_path(archive_dir: str, month: str, voice_file_path: str) -> str:
+    """Where an archived message's voice file is moved in archive mode."""
+    return os.path.join(archive_dir, "voice", month, os.path.basename(voice_file_path))
+
+
+def _archive_month(
+    conn: sqlite3.Connection,
+    archive_dir: str,
+    month: str,
+    cutoff: str,
+    voice_mode: str
+) -> Tuple[int, List[str]]:
+    """Move one month of finished messages into its archive database.
+
+    Returns:
+        Number of rows archived and the voice files they referenced
+    """
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(archive_dir, month),))
+    try:
+        column_list = ", ".join(_prepare_archive(conn))
+        copy_sql = f"""
+            INSERT OR IGNORE INTO archive.messages ({column_list})
+            SELECT {column_list} FROM main.messages
+            WHERE id IN (SELECT value FROM json_each(?))
+        """
+        archived = 0
+        voice_files: List[str] = []
+        while True:
+            rows = conn.execute(_SELECT_BATCH_SQL, (cutoff, month, BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            ids = json.dumps([row[0] for row in rows])
+            voice_rows = [(row[0], row[1]) for row in rows if row[1]]
+            with conn:
+                conn.execute(copy_sql, (ids,))
+                if voice_mode == "archive":
+                    # Archived rows point at where their audio is moved
+                    conn.executemany(
+                        "UPDATE archive.messages SET voice_file_path = ? WHERE id = ?",
+                        [(_voice_archive_path(archive_dir, month, path), row_id)
+                         for row_id, path in voice_rows]
+                    )
+                conn.execute(_DELETE_JOBS_SQL, (ids,))
+                conn.execute(_DELETE_MESSAGES_SQL, (ids,))
+            archived += len(rows)
+            voice_files.extend(path for _, path in voice_rows)
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    return archived, voice_files
+
+
+def _prune_voice_files(voice_files: List[str], archive_dir: str, month: str,
+                       voice_mode: str) -> int:
+    """Delete or move archived messages' voice files.
+
+    Returns:
+        Number of files removed from the voice directory
+    """
+    pruned = 0
+    for path in voice_files:
+        try:
+            if voice_mode == "archive":
+                target = _voice_archive_path(archive_dir, month, path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        pruned += 1
+    return pruned
+
+
+def run_retention(
+    db_path: str,
+    archive_dir: str = ARCHIVE_DIR,
+    retention_days: float = RETENTION_DAYS,
+    voice_mode: str = VOICE_RETENTION_MODE,
+    dry_run: bool = False
+) -> Dict:
+    """Archive old finished messages, prune their voice files and compact.
+
+    Safe to run while the bot is up: rows move in short transactions, and
+    unprocessed messages are never touched.
+
+    Args:
+        db_path: Path to SQLite database file
+        archive_dir: Directory for monthly archive databases
+        retention_days: Finished messages older than this are archived
+        voice_mode: "delete" or "archive" for the messages' voice files
+        dry_run: Only report which months would be archived
+
+    Returns:
+        Dictionary with months, archived, voice_files and pages_freed
+    """
+    if voice_mode not in ("delete", "archive"):
+        raise ValueError(f"Unknown voice retention mode: {voice_mode}")
+
+    init_db(db_path)
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db_connection(db_path)
+    stats = {'months': [], 'archived': 0, 'voice_files': 0, 'pages_freed': 0}
+    try:
+        months = [row[0] for row in conn.execute(_SELECT_MONTHS_SQL, (cutoff,))]
+        stats['months'] = months
+        if dry_run:
+            return stats
+
+        if months:
+            os.makedirs(archive_dir, exist_ok=True)
+        for month in months:
+            archived, voice_files = _archive_month(conn, archive_dir, month, cutoff, voice_mode)
+            stats['archived'] += archived
+            stats['voice_files'] += _prune_voice_files(voice_files, archive_dir, month, voice_mode)
+
+        ensure_incremental_vacuum(conn)
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript steps the pragma to completion; execute() would
+        # free a single page
+        conn.executescript("PRAGMA incremental_vacuum;")
+        stats['pages_freed'] = free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # Shrink the WAL too, so backups copy only the compacted file
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    finally:
+        conn.close()
+    return stats
+
+
+def main():
+    """Main entry point for CLI."""
+    parser = argparse.ArgumentParser(description="Archive old messages and compact messages.db")
+    parser.add_argument("--days", type=float, default=RETENTION_DAYS,
+                        help="Archive finished messages older than this many days")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only list the months that would be archived")
+    args = parser.parse_args()
+
+    stats = run_retention(DB_PATH, retention_days=args.days, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"Would archive months: {', '.join(stats['months']) or 'none'}")
+    else:
+        print(f"Archived {stats['archived']} message(s) from {len(stats['months'])} month(s), "
+              f"pruned {stats['voice_files']} voice file(s), freed {stats['pages_freed']} page(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Energy-based speech detection for trimming silence before inference.
+
+Voice notes often open and close with silence or background noise, and
+Whisper spends as much compute on those seconds as on speech. speech_spans
+finds the speech in decoded audio from short-frame loudness, measured
+against the recording's own noise floor so a noisy room is not mistaken
+for speech. keep_speech cuts the audio down to those spans, and
+restore_time maps timestamps in the trimmed audio back onto the original.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+
+SAMPLE_RATE = 16000
+
+FRAME_SECONDS = 0.03
+# Frames this far above the noise floor (and below the loudest frames)
+# count as speech
+SPEECH_MARGIN_DB = 12.0
+# Frames quieter than this are silence whatever the noise floor
+SILENCE_DB = -55.0
+# Percentiles of frame loudness taken as the noise floor and as speech level
+NOISE_PERCENTILE = 10
+LOUD_PERCENTILE = 95
+# Pauses shorter than this stay inside a span
+MIN_SILENCE_SECONDS = 0.5
+# Louder bursts shorter than this are dropped as clicks
+MIN_SPEECH_SECONDS = 0.25
+# Kept around every span so word onsets and endings are not clipped
+PAD_SECONDS = 0.2
+
+Span = Tuple[int, int]
+
+
+def frame_levels(audio: np.ndarray, frame_size: int) -> np.ndarray:
+    """Loudness of consecutive frames in dBFS (the last frame zero-padded)."""
+    frames = -(-len(audio) // frame_size)
+    padded = np.zeros(frames * frame_size, dtype=np.float32)
+    padded[:len(audio)] = audio
+    rms = np.sqrt(np.mean(np.square(padded.reshape(frames, frame_size)), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_spans(audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> List[Span]:
+    """Find the parts of a recording that contain speech.
+
+    A recording that is noise throughout has no quiet floor to compare
+    against, so all of it is kept rather than risking speech.
+
+    Args:
+        audio: Float32 samples in [-1, 1]
+        sample_rate: Samples per second
+
+    Returns:
+        Sorted, non-overlapping (start, end) sample ranges; empty if the
+        recording is silent
+    """
+    frame_size = int(FRAME_SECONDS * sample_rate)
+    if len(audio) == 0:
+        return []
+
+    levels = frame_levels(audio, frame_size)
+    floor, loud = np.percentile(levels, [NOISE_PERCENTILE, LOUD_PERCENTILE])
+    threshold = max(SILENCE_DB, min(floor + SPEECH_MARGIN_DB, loud - SPEECH_MARGIN_DB))
+    voiced = np.concatenate(([0], (levels > threshold).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(voiced))
+
+    # Runs of voiced frames, joined across short pauses
+    runs: List[List[int]] = []
+    min_gap = MIN_SILENCE_SECONDS / FRAME_SECONDS
+    for start, end in zip(edges[::2], edges[1::2]):
+        if runs and start - runs[-1][1] < min_gap:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end])
+
+    spans: List[Span] = []
+    pad = int(PAD_SECONDS * sample_rate)
+    for start, end in runs:
+        if (end - start) * FRAME_SECONDS < MIN_SPEECH_SECONDS:
+            continue
+        first = max(0, int(start) * frame_size - pad)
+        last = min(len(audio), int(end) * frame_size + pad)
+        if spans and first <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], last)
+        else:
+            spans.append((first, last))
+    return spans
+
+
+def keep_speech(audio: np.ndarray, spans: List[Span]) -> np.ndarray:
+    """Join the speech spans of a recording, dropping everything else."""
+    if spans == [(0, len(audio))]:
+        return audio
+    return np.concatenate([audio[start:end] for start, end in spans])
+
+
+def restore_time(seconds: float, spans: List[Span], sample_rate: int = SAMPLE_RATE,
+                 is_end: bool = False) -> float:
+    """Map a time in audio trimmed by keep_speech back onto the original.
+
+    Args:
+        seconds: Time in the trimmed audio
+        spans: Spans the trimmed audio was cut from
+        sample_rate: Samples per second
+        is_end: The time ends a segment; at a joint between spans it maps
+            to the end of the earlier span rather than the start of the next
+
+    Returns:
+        Time in the original recording, in seconds
+    """
+    sample = seconds * sample_rate
+    offset = 0
+    for start, end in spans:
+        length = end - start
+        if sample < offset + length or (is_end and sample <= offset + length):
+            return (start + sample - offset) / sample_rate
+        offset += length
+    return spans[-1][1] / sample_rate if spans else seconds
@@ -0,0 +1,148 @@
+"""Content-addressed cache of voice transcriptions.
+
+Transcripts are keyed by the SHA-256 of the audio file and the Whisper
+configuration that produced them, so a forwarded or re-sent voice note is
+answered from the messages database without decoding or inference. A
+configuration change (model, beam size, VAD) naturally misses the cache.
+Transcripts made in a chat's pinned language are kept apart from detected
+ones, and primed transcripts are keyed by their initial prompt, so one
+chat's history never shapes the transcript another chat is served.
+"""
+import hashlib
+import os
+from typing import Dict, Optional
+
+from async_database import get_async_store
+from whisper_config import WhisperConfig
+
+
+CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("TRANSCRIPTION_CACHE_MAX_AGE_DAYS", "90"))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_audio(audio_path: str) -> str:
+    """Hash an audio file's contents.
+
+    Args:
+        audio_path: Path to the audio file
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with open(audio_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_audio_bytes(audio: bytes) -> str:
+    """Hash audio held in memory; matches hash_audio of the same file.
+
+    Args:
+        audio: Audio file contents
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    return hashlib.sha256(audio).hexdigest()
+
+
+def config_key(config: WhisperConfig) -> str:
+    """Identify the settings that affect transcription output.
+
+    Threading and worker counts change speed, not text, so they are left
+    out and tuning them keeps the cache warm.
+
+    Args:
+        config: Whisper configuration
+
+    Returns:
+        Stable key string
+    """
+    fields = (config.model_size, config.compute_type, config.beam_size, config.vad_filter)
+    # Only marked when on, so keys cached before silence trimming stay valid
+    if config.trim_silence and not config.vad_filter:
+        fields += ("trim",)
+    return "|".join(str(value) for value in fields)
+
+
+class TranscriptionCache:
+    """Looks up and trims cached transcripts, counting hits and misses."""
+
+    def __init__(
+        self,
+        db_path: str,
+        config: WhisperConfig,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_age_days: float = CACHE_MAX_AGE_DAYS
+    ):
+        """Create a cache for a messages database.
+
+        Args:
+            db_path: Path to SQLite database file
+            config: Configuration transcripts are produced with
+            max_entries: Entries kept after eviction
+            max_age_days: Entries unused for longer than this are evicted
+        """
+        self.key = config_key(config)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self._store = get_async_store(db_path)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def key_for(self, language: Optional[str] = None,
+                initial_prompt: Optional[str] = None) -> str:
+        """Cache key for transcripts made in a pinned language (or detected)
+        and with an initial prompt (or none)."""
+        key = f"{self.key}|{language}" if language else self.key
+        if initial_prompt:
+            key += "|prompt=" + hashlib.sha256(initial_prompt.encode()).hexdigest()[:16]
+        return key
+
+    async def lookup(self, audio_hash: str, language: Optional[str] = None,
+                     initial_prompt: Optional[str] = None) -> Optional[str]:
+        """Return the cached transcript for an audio hash, or None.
+
+        Args:
+            audio_hash: Digest from hash_audio()
+            language: Language the chat has pinned, if any
+            initial_prompt: Prompt the chat primes transcription with, if any
+
+        Returns:
+            Transcription text on a hit
+        """
+        transcription = await self._store.get_cached_transcription(
+            audio_hash, self.key_for(language, initial_prompt)
+        )
+        if transcription is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return transcription
+
+    async def evict(self) -> int:
+        """Apply the age and size limits.
+
+        Returns:
+            Number of entries removed
+        """
+        removed = await self._store.evict_transcription_cache(
+            self.max_entries, self.max_age_days
+        )
+        self.evicted += removed
+        return removed
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters since startup."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
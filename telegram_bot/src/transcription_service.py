@@ -0,0 +1,451 @@
+"""Background transcription service backed by a process pool.
+
+Voice messages are stored immediately and queued in the transcription_jobs
+table. The service claims pending jobs, runs transcribe_voice in worker
+processes (each loads its own WhisperModel once) and writes transcripts
+back to the message row. Long voice notes get partial transcripts written
+while they decode, so processing can start before the final transcript
+replaces them. Jobs survive restarts: anything left running by a crashed
+bot is requeued on start.
+
+A job enqueued with the downloaded audio hands those bytes to its worker,
+which decodes them from memory; the voice file is only read back when a
+job is retried or resumed after a restart.
+
+When a real backlog builds up (say, after downtime), workers take several
+jobs at once and transcribe them with transcribe_batch, which shares
+inference between short clips. Only jobs of one chat in its pinned
+language are batched together; everything else runs one job at a time.
+
+Jobs carry the language and initial prompt of their chat's settings (see
+chat_settings.py), which are passed on to the model.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from async_database import get_async_store
+from database import set_partial_transcription
+from transcription_cache import TranscriptionCache
+import voice_transcription
+from voice_transcription import TranscriptionResult, transcribe_batch, transcribe_voice
+
+
+CPU_COUNT = os.cpu_count() or 1
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", str(min(4, CPU_COUNT))))
+MAX_ATTEMPTS = 2
+# Jobs a worker takes at once while there is a backlog; 1 disables batching
+BATCH_SIZE = int(os.getenv("TRANSCRIPTION_BATCH_SIZE", "8"))
+# Pending jobs from which there counts as a backlog, so a burst of a few
+# voice notes is still transcribed one by one
+BATCH_BACKLOG = int(os.getenv("TRANSCRIPTION_BATCH_BACKLOG", "16"))
+
+# Load and warm up the model in every worker at startup
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "1") == "1"
+
+# Seconds between partial transcript writes while a job decodes; notes
+# that finish sooner never get a partial. 0 disables partial transcripts.
+PARTIAL_INTERVAL = float(os.getenv("TRANSCRIPTION_PARTIAL_INTERVAL", "5"))
+
+CompletionCallback = Callable[[Dict, TranscriptionResult], Awaitable[None]]
+PartialCallback = Callable[[Dict], Awaitable[None]]
+
+# This worker process's queue for job IDs with a new partial transcript,
+# read by the service in the bot; set by _init_worker
+_partial_queue = None
+
+
+def _init_worker(cpu_threads: int, preload: bool, partial_queue=None,
+                 profile: Optional[str] = None) -> None:
+    """Prepare a worker process: split cores between workers, load the model.
+
+    Args:
+        cpu_threads: Inference threads this worker may use
+        preload: Load and warm up the model before accepting jobs
+        partial_queue: Queue to report partial transcripts on
+        profile: Whisper profile the bot resolved (e.g. for
+            WHISPER_PROFILE=auto), so workers do not choose again
+    """
+    global _partial_queue
+
+    _partial_queue = partial_queue
+    os.environ.setdefault("WHISPER_CPU_THREADS", str(cpu_threads))
+    if profile is not None:
+        os.environ["WHISPER_PROFILE"] = profile
+    if preload:
+        voice_transcription.warm_up_model()
+
+
+def _worker_warmup_status() -> Dict:
+    """Report this worker's warm-up timings (runs after _init_worker)."""
+    return voice_transcription.warm_up_model()
+
+
+def transcribe_job(
+    db_path: str,
+    job_id: int,
+    voice_file_path: str,
+    partial_interval: float = PARTIAL_INTERVAL,
+    audio: Optional[bytes] = None,
+    options: Optional[Dict] = None,
+    partial_queue=None
+) -> TranscriptionResult:
+    """Transcribe a job's voice file, persisting partial transcripts.
+
+    Runs in a worker. Every partial_interval seconds the segments decoded
+    so far are written to the message and the job ID is reported on the
+    partial queue.
+
+    Args:
+        db_path: Path to SQLite database file
+        job_id: Running transcription job ID
+        voice_file_path: Path to the voice file
+        partial_interval: Seconds between partial writes (0 disables)
+        audio: Contents of the voice file, decoded instead of reading it
+        options: language and initial_prompt for transcribe_voice
+        partial_queue: Queue to report partial transcripts on (default:
+            the one _init_worker gave this worker process)
+
+    Returns:
+        TranscriptionResult from transcribe_voice
+    """
+    if partial_queue is None:
+        partial_queue = _partial_queue
+    voice_file = audio if audio is not None else voice_file_path
+    options = options or {}
+    if partial_interval <= 0:
+        return transcribe_voice(voice_file, **options)
+
+    last_write = time.monotonic()
+
+    def on_partial(text: str) -> None:
+        nonlocal last_write
+        now = time.monotonic()
+        if now - last_write < partial_interval:
+            return
+        last_write = now
+        set_partial_transcription(db_path, job_id, text)
+        if partial_queue is not None:
+            partial_queue.put(job_id)
+
+    return transcribe_voice(voice_file, on_partial=on_partial, **options)
+
+
+def _job_options(job: Dict) -> Dict:
+    """transcribe_voice arguments for the chat settings stored on a job."""
+    return {name: job[name] for name in ('language', 'initial_prompt') if job.get(name)}
+
+
+class TranscriptionService:
+    """Drains the transcription job queue on a pool of worker processes."""
+
+    def __init__(
+        self,
+        db_path: str,
+        workers: int = TRANSCRIPTION_WORKERS,
+        on_complete: Optional[CompletionCallback] = None,
+        executor: Optional[Executor] = None,
+        cache: Optional[TranscriptionCache] = None,
+        on_partial: Optional[PartialCallback] = None,
+        partial_interval: float = PARTIAL_INTERVAL,
+        batch_size: int = BATCH_SIZE,
+        batch_backlog: int = BATCH_BACKLOG
+    ):
+        """Create a service for a messages database.
+
+        Args:
+            db_path: Path to SQLite database file
+            workers: Number of worker processes (jobs run in parallel)
+            on_complete: Awaited with (job, result) once a job is done or
+                has failed for good
+            executor: Executor to use instead of a process pool
+            cache: Transcription cache that finished jobs are added to
+            on_partial: Awaited with the job whenever a partial transcript
+                has been stored
+            partial_interval: Seconds between partial transcript writes
+            batch_size: Jobs a worker takes at once while there is a
+                backlog (batched jobs get no partial transcripts)
+            batch_backlog: Pending jobs from which workers batch
+        """
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self._on_complete = on_complete
+        self._executor = executor
+        self.cache = cache
+        self._on_partial = on_partial
+        self.partial_interval = partial_interval
+        self.batch_size = max(1, batch_size)
+        self.batch_backlog = batch_backlog
+        self._store = get_async_store(db_path)
+        self._running: Set[asyncio.Task] = set()
+        # Downloaded audio of queued jobs, by message row ID
+        self._audio: Dict[int, bytes] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._partials = None
+        self._profile: Optional[str] = None
+        # Passed to each job when jobs do not run in pool workers
+        self._job_partials: Optional[queue.Queue] = None
+        self._partial_task: Optional[asyncio.Task] = None
+        self.model_status: Dict = {'state': 'cold'}
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        """Create worker processes, splitting cores evenly between them."""
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(max(1, CPU_COUNT // self.workers), WHISPER_PRELOAD, self._partials,
+                      self._profile)
+        )
+
+    async def start(self) -> None:
+        """Start worker processes and resume any unfinished jobs."""
+        if self._executor is None:
+            # Resolve WHISPER_PROFILE=auto once here and hand the choice to
+            # workers, whose own thread count would not match its cache key
+            self._profile = await asyncio.get_running_loop().run_in_executor(
+                None, voice_transcription.resolve_profile
+            )
+            self._partials = multiprocessing.get_context("spawn").Queue()
+            self._executor = self._create_pool()
+        else:
+            # A caller-supplied executor runs no initializer; jobs get the
+            # queue as an argument instead
+            self._partials = self._job_partials = queue.Queue()
+
+        requeued = await self._store.requeue_transcription_jobs()
+        if requeued:
+            print(f"Requeued {requeued} interrupted transcription job(s)")
+
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._loop_task = asyncio.create_task(self._dispatch_loop())
+        self._partial_task = asyncio.create_task(self._partial_loop())
+
+    async def stop(self) -> None:
+        """Stop dispatching and shut down workers.
+
+        Jobs still running stay marked running and are requeued next start.
+        """
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        if self._partial_task is not None:
+            self._partials.put(None)  # unblock the reader thread
+            self._partial_task.cancel()
+            self._partial_task = None
+        for task in list(self._running):
+            task.cancel()
+        self._audio.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def warm_up(self) -> Dict:
+        """Start every worker and wait until each has a warm model.
+
+        Progress is visible through model_status while this runs.
+
+        Returns:
+            model_status: state ('warming', 'ready' or 'failed'),
+            warmup_seconds (wall time until all workers were ready),
+            load_seconds (slowest worker model load) and workers
+        """
+        self.model_status = {'state': 'warming'}
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            # One call per worker forces the pool to spawn all of them
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self._executor, _worker_warmup_status)
+                for _ in range(self.workers)
+            ))
+        except Exception as e:
+            self.model_status = {'state': 'failed', 'error': str(e)}
+            return self.model_status
+
+        self.model_status = {
+            'state': 'ready',
+            'workers': self.workers,
+            'warmup_seconds': time.perf_counter() - start,
+            'load_seconds': max(r['load_seconds'] for r in results)
+        }
+        return self.model_status
+
+    async def enqueue(
+        self,
+        message_row_id: int,
+        voice_file_path: str,
+        audio_hash: Optional[str] = None,
+        audio: Optional[bytes] = None,
+        language: Optional[str] = None,
+        initial_prompt: Optional[str] = None
+    ) -> int:
+        """Queue a stored voice message and return without waiting.
+
+        Args:
+            message_row_id: Row ID of the voice message in messages
+            voice_file_path: Path to the downloaded voice file
+            audio_hash: Content hash; the transcript is cached under it
+            audio: Downloaded contents of the voice file; the first attempt
+                decodes these, so voice_file_path may still be being written
+            language: Language to transcribe in instead of detecting it
+            initial_prompt: Text to prime the model with
+
+        Returns:
+            Job ID
+        """
+        if audio is not None:
+            # Stored before the job row, which the dispatcher may claim at once
+            self._audio[message_row_id] = audio
+        key = None
+        if self.cache is not None and audio_hash:
+            key = self.cache.key_for(language, initial_prompt)
+        try:
+            job_id = await self._store.enqueue_transcription_job(
+                message_row_id, voice_file_path, audio_hash if key else None, key,
+                language, initial_prompt
+            )
+        except Exception:
+            self._audio.pop(message_row_id, None)
+            raise
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def _dispatch_loop(self) -> None:
+        """Claim jobs whenever work arrives or a worker frees up."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            free = self.workers - len(self._running)
+            if free <= 0:
+                continue
+
+            limit = free
+            if self.batch_size > 1:
+                pending = await self._store.count_pending_transcription_jobs()
+                if pending >= max(self.batch_backlog, free + 1):
+                    limit = free * self.batch_size
+            jobs = await self._store.claim_transcription_jobs(limit)
+
+            # Jobs that cannot share a batch may outnumber the free workers;
+            # the extra ones wait in the pool's queue
+            for batch in self._batches(jobs):
+                if len(batch) == 1:
+                    task = asyncio.create_task(self._run_job(batch[0]))
+                else:
+                    task = asyncio.create_task(self._run_batch(batch))
+                self._running.add(task)
+                task.add_done_callback(self._job_finished)
+
+    def _batches(self, jobs: List[Dict]) -> List[List[Dict]]:
+        """Split claimed jobs into batches of one chat and pinned language.
+
+        Jobs without a pinned language run alone. A chat's jobs are spread
+        evenly over as few batches of at most batch_size as they need.
+        """
+        groups: Dict[tuple, List[Dict]] = {}
+        batches = []
+        for job in jobs:
+            if job.get('language'):
+                groups.setdefault((job['chat_id'], job['language']), []).append(job)
+            else:
+                batches.append([job])
+        for group in groups.values():
+            count = -(-len(group) // self.batch_size)
+            batches += [group[len(group) * i // count:len(group) * (i + 1) // count]
+                        for i in range(count)]
+        return sorted(batches, key=lambda batch: batch[0]['id'])
+
+    async def _partial_loop(self) -> None:
+        """Pass partial transcript notifications from workers to on_partial."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await loop.run_in_executor(None, self._partials.get)
+            if job_id is None:
+                return
+            if self._on_partial is None:
+                continue
+
+            details = await self._store.get_transcription_job(job_id)
+            try:
+                await self._on_partial(details)
+            except Exception as e:
+                print(f"Partial transcript callback failed for job {job_id}: {e}")
+
+    def _job_finished(self, task: asyncio.Task) -> None:
+        """Free the worker slot and look for more work."""
+        self._running.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _execute(self, func, *args):
+        """Run func in the pool, replacing the pool if a worker died."""
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); later jobs get a fresh pool
+            if executor is self._executor:
+                executor.shutdown(wait=False)
+                self._executor = self._create_pool()
+            raise
+
+    async def _run_job(self, job: Dict) -> None:
+        """Transcribe one job in the pool and record the outcome."""
+        audio = self._audio.pop(job['message_row_id'], None)
+        try:
+            result = await self._execute(
+                transcribe_job, self.db_path, job['id'],
+                job['voice_file_path'], self.partial_interval, audio, _job_options(job),
+                self._job_partials
+            )
+        except Exception as e:
+            result = TranscriptionResult(success=False, error=str(e))
+        await self._finish_job(job, result)
+
+    async def _run_batch(self, jobs: List[Dict]) -> None:
+        """Transcribe several jobs in one pool call and record each outcome."""
+        voice_files = []
+        for job in jobs:
+            audio = self._audio.pop(job['message_row_id'], None)
+            voice_files.append(audio if audio is not None else job['voice_file_path'])
+        try:
+            results = await self._execute(
+                transcribe_batch, voice_files, [_job_options(job) for job in jobs]
+            )
+        except Exception as e:
+            results = [TranscriptionResult(success=False, error=str(e)) for _ in jobs]
+        for job, result in zip(jobs, results):
+            await self._finish_job(job, result)
+
+    async def _finish_job(self, job: Dict, result: TranscriptionResult) -> None:
+        """Store a job's transcript or failure and report the outcome."""
+        if result.success:
+            await self._store.complete_transcription_job(
+                job['id'], result.transcription, result.telemetry()
+            )
+            if self.cache is not None:
+                await self.cache.evict()
+        else:
+            final = await self._store.fail_transcription_job(
+                job['id'], result.error, MAX_ATTEMPTS
+            )
+            if not final:
+                return
+
+        if self._on_complete is not None:
+            details = await self._store.get_transcription_job(job['id'])
+            try:
+                await self._on_complete(details, result)
+            except Exception as e:
+                print(f"Transcription callback failed for job {job['id']}: {e}")
@@ -0,0 +1,89 @@
+"""Concurrent update processing that keeps each chat's updates in order.
+
+python-telegram-bot handles updates one at a time by default, so a slow
+voice download holds up every chat. ChatOrderedUpdateProcessor runs
+updates from different chats in parallel (up to a limit) while updates from
+the same chat still run strictly one after another, in arrival order; the
+message queue relies on that order.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# Handlers running at once across all chats
+CONCURRENT_UPDATES = int(os.getenv("TELEGRAM_CONCURRENT_UPDATES", "16"))
+# Updates taken off the queue at once, including ones waiting for an
+# earlier update of their chat
+MAX_QUEUED_UPDATES = 256
+
+
+def chat_key(update: object) -> Optional[int]:
+    """Chat an update belongs to, or None for updates without a chat."""
+    if isinstance(update, Update) and update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs different chats concurrently and each chat's updates in order.
+
+    Every update waits for the previous update of its chat to finish before
+    it takes one of the max_concurrent_updates handler slots, so a chat
+    with a backlog never occupies slots other chats could use.
+    """
+
+    def __init__(self, max_concurrent_updates: int = CONCURRENT_UPDATES,
+                 max_queued_updates: int = MAX_QUEUED_UPDATES):
+        """Create a processor.
+
+        Args:
+            max_concurrent_updates: Handlers running at once across chats
+            max_queued_updates: Updates admitted at once, running or waiting
+                for their chat's turn
+        """
+        # The base class semaphore bounds admitted updates; handlers run
+        # under the narrower limit
+        super().__init__(max(max_concurrent_updates, max_queued_updates))
+        self.concurrency_limit = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        # Completion of the latest admitted update per chat
+        self._tails: Dict[int, asyncio.Future] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Wait for the chat's previous update, then run this one.
+
+        Args:
+            update: Update being processed
+            coroutine: Application's handling of the update
+        """
+        key = chat_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        # Updates are admitted in arrival order, so chaining on the chat's
+        # latest update keeps that order
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if previous is not None:
+                # asyncio.wait does not cancel the predecessor if we are
+                await asyncio.wait([previous])
+            async with self._running:
+                await coroutine
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    async def initialize(self) -> None:
+        """Nothing to set up."""
+
+    async def shutdown(self) -> None:
+        """Nothing to release; the application waits for running updates."""
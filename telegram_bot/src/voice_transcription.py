@@ -1,15 +1,138 @@
 """Voice message transcription using faster-whisper."""
+import bisect
+import gc
+import io
 import os
+import time
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Dict
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import ffmpeg
+import numpy as np
 from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio as _pyav_decode
+
+import whisper_config
+from speech_detection import Span, keep_speech, restore_time, speech_spans
+from whisper_config import PROFILES, WhisperConfig
+
+
+SAMPLE_RATE = 16000
+
+# transcribe_batch packs clips up to this long (after silence trimming)
+# into shared inference; longer ones are transcribed one at a time
+BATCH_CLIP_SECONDS = 30.0
+# Silence between packed clips, so Whisper breaks its segments between them
+BATCH_GAP_SECONDS = 1.0
+
+# A voice file on disk, or its contents already in memory
+AudioSource = Union[str, bytes]
+
+
+class Segment(NamedTuple):
+    """One transcribed segment, timed against the original recording."""
+
+    start: float
+    end: float
+    text: str
+
+
+@dataclass(slots=True)
+class TranscriptionResult:
+    """Outcome of transcribing one voice message, and where the time went.
+
+    Times are wall-clock seconds in the worker: decode_seconds covers
+    converting the file to samples and trimming silence, load_seconds the
+    wait for the model to load (0 once it is warm), inference_seconds the
+    model itself. With a pinned language (language_pinned) the model skips
+    language detection; initial_prompt is the text it was primed with.
+    """
+
+    success: bool
+    transcription: str = ""
+    error: Optional[str] = None
+    segments: List[Segment] = field(default_factory=list)
+    language: Optional[str] = None
+    language_probability: Optional[float] = None
+    language_pinned: bool = False
+    initial_prompt: Optional[str] = None
+    audio_seconds: float = 0.0
+    decode_seconds: float = 0.0
+    load_seconds: float = 0.0
+    inference_seconds: float = 0.0
+    # Voice messages that shared one inference; inference_seconds is this
+    # message's share of it, by audio length
+    batch_size: int = 1
+    # WhisperConfig the transcript was made with
+    settings: Dict = field(default_factory=dict)
+
+    @property
+    def rtf(self) -> Optional[float]:
+        """Real-time factor: inference time / audio duration."""
+        if not self.audio_seconds:
+            return None
+        return self.inference_seconds / self.audio_seconds
+
+    def telemetry(self) -> Dict:
+        """Timings, language, settings and segments as JSON-ready values."""
+        return {
+            'audio_seconds': self.audio_seconds,
+            'decode_seconds': self.decode_seconds,
+            'load_seconds': self.load_seconds,
+            'inference_seconds': self.inference_seconds,
+            'rtf': self.rtf,
+            'language': self.language,
+            'language_probability': self.language_probability,
+            'language_pinned': self.language_pinned,
+            'initial_prompt': self.initial_prompt,
+            'batch_size': self.batch_size,
+            'settings': self.settings,
+            'segments': [segment._asdict() for segment in self.segments],
+        }
 
 
 # Lazy-loaded model (loaded once, reused)
 _model = None
 
+# Resolved on first use from the environment
+_config: Optional[WhisperConfig] = None
+
+# Filled in by warm_up_model()
+_warmup = {'ready': False, 'load_seconds': None, 'warmup_seconds': None}
+
+
+def get_config() -> WhisperConfig:
+    """Get the Whisper configuration for this process.
+
+    Resolved once from WHISPER_* environment variables. WHISPER_PROFILE=auto
+    uses the profile chosen by select_profile() (measured once per host and
+    cached).
+
+    Returns:
+        WhisperConfig used by get_model() and transcribe_voice()
+    """
+    global _config
+
+    if _config is None:
+        name = resolve_profile()
+        base = PROFILES[name] if name else WhisperConfig()
+        _config = whisper_config.apply_env_overrides(base)
+
+    return _config
+
+
+def resolve_profile() -> Optional[str]:
+    """Return the profile get_config() uses, choosing it for WHISPER_PROFILE=auto.
+
+    Returns:
+        Profile name, or None if WHISPER_PROFILE is unset
+    """
+    name = whisper_config.profile_name()
+    if name == whisper_config.AUTO_PROFILE:
+        name = select_profile()
+    return name
+
 
 def get_model() -> WhisperModel:
     """Get or create Whisper model instance.
@@ -17,23 +140,174 @@ def get_model() -> WhisperModel:
     Model is lazily loaded on first call and reused for subsequent calls.
 
     Returns:
-        WhisperModel instance configured for CPU int8
+        WhisperModel instance configured by get_config()
     """
     global _model
 
     if _model is None:
-        _model = WhisperModel(
-            "small",
-            device="cpu",
-            compute_type="int8"
-        )
+        config = get_config()
+        _model = WhisperModel(config.model_size, **config.model_kwargs())
 
     return _model
 
 
+def prepare_audio(
+    audio: np.ndarray,
+    config: WhisperConfig
+) -> Tuple[np.ndarray, Optional[List[Span]]]:
+    """Cut silence out of decoded audio if the configuration asks for it.
+
+    Args:
+        audio: Decoded samples at SAMPLE_RATE
+        config: Configuration to transcribe with
+
+    Returns:
+        Audio to transcribe and the speech spans it was cut from (None if
+        it was not trimmed; empty if there was no speech at all)
+    """
+    if not config.trim_silence or config.vad_filter:
+        return audio, None
+    spans = speech_spans(audio, SAMPLE_RATE)
+    if not spans:
+        return audio[:0], spans
+    return keep_speech(audio, spans), spans
+
+
+def measure_profile(config: WhisperConfig, audio: np.ndarray) -> Dict:
+    """Time one configuration on decoded audio.
+
+    Loads a dedicated model, runs one warm-up pass and one timed pass.
+
+    Args:
+        config: Configuration to measure
+        audio: Decoded samples at SAMPLE_RATE
+
+    Returns:
+        Dictionary with keys load_seconds, inference_seconds, rtf
+        (inference time / audio duration) and transcription
+    """
+    start = time.perf_counter()
+    model = WhisperModel(config.model_size, **config.model_kwargs())
+    load_seconds = time.perf_counter() - start
+
+    speech, _ = prepare_audio(audio, config)
+    segments, _ = model.transcribe(speech, **config.transcribe_kwargs())
+    list(segments)
+
+    # Silence trimming counts towards inference time
+    start = time.perf_counter()
+    speech, _ = prepare_audio(audio, config)
+    segments, _ = model.transcribe(speech, **config.transcribe_kwargs())
+    transcription = " ".join(seg.text for seg in segments)
+    inference_seconds = time.perf_counter() - start
+
+    del model
+    gc.collect()
+
+    return {
+        'load_seconds': load_seconds,
+        'inference_seconds': inference_seconds,
+        'rtf': inference_seconds / max(len(audio) / SAMPLE_RATE, 1e-6),
+        'transcription': transcription
+    }
+
+
+def select_profile(target_rtf: Optional[float] = None) -> str:
+    """Pick the most accurate profile that meets a real-time factor.
+
+    The result is cached per host and target (WHISPER_PROFILE_CACHE), so
+    profiles are only measured the first time.
+
+    Args:
+        target_rtf: Maximum inference/audio time ratio
+            (default: WHISPER_TARGET_RTF)
+
+    Returns:
+        Profile name; the fastest profile if none meets the target
+    """
+    target = whisper_config.target_rtf() if target_rtf is None else target_rtf
+
+    cached = whisper_config.load_cached_profile(target)
+    if cached:
+        return cached
+
+    audio = decode_audio(str(whisper_config.profile_sample_path()))
+    measurements = {}
+    chosen = None
+    for name, base in PROFILES.items():
+        config = whisper_config.apply_env_overrides(base)
+        measurements[name] = measure_profile(config, audio)['rtf']
+        if measurements[name] <= target:
+            chosen = name
+            break
+
+    chosen = chosen or list(PROFILES)[-1]
+    whisper_config.save_cached_profile(target, chosen, measurements)
+    return chosen
+
+
+def warm_up_model() -> Dict:
+    """Load the model and run one dummy inference.
+
+    The first transcribe call initializes CTranslate2 kernels and buffers;
+    doing it here keeps that cost off the first real voice note. Calling it
+    again is a no-op.
+
+    Returns:
+        Dictionary with keys:
+            - ready: bool
+            - load_seconds: float (time spent loading the model)
+            - warmup_seconds: float (time spent on the dummy inference)
+    """
+    if not _warmup['ready']:
+        start = time.perf_counter()
+        model = get_model()
+        loaded = time.perf_counter()
+
+        # One second of silence; consume the generator to actually decode
+        segments, _ = model.transcribe(
+            np.zeros(SAMPLE_RATE, dtype=np.float32), **get_config().transcribe_kwargs()
+        )
+        list(segments)
+
+        _warmup.update(
+            ready=True,
+            load_seconds=loaded - start,
+            warmup_seconds=time.perf_counter() - loaded
+        )
+
+    return dict(_warmup)
+
+
+def decode_audio(audio: AudioSource) -> np.ndarray:
+    """Decode audio to 16kHz mono float32 samples in memory.
+
+    Uses PyAV (bundled with faster-whisper) inside this process, so Opus
+    voice notes are decoded without spawning ffmpeg or writing a WAV file.
+    Bytes are decoded from a memory buffer without touching the disk.
+
+    Args:
+        audio: Path to input audio file (OGG, MP3, etc.) or its contents
+
+    Returns:
+        Float32 samples in [-1, 1] at SAMPLE_RATE
+
+    Raises:
+        Exception: If decoding fails
+    """
+    try:
+        source = io.BytesIO(audio) if isinstance(audio, (bytes, bytearray)) else audio
+        return _pyav_decode(source, sampling_rate=SAMPLE_RATE)
+    except Exception as e:
+        raise Exception(f"Audio decoding failed: {e}")
+
+
 def convert_to_wav(audio_path: str) -> str:
     """Convert audio file to 16kHz mono WAV format.
 
+    Superseded by decode_audio for transcription; kept for tools that need
+    a WAV file on disk.
+
     Args:
         audio_path: Path to input audio file (OGG, MP3, etc.)
 
@@ -49,7 +323,7 @@ def convert_to_wav(audio_path: str) -> str:
         (
             ffmpeg
             .input(audio_path)
-            .output(wav_path, ar=16000, ac=1, format='wav')
+            .output(wav_path, ar=SAMPLE_RATE, ac=1, format='wav')
             .overwrite_output()
             .run(quiet=True, capture_stdout=True, capture_stderr=True)
         )
@@ -59,47 +333,296 @@ def convert_to_wav(audio_path: str) -> str:
     return wav_path
 
 
-def transcribe_voice(voice_file_path: str) -> Dict:
+def load_audio(
+    voice_file: AudioSource,
+    config: WhisperConfig,
+    result: TranscriptionResult
+) -> Tuple[np.ndarray, Optional[List[Span]]]:
+    """Decode a voice file and trim its silence as the configuration asks.
+
+    Args:
+        voice_file: Path to voice file (OGG, MP3, WAV, etc.) or its
+            downloaded contents
+        config: Configuration to transcribe with
+        result: Gets the audio duration and decoding time
+
+    Returns:
+        prepare_audio result for the decoded samples
+
+    Raises:
+        FileNotFoundError: If the file does not exist
+    """
+    if isinstance(voice_file, str) and not os.path.exists(voice_file):
+        raise FileNotFoundError(f"File not found: {voice_file}")
+
+    # Decode straight to samples; no temporary WAV file
+    start = time.perf_counter()
+    audio = decode_audio(voice_file)
+    prepared = prepare_audio(audio, config)
+    result.decode_seconds = time.perf_counter() - start
+    result.audio_seconds = len(audio) / SAMPLE_RATE
+    return prepared
+
+
+def _restore(segment: Segment, spans: Optional[List[Span]]) -> Segment:
+    """Time a segment of trimmed audio against the original recording."""
+    if spans is None:
+        return segment
+    return Segment(restore_time(segment.start, spans, SAMPLE_RATE),
+                   restore_time(segment.end, spans, SAMPLE_RATE, is_end=True),
+                   segment.text)
+
+
+def _language(info) -> Tuple[Optional[str], Optional[float]]:
+    """Detected language and its probability from a TranscriptionInfo."""
+    if info is None:
+        return None, None
+    return info.language, info.language_probability
+
+
+def _transcribe_kwargs(
+    config: WhisperConfig,
+    language: Optional[str],
+    initial_prompt: Optional[str],
+    result: TranscriptionResult
+) -> Dict:
+    """Arguments for transcribe() with a chat's settings, noted on result."""
+    kwargs = config.transcribe_kwargs()
+    if language:
+        # Skips detection, which costs an extra decoder pass per file
+        kwargs['language'] = language
+        result.language_pinned = True
+    if initial_prompt:
+        kwargs['initial_prompt'] = initial_prompt
+        result.initial_prompt = initial_prompt
+    return kwargs
+
+
+def _transcribe_audio(
+    audio: np.ndarray,
+    spans: Optional[List[Span]],
+    config: WhisperConfig,
+    result: TranscriptionResult,
+    language: Optional[str] = None,
+    initial_prompt: Optional[str] = None
+) -> Iterator[Segment]:
+    """Transcribe one prepared recording (see prepare_audio) lazily.
+
+    faster-whisper decodes lazily, so each segment is available as soon as
+    it is transcribed rather than after the whole file. Model load and
+    inference time (not time spent by the caller between segments) and the
+    detected language are recorded on result.
+    """
+    kwargs = _transcribe_kwargs(config, language, initial_prompt, result)
+    if spans == []:
+        return  # Silence only: nothing to transcribe
+
+    start = time.perf_counter()
+    model = get_model()
+    result.load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    segments, info = model.transcribe(audio, **kwargs)
+    result.language, result.language_probability = _language(info)
+    segments = iter(segments)
+    while True:
+        seg = next(segments, None)
+        result.inference_seconds += time.perf_counter() - start
+        if seg is None:
+            return
+        yield _restore(Segment(seg.start, seg.end, seg.text), spans)
+        start = time.perf_counter()
+
+
+def _succeed(result: TranscriptionResult) -> TranscriptionResult:
+    """Mark a result successful, joining its segments into the transcript."""
+    result.transcription = " ".join(seg.text for seg in result.segments)
+    result.success = True
+    return result
+
+
+def transcribe_voice(
+    voice_file: AudioSource,
+    on_partial: Optional[Callable[[str], None]] = None,
+    language: Optional[str] = None,
+    initial_prompt: Optional[str] = None
+) -> TranscriptionResult:
     """Transcribe voice message to text.
 
+    With trim_silence, silent spans are cut out before inference and
+    segment times are mapped back onto the original recording.
+
     Args:
-        voice_file_path: Path to voice file (OGG, MP3, WAV, etc.)
+        voice_file: Path to voice file (OGG, MP3, WAV, etc.) or its
+            downloaded contents
+        on_partial: Called with the transcript so far after each segment
+        language: Language code to transcribe in; None detects it
+        initial_prompt: Text the model is primed with, so names and terms
+            in it are spelled the same way in the transcript
 
     Returns:
-        Dictionary with keys:
-            - success: bool
-            - transcription: str (if success=True)
-            - error: str (if success=False)
+        TranscriptionResult; on failure success is False and error says why
     """
+    result = TranscriptionResult(success=False)
     try:
-        # Check if file exists
-        if not os.path.exists(voice_file_path):
-            return {
-                'success': False,
-                'error': f"File not found: {voice_file_path}"
-            }
+        config = get_config()
+        result.settings = asdict(config)
+        audio, spans = load_audio(voice_file, config, result)
+        segments = _transcribe_audio(audio, spans, config, result, language, initial_prompt)
+        for segment in segments:
+            result.segments.append(segment)
+            if on_partial is not None:
+                on_partial(" ".join(seg.text for seg in result.segments))
+        return _succeed(result)
+
+    except Exception as e:
+        result.error = str(e)
+        return result
 
-        # Convert to WAV
-        wav_path = convert_to_wav(voice_file_path)
 
-        # Transcribe
-        model = get_model()
-        segments, info = model.transcribe(wav_path)
+def _transcribe_packed(
+    clips: List[np.ndarray],
+    kwargs: Dict
+) -> Tuple[List[List[Segment]], Optional[str], Optional[float]]:
+    """Transcribe short clips together in one inference.
 
-        # Join all segments
-        transcription = " ".join([seg.text for seg in segments])
+    The clips are laid end to end with BATCH_GAP_SECONDS of silence between
+    them, so Whisper runs over the packed audio once (filling each 30 second
+    window with several clips instead of padding one), and words are
+    assigned back to clips by their timestamps. An initial prompt only
+    primes the first window.
 
-        # Cleanup temporary WAV file
-        if wav_path != voice_file_path:
-            os.remove(wav_path)
+    Whisper detects the language once per call and a word spoken right at
+    the edge of a clip can land in its neighbour, so only clips of one chat
+    in its pinned language may be packed together.
 
-        return {
-            'success': True,
-            'transcription': transcription
-        }
+    Args:
+        clips: Samples of each clip, at most BATCH_CLIP_SECONDS long
+        kwargs: transcribe() arguments from _transcribe_kwargs, with a
+            language
+
+    Returns:
+        Segments of each clip, timed from the start of the clip, and the
+        language of the batch with its probability
+    """
+    gap = np.zeros(int(BATCH_GAP_SECONDS * SAMPLE_RATE), dtype=np.float32)
+    offsets = []
+    parts = []
+    position = 0
+    for clip in clips:
+        offsets.append(position)
+        parts += [clip, gap]
+        position += len(clip) + len(gap)
+    packed = np.concatenate(parts[:-1])
+
+    def clip_of(seconds: float) -> int:
+        return max(0, bisect.bisect_right(offsets, seconds * SAMPLE_RATE) - 1)
 
+    # Earlier clips must not steer the transcript of later ones
+    per_clip: List[List[Segment]] = [[] for _ in clips]
+    segments, info = get_model().transcribe(
+        packed, word_timestamps=True, condition_on_previous_text=False, **kwargs
+    )
+    for seg in segments:
+        words: Dict[int, List] = {}
+        for word in seg.words or []:
+            words.setdefault(clip_of((word.start + word.end) / 2), []).append(word)
+        for index, clip_words in words.items():
+            start = offsets[index] / SAMPLE_RATE
+            per_clip[index].append(Segment(
+                max(0.0, clip_words[0].start - start),
+                clip_words[-1].end - start,
+                "".join(word.word for word in clip_words)
+            ))
+    return per_clip, *_language(info)
+
+
+def transcribe_batch(
+    voice_files: List[AudioSource],
+    options: Optional[List[Dict]] = None
+) -> List[TranscriptionResult]:
+    """Transcribe several voice messages of one chat, sharing inference.
+
+    Meant for draining a chat's backlog: clips up to BATCH_CLIP_SECONDS in
+    a pinned language are packed into one inference instead of one
+    model.transcribe call each, one inference per language and prompt.
+    Longer clips, and clips whose language has to be detected, are
+    transcribed on their own. A file that fails to decode fails alone; a
+    failed packed inference fails the clips packed into it.
+
+    Args:
+        voice_files: Paths to voice files or their downloaded contents,
+            all from one chat
+        options: transcribe_voice language and initial_prompt arguments
+            for each voice file (default: none)
+
+    Returns:
+        One TranscriptionResult per voice file, in the same order
+    """
+    results = [TranscriptionResult(success=False) for _ in voice_files]
+    try:
+        config = get_config()
     except Exception as e:
-        return {
-            'success': False,
-            'error': str(e)
-        }
+        for result in results:
+            result.error = str(e)
+        return results
+
+    # Short clips to pack, grouped by chat settings: (language, prompt) ->
+    # (kwargs, [(result, audio, spans)])
+    groups: Dict[Tuple, Tuple[Dict, List]] = {}
+    for result, voice_file, chat_options in zip(results, voice_files,
+                                                 options or [{}] * len(voice_files)):
+        result.settings = asdict(config)
+        language = chat_options.get('language')
+        initial_prompt = chat_options.get('initial_prompt')
+        try:
+            audio, spans = load_audio(voice_file, config, result)
+            if language and spans != [] and len(audio) <= BATCH_CLIP_SECONDS * SAMPLE_RATE:
+                kwargs = _transcribe_kwargs(config, language, initial_prompt, result)
+                group = groups.setdefault((language, initial_prompt), (kwargs, []))
+                group[1].append((result, audio, spans))
+            else:
+                result.segments = list(_transcribe_audio(
+                    audio, spans, config, result, language, initial_prompt
+                ))
+                _succeed(result)
+        except Exception as e:
+            result.error = str(e)
+
+    for (language, initial_prompt), (kwargs, packed) in groups.items():
+        if len(packed) == 1:
+            result, audio, spans = packed[0]
+            try:
+                result.segments = list(_transcribe_audio(
+                    audio, spans, config, result, language, initial_prompt
+                ))
+                _succeed(result)
+            except Exception as e:
+                result.error = str(e)
+            continue
+
+        try:
+            start = time.perf_counter()
+            get_model()
+            load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            per_clip, detected, probability = _transcribe_packed(
+                [audio for _, audio, _ in packed], kwargs
+            )
+            inference_seconds = time.perf_counter() - start
+
+            total = sum(len(audio) for _, audio, _ in packed)
+            for (result, audio, spans), segments in zip(packed, per_clip):
+                result.segments = [_restore(seg, spans) for seg in segments]
+                result.language = detected
+                result.language_probability = probability
+                result.load_seconds = load_seconds
+                result.inference_seconds = inference_seconds * len(audio) / total
+                result.batch_size = len(packed)
+                _succeed(result)
+        except Exception as e:
+            for result, _, _ in packed:
+                result.error = str(e)
+
+    return results
@@ -0,0 +1,175 @@
+"""Whisper model configuration from environment variables.
+
+WHISPER_PROFILE picks a named profile (or "auto" to pick the most accurate
+profile that meets WHISPER_TARGET_RTF on this host); individual WHISPER_*
+variables override profile fields.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class WhisperConfig:
+    """Settings for loading and running a WhisperModel."""
+
+    model_size: str = "small"
+    device: str = "cpu"
+    compute_type: str = "int8"
+    cpu_threads: int = 0  # 0 = CTranslate2 default
+    num_workers: int = 1
+    beam_size: int = 5
+    vad_filter: bool = False
+    # Cut silence out with speech_detection before inference (only used
+    # when vad_filter is off; Whisper's own VAD does the same job)
+    trim_silence: bool = False
+
+    def model_kwargs(self) -> Dict:
+        """Keyword arguments for WhisperModel()."""
+        return {
+            'device': self.device,
+            'compute_type': self.compute_type,
+            'cpu_threads': self.cpu_threads,
+            'num_workers': self.num_workers,
+        }
+
+    def transcribe_kwargs(self) -> Dict:
+        """Keyword arguments for WhisperModel.transcribe()."""
+        return {
+            'beam_size': self.beam_size,
+            'vad_filter': self.vad_filter,
+        }
+
+
+# Ordered from most accurate to fastest; "auto" takes the first that is
+# fast enough on this host
+PROFILES: Dict[str, WhisperConfig] = {
+    "accurate": WhisperConfig(model_size="small", beam_size=5, trim_silence=True),
+    "balanced": WhisperConfig(model_size="base", beam_size=5, trim_silence=True),
+    "fast": WhisperConfig(model_size="base", beam_size=1, vad_filter=True),
+    "fastest": WhisperConfig(model_size="tiny", beam_size=1, vad_filter=True),
+}
+
+AUTO_PROFILE = "auto"
+DEFAULT_TARGET_RTF = 0.5
+DEFAULT_PROFILE_CACHE = Path.home() / ".cache" / "agent-whisper-profile.json"
+
+
+def _env_bool(value: str) -> bool:
+    """Parse a boolean environment value."""
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Environment variable -> (field, parser)
+_ENV_FIELDS = {
+    "WHISPER_MODEL": ("model_size", str),
+    "WHISPER_DEVICE": ("device", str),
+    "WHISPER_COMPUTE_TYPE": ("compute_type", str),
+    "WHISPER_CPU_THREADS": ("cpu_threads", int),
+    "WHISPER_NUM_WORKERS": ("num_workers", int),
+    "WHISPER_BEAM_SIZE": ("beam_size", int),
+    "WHISPER_VAD_FILTER": ("vad_filter", _env_bool),
+    "WHISPER_TRIM_SILENCE": ("trim_silence", _env_bool),
+}
+
+
+def profile_name() -> Optional[str]:
+    """Return the requested WHISPER_PROFILE, or None if unset.
+
+    Raises:
+        ValueError: If the profile is not known
+    """
+    name = os.getenv("WHISPER_PROFILE", "").strip().lower() or None
+    if name is not None and name != AUTO_PROFILE and name not in PROFILES:
+        raise ValueError(
+            f"Unknown WHISPER_PROFILE '{name}'; expected one of: "
+            f"{', '.join([AUTO_PROFILE, *PROFILES])}"
+        )
+    return name
+
+
+def target_rtf() -> float:
+    """Real-time factor the auto profile must meet (inference / audio time)."""
+    return float(os.getenv("WHISPER_TARGET_RTF", str(DEFAULT_TARGET_RTF)))
+
+
+def apply_env_overrides(base: WhisperConfig) -> WhisperConfig:
+    """Apply WHISPER_* variables on top of a base configuration.
+
+    Args:
+        base: Configuration to start from
+
+    Returns:
+        New configuration with any set variables applied
+
+    Raises:
+        ValueError: If a variable has an invalid value
+    """
+    overrides = {}
+    for var, (field, parse) in _ENV_FIELDS.items():
+        value = os.getenv(var)
+        if value:
+            try:
+                overrides[field] = parse(value)
+            except ValueError as e:
+                raise ValueError(f"Invalid {var}: {e}")
+    return replace(base, **overrides)
+
+
+def profile_cache_path() -> Path:
+    """File where the auto profile choice is remembered."""
+    return Path(os.getenv("WHISPER_PROFILE_CACHE", str(DEFAULT_PROFILE_CACHE)))
+
+
+def profile_sample_path() -> Path:
+    """Audio used to time profiles when choosing automatically.
+
+    A recording typical of the voice notes this host transcribes; no
+    sample ships with the bot.
+
+    Raises:
+        ValueError: If WHISPER_PROFILE_SAMPLE is not set
+    """
+    path = os.getenv("WHISPER_PROFILE_SAMPLE")
+    if not path:
+        raise ValueError(
+            "WHISPER_PROFILE_SAMPLE must point to a voice recording to time "
+            "profiles with when WHISPER_PROFILE=auto"
+        )
+    return Path(path)
+
+
+def _cache_key(target: float) -> str:
+    """Identify the host, target and settings an auto choice was measured for.
+
+    Each profile is measured with the WHISPER_* overrides applied, so a
+    change to any of them (compute type, threads, ...) measures again.
+    """
+    settings = {name: asdict(apply_env_overrides(base)) for name, base in PROFILES.items()}
+    return (f"cpus={os.cpu_count()};target_rtf={target};"
+            f"profiles={json.dumps(settings, sort_keys=True)}")
+
+
+def load_cached_profile(target: float) -> Optional[str]:
+    """Return the cached auto profile for this host and target, if any."""
+    try:
+        data = json.loads(profile_cache_path().read_text())
+    except (OSError, ValueError):
+        return None
+    if data.get('key') != _cache_key(target) or data.get('profile') not in PROFILES:
+        return None
+    return data['profile']
+
+
+def save_cached_profile(target: float, profile: str, measurements: Dict[str, float]) -> None:
+    """Remember the auto profile choice and the RTFs it was based on."""
+    path = profile_cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'key': _cache_key(target),
+        'profile': profile,
+        'rtf': measurements,
+        'config': asdict(PROFILES[profile]),
+    }, indent=2))
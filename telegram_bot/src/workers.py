@@ -0,0 +1,59 @@
+"""Worker executor for blocking and CPU-bound work.
+
+Transcription and other heavy calls run here so bot handlers can keep
+accepting updates. Threads are enough: ffmpeg runs in a subprocess and
+CTranslate2 releases the GIL during inference.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "2"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get or create the shared worker executor.
+
+    Returns:
+        ThreadPoolExecutor sized by WORKER_THREADS
+    """
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=WORKER_THREADS,
+            thread_name_prefix="worker"
+        )
+
+    return _executor
+
+
+async def run_in_worker(func, *args, **kwargs):
+    """Run a blocking function on the worker executor and await its result.
+
+    Args:
+        func: Callable to run
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def shutdown_workers() -> None:
+    """Stop the worker executor, waiting for running jobs."""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
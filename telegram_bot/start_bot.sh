@@ -20,7 +20,7 @@ fi
 # Initialize database
 python3 -c "import sys; sys.path.insert(0, '$SCRIPT_DIR/src'); from database import init_db; init_db('$WORKSPACE_DIR/telegram_bot/messages.db')"
 
-# Start bot
+# Start bot; it runs the queue watcher and processing runner itself
 echo "Starting Telegram bot..."
 cd "$SCRIPT_DIR"
 python3 src/bot_server.py
@@ -20,18 +20,30 @@ fi
 if [ -f "$DB_PATH" ]; then
     echo "✓ Database: EXISTS"
 
-    # Show processing lock status
-    LOCK_STATUS=$(sqlite3 "$DB_PATH" "SELECT is_locked FROM processing_lock WHERE id = 1;" 2>/dev/null)
-    if [ "$LOCK_STATUS" = "1" ]; then
-        echo "🔒 Processing lock: LOCKED"
+    # Show chats being processed concurrently
+    ACTIVE_CHATS=$(sqlite3 "$DB_PATH" "SELECT group_concat(chat_id, ', ') FROM chat_locks WHERE lease_expires >= CAST(strftime('%s', 'now') AS REAL);" 2>/dev/null)
+    if [ -n "$ACTIVE_CHATS" ]; then
+        echo "⚙️  Chats in progress: $ACTIVE_CHATS"
     else
-        echo "🔓 Processing lock: UNLOCKED"
+        echo "💤 Chats in progress: none"
     fi
 
     # Show unprocessed message count
     UNPROCESSED=$(sqlite3 "$DB_PATH" "SELECT COUNT(*) FROM messages WHERE processed = 0 AND direction = 'incoming';" 2>/dev/null)
     echo "📬 Unprocessed messages: $UNPROCESSED"
 
+    # Show queue watcher latency
+    METRICS="$WORKSPACE_DIR/telegram_bot/queue_watcher_metrics.json"
+    if [ -f "$METRICS" ]; then
+        python3 -c "
+import json
+m = json.load(open('$METRICS'))
+w = m['wake_latency_ms']
+lat = f\"p50 {w['p50']:.1f} ms, p95 {w['p95']:.1f} ms\" if w['count'] else 'no wake-ups yet'
+print(f\"👀 Queue watcher: {m['notifications']} notification(s), {m['sweep_hits']} sweep hit(s), insert-to-wake {lat}\")
+"
+    fi
+
 else
     echo "✗ Database: NOT FOUND"
 fi
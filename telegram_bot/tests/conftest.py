@@ -23,7 +23,10 @@ def test_db(tmp_path):
     init_db(str(db_path))
 
     yield str(db_path)
-    # tmp_path automatically cleaned by pytest
+
+    # Drop pooled connections; tmp_path automatically cleaned by pytest
+    from database import close_stores
+    close_stores()
 
 
 @pytest.fixture
@@ -0,0 +1,70 @@
+"""Tests for async_database.py - asyncio adapter for the message queue."""
+import threading
+
+import pytest
+
+
+@pytest.fixture
+async def async_store(test_db):
+    """Provide an AsyncMessageStore bound to the test database."""
+    from async_database import get_async_store, close_async_stores
+
+    yield get_async_store(test_db)
+    await close_async_stores()
+
+
+@pytest.mark.asyncio
+async def test_add_and_get_unprocessed(async_store):
+    """Test storing and reading messages through the adapter."""
+    row_id = await async_store.add_incoming_message(123, 123, "user", 1, "Hello")
+
+    messages = await async_store.get_unprocessed_messages()
+
+    assert [m['id'] for m in messages] == [row_id]
+    assert messages[0]['text'] == "Hello"
+
+
+@pytest.mark.asyncio
+async def test_mark_processed_and_outgoing(async_store, test_db):
+    """Test marking processed and logging outgoing messages."""
+    from database import get_unprocessed_messages
+
+    row_id = await async_store.add_incoming_message(123, 123, "user", 1, "Hello")
+    await async_store.add_outgoing_message(123, "Reply")
+    await async_store.mark_messages_processed([row_id])
+
+    assert get_unprocessed_messages(test_db) == []
+
+
+@pytest.mark.asyncio
+async def test_lock_operations(async_store):
+    """Test lock acquire/release through the adapter."""
+    assert await async_store.is_locked() is False
+    assert await async_store.acquire_lock() is True
+    assert await async_store.acquire_lock() is False
+    await async_store.release_lock()
+    assert await async_store.is_locked() is False
+
+
+@pytest.mark.asyncio
+async def test_calls_run_off_event_loop_thread(async_store, monkeypatch):
+    """Test that database calls execute on the store's own thread."""
+    seen = []
+    original = async_store._store.is_locked
+
+    def record_thread():
+        seen.append(threading.current_thread())
+        return original()
+
+    monkeypatch.setattr(async_store._store, "is_locked", record_thread)
+    await async_store.is_locked()
+
+    assert seen[0] is not threading.main_thread()
+
+
+def test_get_async_store_is_shared(test_db):
+    """Test that one adapter is reused per database path."""
+    from async_database import get_async_store
+
+    assert get_async_store(test_db) is get_async_store(test_db)
+
@@ -12,6 +12,7 @@ import tempfile
 sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 from src import database as db
 from src import bot_server
+from voice_transcription import TranscriptionResult
 
 
 def create_mock_update(message_text="Test message", chat_id=123456789,
@@ -428,3 +429,351 @@ async def test_send_telegram_message_failure(test_db):
         result = await bot_server.send_telegram_message(chat_id, message)
 
         assert result is False
+
+
+def create_mock_voice_update(chat_id=123456789, user_id=123456789,
+                             username="voice_user", message_id=2000,
+                             audio=b"OggS fake voice"):
+    """Helper to create a mock voice message Update object."""
+    update = create_mock_update(chat_id=chat_id, user_id=user_id,
+                                username=username, message_id=message_id)
+
+    mock_file = AsyncMock()
+    mock_file.download_as_bytearray = AsyncMock(return_value=bytearray(audio))
+    update.message.voice.get_file = AsyncMock(return_value=mock_file)
+    return update
+
+
+@pytest.fixture
+async def transcription_service(test_db):
+    """Run a TranscriptionService on threads for handler tests."""
+    from concurrent.futures import ThreadPoolExecutor
+    from transcription_cache import TranscriptionCache
+    from transcription_service import TranscriptionService
+    from whisper_config import WhisperConfig
+
+    completed = []
+
+    async def on_complete(job, result):
+        completed.append((job, result))
+
+    cache = TranscriptionCache(test_db, WhisperConfig())
+    service = TranscriptionService(test_db, workers=2, on_complete=on_complete,
+                                   executor=ThreadPoolExecutor(max_workers=2),
+                                   cache=cache)
+    service.completed = completed
+    await service.start()
+    with patch.object(bot_server, '_transcription_service', service), \
+         patch.object(bot_server, '_transcription_cache', cache):
+        yield service
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_handlers_stay_responsive_during_transcription(test_db, tmp_path,
+                                                             transcription_service):
+    """Test that slow transcription does not stall concurrent text updates."""
+    import asyncio
+    import time
+
+    def slow_transcribe(path, **kwargs):
+        time.sleep(1.0)
+        return TranscriptionResult(success=True, transcription='slow voice')
+
+    latencies = []
+
+    async def timed(handler, update):
+        start = time.monotonic()
+        await handler(update, MagicMock())
+        latencies.append(time.monotonic() - start)
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'VOICE_DIR', str(tmp_path)), \
+         patch.object(bot_server, 'is_whitelisted', return_value=True), \
+         patch.object(bot_server, 'trigger_processing'), \
+         patch('transcription_service.transcribe_voice', side_effect=slow_transcribe):
+        await timed(bot_server.handle_voice, create_mock_voice_update())
+        await asyncio.gather(*(
+            timed(bot_server.handle_message,
+                  create_mock_update(message_text=f"msg {i}", message_id=3000 + i))
+            for i in range(20)
+        ))
+
+        # Voice transcript is still pending; text messages are queued
+        assert len(db.get_unprocessed_messages(test_db)) == 20
+        assert not transcription_service.completed
+
+        deadline = time.monotonic() + 5
+        while not transcription_service.completed and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    assert len(latencies) == 21
+    assert max(latencies) < 0.5
+    texts = [m['text'] or m['voice_transcription'] for m in db.get_unprocessed_messages(test_db)]
+    assert len(texts) == 21
+    assert 'slow voice' in texts
+
+
+@pytest.mark.asyncio
+async def test_voice_transcribed_from_memory_and_archived(test_db, tmp_path,
+                                                          transcription_service):
+    """Test that downloaded audio goes to the decoder and to disk in parallel."""
+    import asyncio
+    import time
+
+    received = []
+
+    def record_transcribe(voice_file, **kwargs):
+        received.append(voice_file)
+        return TranscriptionResult(success=True, transcription='in memory')
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'VOICE_DIR', str(tmp_path)), \
+         patch.object(bot_server, 'is_whitelisted', return_value=True), \
+         patch.object(bot_server, 'trigger_processing'), \
+         patch('transcription_service.transcribe_voice', side_effect=record_transcribe):
+        update = create_mock_voice_update(message_id=4100, audio=b"OggS archived voice")
+        await bot_server.handle_voice(update, MagicMock())
+
+        deadline = time.monotonic() + 5
+        while not transcription_service.completed and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    voice_path = tmp_path / "voice_4100.ogg"
+    assert received == [b"OggS archived voice"]
+    assert voice_path.read_bytes() == b"OggS archived voice"
+    assert not (tmp_path / "voice_4100.ogg.tmp").exists()
+    message = db.get_unprocessed_messages(test_db)[0]
+    assert message['voice_file_path'] == str(voice_path)
+    assert message['voice_transcription'] == 'in memory'
+
+
+@pytest.mark.asyncio
+async def test_transcription_finished_reports_failure(test_db):
+    """Test that a failed transcription is reported to the chat."""
+    bot = MagicMock()
+    bot.send_message = AsyncMock()
+    job = {'chat_id': 123, 'message_id': 55}
+
+    await bot_server.transcription_finished(bot, job, TranscriptionResult(success=False, error='bad audio'))
+
+    bot.send_message.assert_called_once()
+    assert bot.send_message.call_args.kwargs['chat_id'] == 123
+    assert "couldn't transcribe" in bot.send_message.call_args.kwargs['text']
+
+
+@pytest.mark.asyncio
+async def test_transcription_finished_triggers_processing(test_db):
+    """Test that a stored transcript triggers processing when unlocked."""
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'trigger_processing') as mock_trigger:
+        await bot_server.transcription_finished(MagicMock(), {'chat_id': 123},
+                                                TranscriptionResult(success=True, transcription='hi'))
+
+    mock_trigger.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_status_reports_model_readiness(test_db, transcription_service):
+    """Test that /status shows warm-up state and duration."""
+    update = create_mock_update()
+
+    with patch.object(bot_server, 'DB_PATH', test_db):
+        await bot_server.status_command(update, MagicMock())
+        cold = update.message.reply_text.call_args[0][0]
+
+        transcription_service.model_status = {
+            'state': 'ready', 'workers': 2, 'warmup_seconds': 3.25, 'load_seconds': 2.0
+        }
+        await bot_server.status_command(update, MagicMock())
+        ready = update.message.reply_text.call_args[0][0]
+
+    assert "Voice model: loads on first voice message" in cold
+    assert "Voice model: ready (warm-up 3.2s, 2 worker(s))" in ready
+
+
+@pytest.mark.asyncio
+async def test_repeated_voice_served_from_cache(test_db, tmp_path, transcription_service):
+    """Test that re-sent audio is answered from the cache without transcribing."""
+    import asyncio
+    import time
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'VOICE_DIR', str(tmp_path)), \
+         patch.object(bot_server, 'is_whitelisted', return_value=True), \
+         patch.object(bot_server, 'trigger_processing') as mock_trigger, \
+         patch('transcription_service.transcribe_voice',
+               return_value=TranscriptionResult(success=True, transcription='forwarded note')) as mock_transcribe:
+        await bot_server.handle_voice(create_mock_voice_update(message_id=4000), MagicMock())
+
+        deadline = time.monotonic() + 5
+        while not transcription_service.completed and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        await bot_server.handle_voice(create_mock_voice_update(message_id=4001), MagicMock())
+
+        update = create_mock_update()
+        await bot_server.status_command(update, MagicMock())
+
+    # The cache hit triggers processing directly; the first note went
+    # through the fixture's completion callback instead
+    assert mock_transcribe.call_count == 1
+    assert mock_trigger.call_count == 1
+    transcripts = [m['voice_transcription'] for m in db.get_unprocessed_messages(test_db)]
+    assert transcripts == ['forwarded note', 'forwarded note']
+    assert transcription_service.cache.stats()['hits'] == 1
+    assert "Transcription cache: 1 hit(s), 1 miss(es) (50% hit rate)" in \
+        update.message.reply_text.call_args[0][0]
+
+
+@pytest.mark.asyncio
+async def test_partial_transcript_triggers_processing(test_db):
+    """Test that a stored partial transcript starts processing when unlocked."""
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'trigger_processing') as mock_trigger:
+        await bot_server.transcription_progressed({'chat_id': 123})
+
+    mock_trigger.assert_called_once()
+
+
+def test_trigger_processing_uses_dispatcher():
+    """Test that triggers go to the dispatcher instead of spawning a process."""
+    dispatcher = MagicMock()
+
+    with patch.object(bot_server, '_dispatcher', dispatcher):
+        bot_server.trigger_processing()
+        bot_server.trigger_processing()
+
+    assert dispatcher.trigger.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_status_shows_lock_holder(test_db):
+    """Test that /status names the chat lock holder and remaining lease."""
+    update = create_mock_update(chat_id=555)
+    db.acquire_chat_lock(test_db, 555, holder_pid=4242, holder_host="agent-host")
+
+    with patch.object(bot_server, 'DB_PATH', test_db):
+        await bot_server.status_command(update, MagicMock())
+
+    text = update.message.reply_text.call_args[0][0]
+    assert "This chat: locked by PID 4242 on agent-host (lease" in text
+    assert "currently processing messages" in text
+
+
+@pytest.mark.asyncio
+async def test_status_shows_chat_lock(test_db):
+    """Test that /status reports this chat's run and overall parallelism."""
+    update = create_mock_update(chat_id=555)
+    db.acquire_chat_lock(test_db, 555, holder_pid=4242, holder_host="agent-host")
+    db.acquire_chat_lock(test_db, 777, holder_pid=4242, holder_host="agent-host")
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'MAX_PARALLEL_CHATS', 3):
+        await bot_server.status_command(update, MagicMock())
+
+    text = update.message.reply_text.call_args[0][0]
+    # The old global processing lock is no longer taken, so not reported
+    assert "Processing lock" not in text
+    assert "This chat: locked by PID 4242 on agent-host" in text
+    assert "Chats in progress: 2 of 3" in text
+    assert "currently processing messages" in text
+
+
+def test_main_polls_by_default(test_db):
+    """Test that main() long-polls when no webhook URL is configured."""
+    application = MagicMock()
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'WEBHOOK_URL', None), \
+         patch.object(bot_server, 'build_application', return_value=application) as build:
+        bot_server.main()
+
+    application.run_polling.assert_called_once()
+    application.run_webhook.assert_not_called()
+
+
+def test_main_runs_webhook_server_when_configured(test_db):
+    """Test that main() serves a webhook with the configured settings."""
+    application = MagicMock()
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'WEBHOOK_URL', "https://bot.example.com/"), \
+         patch.object(bot_server, 'WEBHOOK_PATH', "hook"), \
+         patch.object(bot_server, 'WEBHOOK_PORT', 8080), \
+         patch.object(bot_server, 'WEBHOOK_SECRET', "s3cret"), \
+         patch.object(bot_server, 'build_application', return_value=application) as build:
+        bot_server.main()
+
+    application.run_polling.assert_not_called()
+    kwargs = application.run_webhook.call_args.kwargs
+    assert kwargs['webhook_url'] == "https://bot.example.com/hook"
+    assert kwargs['url_path'] == "hook"
+    assert kwargs['port'] == 8080
+    assert kwargs['secret_token'] == "s3cret"
+
+
+def test_application_handles_chats_concurrently():
+    """Test that updates go through the per-chat ordered processor."""
+    with patch.object(bot_server, 'BOT_TOKEN', "123456:test"), \
+         patch.object(bot_server, 'CONCURRENT_UPDATES', 8):
+        application = bot_server.build_application()
+
+    assert isinstance(application.update_processor, bot_server.ChatOrderedUpdateProcessor)
+    assert application.update_processor.concurrency_limit == 8
+
+
+@pytest.mark.asyncio
+async def test_language_command_pins_chat_language(test_db):
+    """Test that /language pins, rejects unknown codes and unpins with auto."""
+    from database import get_chat_settings
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'is_whitelisted', return_value=True):
+        update = create_mock_update()
+        await bot_server.language_command(update, MagicMock(args=["DE"]))
+        assert get_chat_settings(test_db, 123456789)['language'] == 'de'
+        assert "Voice language: de" in update.message.reply_text.call_args[0][0]
+
+        update = create_mock_update()
+        await bot_server.language_command(update, MagicMock(args=["klingon"]))
+        assert "Unknown language" in update.message.reply_text.call_args[0][0]
+        assert get_chat_settings(test_db, 123456789)['language'] == 'de'
+
+        await bot_server.language_command(create_mock_update(), MagicMock(args=["auto"]))
+        assert get_chat_settings(test_db, 123456789)['language'] is None
+
+        await bot_server.prompt_command(create_mock_update(), MagicMock(args=["on"]))
+        assert get_chat_settings(test_db, 123456789)['prompt_history'] is True
+
+
+@pytest.mark.asyncio
+async def test_voice_transcribed_with_chat_settings(test_db, tmp_path, transcription_service):
+    """Test that a chat's pinned language and recent messages reach the model."""
+    import asyncio
+    import time
+    from database import add_incoming_message, set_chat_language, set_chat_prompt_history
+
+    received = []
+
+    def record_transcribe(voice_file, **kwargs):
+        received.append(kwargs)
+        return TranscriptionResult(success=True, transcription='Grafana ist rot')
+
+    set_chat_language(test_db, 123456789, 'de')
+    set_chat_prompt_history(test_db, 123456789, True)
+    add_incoming_message(test_db, 123456789, 123456789, "voice_user", 4200, "Grafana Dashboard")
+
+    with patch.object(bot_server, 'DB_PATH', test_db), \
+         patch.object(bot_server, 'VOICE_DIR', str(tmp_path)), \
+         patch.object(bot_server, 'is_whitelisted', return_value=True), \
+         patch.object(bot_server, 'trigger_processing'), \
+         patch('transcription_service.transcribe_voice', side_effect=record_transcribe):
+        await bot_server.handle_voice(create_mock_voice_update(message_id=4201), MagicMock())
+
+        deadline = time.monotonic() + 5
+        while not transcription_service.completed and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    assert received[0]['language'] == 'de'
+    assert received[0]['initial_prompt'] == "Grafana Dashboard"
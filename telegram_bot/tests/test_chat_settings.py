@@ -0,0 +1,41 @@
+"""Tests for chat_settings.py - per-chat transcription settings."""
+import pytest
+
+from chat_settings import build_prompt, parse_language, transcription_options
+
+
+def test_parse_language():
+    """Test that language codes are normalized and auto unpins."""
+    assert parse_language(" DE ") == "de"
+    assert parse_language("auto") is None
+    with pytest.raises(ValueError):
+        parse_language("klingon")
+
+
+def test_build_prompt_keeps_latest_text():
+    """Test that long history is cut from the start at a word boundary."""
+    assert build_prompt([]) is None
+    assert build_prompt(["  ", ""]) is None
+    assert build_prompt(["deploy the\nhelm chart", "on Kubernetes"]) == \
+        "deploy the helm chart on Kubernetes"
+
+    prompt = build_prompt(["alpha beta gamma", "delta epsilon"], max_chars=20)
+    assert prompt == "gamma delta epsilon"
+
+
+@pytest.mark.asyncio
+async def test_transcription_options_follow_settings(test_db):
+    """Test that priming uses recent messages only when turned on."""
+    from async_database import get_async_store
+    from database import add_incoming_message, set_chat_language, set_chat_prompt_history
+
+    store = get_async_store(test_db)
+    add_incoming_message(test_db, 123, 123, "user", 1, "We use PostgreSQL and Grafana")
+
+    assert await transcription_options(store, 123) == {'language': None, 'initial_prompt': None}
+
+    set_chat_language(test_db, 123, 'en')
+    set_chat_prompt_history(test_db, 123, True)
+    assert await transcription_options(store, 123) == {
+        'language': 'en', 'initial_prompt': "We use PostgreSQL and Grafana"
+    }
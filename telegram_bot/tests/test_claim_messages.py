@@ -0,0 +1,68 @@
+"""Tests for claim_messages.py - claim/ack/nack queue CLI."""
+import json
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def cli_db(test_db):
+    """Point the CLI at the test database."""
+    with patch('claim_messages.DB_PATH', test_db):
+        yield test_db
+
+
+def test_claim_prints_messages_as_json(cli_db, capsys):
+    """Test that claim outputs the worker ID and claimed messages."""
+    from claim_messages import main
+    from database import add_incoming_message
+
+    add_incoming_message(cli_db, 123, 123, "user", 1, "hello")
+
+    assert main(["claim", "--worker", "agent-1"]) == 0
+
+    output = json.loads(capsys.readouterr().out)
+    assert output['worker_id'] == "agent-1"
+    assert [m['text'] for m in output['messages']] == ["hello"]
+    assert output['messages'][0]['attempts'] == 1
+
+
+def test_ack_and_nack(cli_db, capsys):
+    """Test that ack and nack act on the worker's claims."""
+    from claim_messages import main
+    from database import add_incoming_message, get_unprocessed_messages
+
+    first = add_incoming_message(cli_db, 1, 1, "user", 1, "one")
+    second = add_incoming_message(cli_db, 2, 2, "user", 2, "two")
+    main(["claim", "--worker", "agent-1"])
+
+    assert main(["ack", "--worker", "agent-1", str(first)]) == 0
+    assert main(["nack", "--worker", "agent-1", "--error", "try later", str(second)]) == 0
+
+    assert [m['id'] for m in get_unprocessed_messages(cli_db)] == [second]
+
+
+def test_ack_of_lost_claim_fails(cli_db, capsys):
+    """Test that acking a message claimed by someone else reports an error."""
+    from claim_messages import main
+    from database import add_incoming_message
+
+    row_id = add_incoming_message(cli_db, 1, 1, "user", 1, "one")
+    main(["claim", "--worker", "agent-1"])
+
+    assert main(["ack", "--worker", "agent-2", str(row_id)]) == 1
+    assert "no longer claimed by agent-2" in capsys.readouterr().err
+
+
+def test_claim_limited_to_chat(cli_db, capsys):
+    """Test that --chat restricts the claim to one chat."""
+    from claim_messages import main
+    from database import add_incoming_message
+
+    add_incoming_message(cli_db, 1, 1, "user", 1, "one")
+    add_incoming_message(cli_db, 2, 2, "user", 2, "two")
+
+    assert main(["claim", "--worker", "agent-1", "--chat", "2"]) == 0
+
+    output = json.loads(capsys.readouterr().out)
+    assert [m['chat_id'] for m in output['messages']] == [2]
@@ -384,3 +384,865 @@ def test_release_lock_when_not_locked(test_db):
 
     # Should still be unlocked
     assert is_locked(test_db) is False
+
+
+def test_store_reuses_connection_per_thread(test_db):
+    """Test that the store keeps one connection per thread."""
+    import threading
+    from database import get_store
+
+    store = get_store(test_db)
+    assert get_store(test_db) is store
+    assert store.connection is store.connection
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(store.connection))
+    thread.start()
+    thread.join()
+
+    assert other[0] is not store.connection
+
+
+def test_store_wrappers_share_connection(test_db):
+    """Test that module-level functions run on the pooled connection."""
+    from database import get_store, add_incoming_message, get_unprocessed_messages
+
+    conn = get_store(test_db).connection
+    add_incoming_message(test_db, 111, 111, "user1", 1, "Pooled")
+
+    assert get_store(test_db).connection is conn
+    assert get_unprocessed_messages(test_db)[0]['text'] == "Pooled"
+
+
+def test_store_shares_one_notify_socket_across_threads(test_db, monkeypatch):
+    """Test that concurrent inserts open a single notification socket."""
+    import socket
+    import threading
+    import time
+    import database
+
+    opened = []
+    real_socket = socket.socket
+
+    def slow_socket(*args):
+        # Widen the window between the None check and the assignment
+        time.sleep(0.01)
+        sock = real_socket(*args)
+        opened.append(sock)
+        return sock
+
+    monkeypatch.setattr(database.socket, "socket", slow_socket)
+    store = database.MessageStore(test_db)
+    threads = [
+        threading.Thread(target=store.add_incoming_message, args=(111, 111, "user1", i, "Hi"))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+
+    assert len(opened) == 1
+    assert opened[0].fileno() == -1
+
+
+def test_close_stores_reopens_connection(test_db):
+    """Test that closed stores transparently reconnect."""
+    from database import get_store, close_stores, is_locked
+
+    conn = get_store(test_db).connection
+    close_stores()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert is_locked(test_db) is False
+    assert get_store(test_db).connection is not conn
+
+
+def test_init_db_enables_wal(test_db):
+    """Test that init_db switches the database to WAL journaling."""
+    conn = sqlite3.connect(test_db)
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.close()
+
+    assert mode == "wal"
+
+
+def test_connection_pragmas(test_db):
+    """Test that connections are opened with tuned pragmas."""
+    from database import get_db_connection, BUSY_TIMEOUT_MS
+
+    conn = get_db_connection(test_db)
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == BUSY_TIMEOUT_MS
+    conn.close()
+
+
+def test_get_unprocessed_messages_for_one_chat(test_db):
+    """Test that a per-chat agent run only sees its own chat's messages."""
+    from database import add_incoming_message, get_unprocessed_messages
+
+    add_incoming_message(test_db, 222, 222, "user2", 1, "Chat 222")
+    add_incoming_message(test_db, 333, 333, "user3", 2, "Chat 333")
+
+    assert [m['text'] for m in get_unprocessed_messages(test_db, chat_id=333)] == ["Chat 333"]
+    assert len(get_unprocessed_messages(test_db, chat_id=None)) == 2
+
+
+def test_get_unprocessed_messages_defaults_to_process_chat(test_db, monkeypatch):
+    """Test that the run's chat is read from the environment at call time."""
+    from database import add_incoming_message, get_unprocessed_messages
+
+    add_incoming_message(test_db, 222, 222, "user2", 1, "Chat 222")
+    add_incoming_message(test_db, 333, 333, "user3", 2, "Chat 333")
+
+    monkeypatch.setenv("TELEGRAM_PROCESS_CHAT_ID", "222")
+    assert [m['text'] for m in get_unprocessed_messages(test_db)] == ["Chat 222"]
+
+    monkeypatch.delenv("TELEGRAM_PROCESS_CHAT_ID")
+    assert len(get_unprocessed_messages(test_db)) == 2
+
+
+def test_unprocessed_query_uses_queue_index(test_db):
+    """Test that polling the queue uses the partial index."""
+    from database import get_db_connection, _SELECT_UNPROCESSED_SQL
+
+    conn = get_db_connection(test_db)
+    plan = " ".join(str(tuple(row)) for row in
+                    conn.execute("EXPLAIN QUERY PLAN " + _SELECT_UNPROCESSED_SQL,
+                                 (0, None, None)))
+    conn.close()
+
+    assert "idx_messages_queue" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_init_db_migrates_existing_database(tmp_path):
+    """Test that init_db upgrades a database created by an older version."""
+    from database import init_db, get_unprocessed_messages
+
+    db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER,
+            username TEXT,
+            message_id INTEGER,
+            text TEXT,
+            voice_file_path TEXT,
+            voice_transcription TEXT,
+            direction TEXT NOT NULL,
+            processed BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("INSERT INTO messages (chat_id, text, direction) VALUES (1, 'old', 'incoming')")
+    conn.commit()
+    conn.close()
+
+    init_db(db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    index = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND name='idx_messages_queue'"
+    ).fetchone()
+    conn.close()
+
+    assert index is not None
+    assert [m['text'] for m in get_unprocessed_messages(db_path)] == ["old"]
+
+
+def test_init_db_creates_transcription_jobs(test_db):
+    """Test that init_db creates the transcription job queue."""
+    conn = sqlite3.connect(test_db)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(transcription_jobs)")
+    columns = {row[1] for row in cursor.fetchall()}
+    conn.close()
+
+    assert {'id', 'message_row_id', 'voice_file_path', 'status', 'attempts',
+            'error'}.issubset(columns)
+
+
+def test_pending_voice_hidden_until_transcribed(test_db):
+    """Test that voice messages wait in the queue for their transcript."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, complete_transcription_job,
+                          get_unprocessed_messages)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+
+    assert get_unprocessed_messages(test_db) == []
+
+    jobs = claim_transcription_jobs(test_db, 5)
+    assert [job['id'] for job in jobs] == [job_id]
+    assert jobs[0]['attempts'] == 1
+
+    complete_transcription_job(test_db, job_id, "Hello from voice")
+
+    messages = get_unprocessed_messages(test_db)
+    assert len(messages) == 1
+    assert messages[0]['voice_transcription'] == "Hello from voice"
+
+
+def test_claim_transcription_jobs_respects_limit(test_db):
+    """Test that claiming takes the oldest pending jobs only once."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs)
+
+    job_ids = []
+    for i in range(3):
+        row_id = add_incoming_message(test_db, 123, 123, "user", i, None, f"/tmp/{i}.ogg")
+        job_ids.append(enqueue_transcription_job(test_db, row_id, f"/tmp/{i}.ogg"))
+
+    first = claim_transcription_jobs(test_db, 2)
+    second = claim_transcription_jobs(test_db, 2)
+
+    assert [job['id'] for job in first] == job_ids[:2]
+    assert [job['id'] for job in second] == job_ids[2:]
+    assert claim_transcription_jobs(test_db, 2) == []
+
+
+def test_fail_transcription_job_retries_then_fails(test_db):
+    """Test that failed jobs are retried before leaving the queue."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, fail_transcription_job,
+                          get_transcription_job)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 42, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+
+    claim_transcription_jobs(test_db, 1)
+    assert fail_transcription_job(test_db, job_id, "boom", max_attempts=2) is False
+    assert get_transcription_job(test_db, job_id)['status'] == 'pending'
+
+    claim_transcription_jobs(test_db, 1)
+    assert fail_transcription_job(test_db, job_id, "boom", max_attempts=2) is True
+
+    job = get_transcription_job(test_db, job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == "boom"
+    assert job['chat_id'] == 123
+    assert job['message_id'] == 42
+
+    conn = sqlite3.connect(test_db)
+    processed = conn.execute("SELECT processed FROM messages WHERE id = ?", (row_id,)).fetchone()[0]
+    conn.close()
+    assert processed == 1
+
+
+def test_requeue_transcription_jobs(test_db):
+    """Test that jobs left running after a crash return to pending."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, requeue_transcription_jobs)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+    claim_transcription_jobs(test_db, 1)
+
+    assert requeue_transcription_jobs(test_db) == 1
+    assert [job['id'] for job in claim_transcription_jobs(test_db, 1)] == [job_id]
+
+
+def test_init_db_adds_cache_columns_to_jobs(tmp_path):
+    """Test that an older transcription_jobs table gains the cache columns."""
+    from database import init_db
+
+    db_path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE transcription_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_row_id INTEGER NOT NULL,
+            voice_file_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+    init_db(db_path)
+
+    conn = sqlite3.connect(db_path)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(transcription_jobs)")}
+    conn.close()
+    assert {'audio_hash', 'config_key'} <= columns
+
+
+def test_completed_job_populates_transcription_cache(test_db):
+    """Test that finishing a hashed job makes its transcript a cache hit."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, complete_transcription_job,
+                          get_cached_transcription)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg", "abc", "small|int8|5|False")
+    claim_transcription_jobs(test_db, 1)
+
+    assert get_cached_transcription(test_db, "abc", "small|int8|5|False") is None
+    complete_transcription_job(test_db, job_id, "hello")
+
+    assert get_cached_transcription(test_db, "abc", "small|int8|5|False") == "hello"
+    assert get_cached_transcription(test_db, "abc", "base|int8|1|True") is None
+
+    conn = sqlite3.connect(test_db)
+    hits = conn.execute("SELECT hits FROM transcription_cache").fetchone()[0]
+    conn.close()
+    assert hits == 1
+
+
+def test_unhashed_job_skips_transcription_cache(test_db):
+    """Test that jobs without an audio hash do not write cache entries."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, complete_transcription_job)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+    claim_transcription_jobs(test_db, 1)
+    complete_transcription_job(test_db, job_id, "hello")
+
+    conn = sqlite3.connect(test_db)
+    count = conn.execute("SELECT COUNT(*) FROM transcription_cache").fetchone()[0]
+    conn.close()
+    assert count == 0
+
+
+def test_evict_transcription_cache(test_db):
+    """Test that eviction drops stale entries, then the least recently used."""
+    from database import put_cached_transcription, evict_transcription_cache
+
+    for i in range(5):
+        put_cached_transcription(test_db, f"hash{i}", "key", f"text {i}")
+
+    conn = sqlite3.connect(test_db)
+    conn.execute("UPDATE transcription_cache SET last_used_at = '2000-01-01' WHERE audio_hash = 'hash0'")
+    for i in range(1, 5):
+        conn.execute("UPDATE transcription_cache SET last_used_at = ? WHERE audio_hash = ?",
+                     (datetime(2100, 1, i).isoformat(), f"hash{i}"))
+    conn.commit()
+    conn.close()
+
+    assert evict_transcription_cache(test_db, max_entries=2, max_age_days=30) == 3
+
+    conn = sqlite3.connect(test_db)
+    remaining = [row[0] for row in conn.execute(
+        "SELECT audio_hash FROM transcription_cache ORDER BY audio_hash"
+    )]
+    conn.close()
+    assert remaining == ["hash3", "hash4"]
+
+
+def test_partial_transcription_replaced_by_final(test_db):
+    """Test that a processed partial transcript is requeued with the final text."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, set_partial_transcription,
+                          complete_transcription_job, get_unprocessed_messages,
+                          mark_messages_processed)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+    claim_transcription_jobs(test_db, 1)
+
+    set_partial_transcription(test_db, job_id, "first part")
+    messages = get_unprocessed_messages(test_db)
+    assert messages[0]['voice_transcription'] == "first part"
+    assert messages[0]['transcription_partial'] is True
+
+    mark_messages_processed(test_db, [row_id])
+    assert get_unprocessed_messages(test_db) == []
+
+    complete_transcription_job(test_db, job_id, "first part and the rest")
+    messages = get_unprocessed_messages(test_db)
+    assert messages[0]['voice_transcription'] == "first part and the rest"
+    assert messages[0]['transcription_partial'] is False
+
+
+def test_final_transcription_does_not_requeue_without_partial(test_db):
+    """Test that completing a job leaves an already processed row alone."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, complete_transcription_job,
+                          get_unprocessed_messages, mark_messages_processed)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+    claim_transcription_jobs(test_db, 1)
+    mark_messages_processed(test_db, [row_id])
+
+    complete_transcription_job(test_db, job_id, "done")
+    assert get_unprocessed_messages(test_db) == []
+
+
+def test_completed_job_stores_transcription_stats(test_db):
+    """Test that transcription telemetry is stored with the message as JSON."""
+    import sqlite3
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, complete_transcription_job)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+    claim_transcription_jobs(test_db, 1)
+
+    complete_transcription_job(test_db, job_id, "hello",
+                               {'rtf': 0.25, 'settings': {'model_size': "small"}})
+
+    conn = sqlite3.connect(test_db)
+    row = conn.execute(
+        "SELECT json_extract(transcription_stats, '$.rtf'),"
+        " json_extract(transcription_stats, '$.settings.model_size')"
+        " FROM messages WHERE id = ?", (row_id,)
+    ).fetchone()
+    conn.close()
+    assert row == (0.25, "small")
+
+
+def test_acquire_lock_records_holder_and_lease(test_db):
+    """Test that acquiring stores the holder and a lease in the future."""
+    import socket
+    import time
+    from database import acquire_lock, get_lock_info
+
+    assert acquire_lock(test_db, lease_seconds=30) is True
+
+    info = get_lock_info(test_db)
+    assert info['holder_pid'] == os.getpid()
+    assert info['holder_host'] == socket.gethostname()
+    assert time.time() + 25 < info['lease_expires'] <= time.time() + 30
+    assert info['expired'] is False
+
+
+def test_expired_lease_is_reclaimed(test_db):
+    """Test that a crashed holder's lock is taken over once its lease ends."""
+    from database import acquire_lock, is_locked, get_lock_info
+
+    assert acquire_lock(test_db, holder_pid=999999, holder_host="crashed", lease_seconds=-1)
+    assert is_locked(test_db) is False
+    assert get_lock_info(test_db)['expired'] is True
+
+    assert acquire_lock(test_db, holder_pid=1234, holder_host="alive") is True
+    assert get_lock_info(test_db)['holder_pid'] == 1234
+
+
+def test_live_lease_blocks_other_holders(test_db):
+    """Test that only one of two competing holders gets the lock."""
+    from database import acquire_lock
+
+    results = [acquire_lock(test_db, holder_pid=pid, holder_host="h") for pid in (1, 2)]
+    assert results == [True, False]
+
+
+def test_acquire_lock_is_atomic_across_processes(test_db):
+    """Test that concurrent processes never both acquire the lock."""
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(8) as pool:
+        results = pool.map(_acquire_in_process, [test_db] * 8)
+
+    assert results.count(True) == 1
+
+
+def _acquire_in_process(db_path):
+    """Try to take the lock from a separate process."""
+    from database import acquire_lock
+    return acquire_lock(db_path)
+
+
+def test_renew_lock(test_db):
+    """Test that only the current holder can extend its lease."""
+    from database import acquire_lock, renew_lock, get_lock_info
+
+    acquire_lock(test_db, holder_pid=1, holder_host="h", lease_seconds=5)
+    before = get_lock_info(test_db)['lease_expires']
+
+    assert renew_lock(test_db, holder_pid=1, holder_host="h", lease_seconds=60) is True
+    assert get_lock_info(test_db)['lease_expires'] > before
+    assert renew_lock(test_db, holder_pid=2, holder_host="h") is False
+
+
+def test_release_lock_only_by_holder(test_db):
+    """Test that a holder-scoped release leaves other holders' locks alone."""
+    from database import acquire_lock, release_lock, is_locked
+
+    acquire_lock(test_db, holder_pid=1, holder_host="h")
+
+    release_lock(test_db, holder_pid=2, holder_host="h")
+    assert is_locked(test_db) is True
+
+    release_lock(test_db, holder_pid=1, holder_host="h")
+    assert is_locked(test_db) is False
+
+
+def test_legacy_lock_without_lease_stays_held(test_db):
+    """Test that a lock set without a lease is not treated as expired."""
+    from database import acquire_lock, is_locked
+
+    conn = sqlite3.connect(test_db)
+    conn.execute("UPDATE processing_lock SET is_locked = 1, locked_at = '2020-01-01'")
+    conn.commit()
+    conn.close()
+
+    assert is_locked(test_db) is True
+    assert acquire_lock(test_db) is False
+
+
+def add_text(db_path, chat_id, message_id):
+    """Queue a text message and return its row ID."""
+    from database import add_incoming_message
+    return add_incoming_message(db_path, chat_id, chat_id, "user", message_id, f"msg {message_id}")
+
+
+def test_claim_batch_hides_claimed_messages(test_db):
+    """Test that claimed messages are not handed to a second consumer."""
+    from database import claim_batch
+
+    ids = [add_text(test_db, chat_id, chat_id) for chat_id in (1, 2, 3)]
+
+    first = claim_batch(test_db, 2, "worker-a")
+    second = claim_batch(test_db, 10, "worker-b")
+
+    assert [m['id'] for m in first] == ids[:2]
+    assert [m['id'] for m in second] == ids[2:]
+    assert first[0]['attempts'] == 1
+    assert claim_batch(test_db, 10, "worker-c") == []
+
+
+def test_claimed_messages_hidden_from_queue_reads(test_db):
+    """Test that polling and counting skip messages under a live claim."""
+    import time
+    from unittest.mock import patch
+    from database import claim_batch, count_unprocessed, get_unprocessed_messages
+
+    ids = [add_text(test_db, chat_id, chat_id) for chat_id in (1, 2)]
+    claim_batch(test_db, 1, "worker-a", visibility_timeout=60)
+
+    assert [m['id'] for m in get_unprocessed_messages(test_db)] == ids[1:]
+    assert count_unprocessed(test_db) == 1
+
+    # Visible again once the claim expires
+    with patch("database.time.time", return_value=time.time() + 120):
+        assert [m['id'] for m in get_unprocessed_messages(test_db)] == ids
+        assert count_unprocessed(test_db) == 2
+
+
+def test_claim_batch_keeps_chat_order(test_db):
+    """Test that a chat with a message in flight is skipped by other consumers."""
+    from database import claim_batch, ack
+
+    first_id = add_text(test_db, 1, 1)
+    first = claim_batch(test_db, 1, "worker-a")
+    second_id = add_text(test_db, 1, 2)
+    other_chat = add_text(test_db, 2, 3)
+
+    assert [m['id'] for m in claim_batch(test_db, 10, "worker-b")] == [other_chat]
+
+    ack(test_db, [first[0]['id']], "worker-a")
+    assert [m['id'] for m in claim_batch(test_db, 10, "worker-b")] == [second_id]
+    assert first[0]['id'] == first_id
+
+
+def test_ack_marks_processed(test_db):
+    """Test that acked messages leave the queue and stale acks are refused."""
+    from database import claim_batch, ack, get_unprocessed_messages
+
+    row_id = add_text(test_db, 1, 1)
+    claim_batch(test_db, 10, "worker-a")
+
+    assert ack(test_db, [row_id], "worker-b") == 0
+    assert ack(test_db, [row_id], "worker-a") == 1
+    assert get_unprocessed_messages(test_db) == []
+
+
+def test_visibility_timeout_redelivers(test_db):
+    """Test that a crashed consumer's messages are delivered again."""
+    from database import claim_batch, ack
+
+    row_id = add_text(test_db, 1, 1)
+    claim_batch(test_db, 10, "crashed", visibility_timeout=-1)
+
+    redelivered = claim_batch(test_db, 10, "worker-b")
+    assert [m['id'] for m in redelivered] == [row_id]
+    assert redelivered[0]['attempts'] == 2
+
+    # The first consumer's claim is gone
+    assert ack(test_db, [row_id], "crashed") == 0
+
+
+def test_nack_requeues_then_dead_letters(test_db):
+    """Test that nacked messages return until their attempts run out."""
+    from database import claim_batch, nack
+
+    row_id = add_text(test_db, 1, 1)
+
+    claim_batch(test_db, 10, "w")
+    assert nack(test_db, [row_id], "w", "agent error", max_attempts=2) == 1
+    assert [m['id'] for m in claim_batch(test_db, 10, "w")] == [row_id]
+    assert nack(test_db, [row_id], "w", "agent error", max_attempts=2) == 1
+
+    assert claim_batch(test_db, 10, "w") == []
+    conn = sqlite3.connect(test_db)
+    row = conn.execute("SELECT processed, attempts, last_error FROM messages WHERE id = ?",
+                       (row_id,)).fetchone()
+    conn.close()
+    assert row == (1, 2, "agent error")
+
+
+def test_expired_claims_dead_lettered_after_max_attempts(test_db):
+    """Test that a message crashing every consumer eventually leaves the queue."""
+    from database import claim_batch
+
+    row_id = add_text(test_db, 1, 1)
+    for _ in range(2):
+        claim_batch(test_db, 10, "crashes", visibility_timeout=-1, max_attempts=2)
+
+    assert claim_batch(test_db, 10, "w", max_attempts=2) == []
+    conn = sqlite3.connect(test_db)
+    error = conn.execute("SELECT last_error FROM messages WHERE id = ?", (row_id,)).fetchone()[0]
+    conn.close()
+    assert "visibility timeout" in error
+
+
+def test_chat_locks_are_independent(test_db):
+    """Test that different chats can be locked at the same time."""
+    from database import acquire_chat_lock, get_chat_lock_info
+
+    assert acquire_chat_lock(test_db, 1, holder_pid=100, holder_host="a") is True
+    assert acquire_chat_lock(test_db, 2, holder_pid=200, holder_host="b") is True
+    # Same chat stays exclusive
+    assert acquire_chat_lock(test_db, 1, holder_pid=300, holder_host="c") is False
+
+    info = get_chat_lock_info(test_db, 1)
+    assert info['is_locked'] is True
+    assert info['holder_pid'] == 100
+    assert get_chat_lock_info(test_db, 3)['is_locked'] is False
+
+
+def test_chat_lock_parallelism_limit(test_db):
+    """Test that no more than max_parallel chats are locked at once."""
+    from database import acquire_chat_lock, release_chat_lock, get_chat_locks
+
+    assert acquire_chat_lock(test_db, 1, max_parallel=2) is True
+    assert acquire_chat_lock(test_db, 2, max_parallel=2) is True
+    assert acquire_chat_lock(test_db, 3, max_parallel=2) is False
+    assert [lock['chat_id'] for lock in get_chat_locks(test_db)] == [1, 2]
+
+    release_chat_lock(test_db, 1)
+    assert acquire_chat_lock(test_db, 3, max_parallel=2) is True
+
+
+def test_expired_chat_lock_can_be_taken_over(test_db):
+    """Test that a crashed holder's chat lock is reclaimed and frees its slot."""
+    from database import acquire_chat_lock, renew_chat_lock, get_chat_lock_info
+
+    assert acquire_chat_lock(test_db, 1, holder_pid=100, holder_host="a",
+                             lease_seconds=-1, max_parallel=1) is True
+    assert get_chat_lock_info(test_db, 1)['expired'] is True
+
+    # The expired lock neither blocks its chat nor counts against the limit
+    assert acquire_chat_lock(test_db, 2, holder_pid=200, holder_host="b", max_parallel=1) is True
+    assert acquire_chat_lock(test_db, 1, holder_pid=300, holder_host="c", max_parallel=2) is True
+    assert renew_chat_lock(test_db, 1, holder_pid=100, holder_host="a") is False
+    assert get_chat_lock_info(test_db, 1)['holder_pid'] == 300
+
+
+def test_release_chat_lock_only_by_holder(test_db):
+    """Test that a holder-scoped release leaves another holder's lock."""
+    from database import acquire_chat_lock, release_chat_lock, get_chat_lock_info
+
+    acquire_chat_lock(test_db, 1, holder_pid=100, holder_host="a")
+    release_chat_lock(test_db, 1, holder_pid=999, holder_host="a")
+    assert get_chat_lock_info(test_db, 1)['is_locked'] is True
+
+    release_chat_lock(test_db, 1, holder_pid=100, holder_host="a")
+    assert get_chat_lock_info(test_db, 1)['is_locked'] is False
+
+
+def test_chat_lock_limit_is_atomic_across_processes(test_db):
+    """Test that concurrent acquirers never exceed the parallelism limit."""
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(6) as pool:
+        results = pool.starmap(_acquire_chat_in_process,
+                               [(test_db, chat_id) for chat_id in range(6)])
+
+    assert results.count(True) == 2
+
+
+def _acquire_chat_in_process(db_path, chat_id):
+    """Try to take a chat lock from a separate process."""
+    from database import acquire_chat_lock
+    return acquire_chat_lock(db_path, chat_id, max_parallel=2)
+
+
+def test_ready_chats_skip_locked_chats(test_db):
+    """Test that chats being processed are not offered again."""
+    from database import acquire_chat_lock, get_ready_chats
+
+    add_text(test_db, 2, 1)
+    add_text(test_db, 1, 2)
+    add_text(test_db, 2, 3)
+
+    assert get_ready_chats(test_db) == [2, 1]
+    acquire_chat_lock(test_db, 2)
+    assert get_ready_chats(test_db) == [1]
+
+
+def test_claim_batch_for_one_chat(test_db):
+    """Test that a per-chat run claims only its chat's messages."""
+    from database import claim_batch
+
+    add_text(test_db, 1, 1)
+    mine = add_text(test_db, 2, 2)
+
+    assert [m['id'] for m in claim_batch(test_db, 10, "w", chat_id=2)] == [mine]
+
+
+def test_claim_deliveries_one_per_chat_in_order(test_db):
+    """Test that the outbox hands out each chat's oldest message first."""
+    from database import claim_deliveries, complete_delivery, enqueue_outgoing_message
+
+    first = enqueue_outgoing_message(test_db, 1, "one")
+    second = enqueue_outgoing_message(test_db, 1, "two")
+    other = enqueue_outgoing_message(test_db, 2, "other")
+
+    assert [d['id'] for d in claim_deliveries(test_db, 10)] == [first, other]
+    # The chat's next message waits until the first one is settled
+    assert claim_deliveries(test_db, 10) == []
+
+    complete_delivery(test_db, first, 100)
+    claimed = claim_deliveries(test_db, 10)
+    assert [(d['id'], d['text'], d['attempts']) for d in claimed] == [(second, "two", 1)]
+
+
+def test_retry_delivery_keeps_chat_order(test_db):
+    """Test that a message waiting to be retried holds back later ones."""
+    from database import (claim_deliveries, enqueue_outgoing_message, get_delivery,
+                          retry_delivery)
+
+    first = enqueue_outgoing_message(test_db, 1, "one")
+    enqueue_outgoing_message(test_db, 1, "two")
+    claim_deliveries(test_db, 10)
+
+    retry_delivery(test_db, first, "Timed out", 60)
+
+    assert claim_deliveries(test_db, 10) == []
+    delivery = get_delivery(test_db, first)
+    assert delivery['delivery_status'] == "pending"
+    assert delivery['error'] == "Timed out"
+
+
+def test_failed_delivery_releases_chat(test_db):
+    """Test that a failed message no longer blocks its chat."""
+    from database import (claim_deliveries, count_pending_deliveries,
+                          enqueue_outgoing_message, fail_delivery, get_delivery)
+
+    first = enqueue_outgoing_message(test_db, 1, "one")
+    second = enqueue_outgoing_message(test_db, 1, "two")
+    claim_deliveries(test_db, 10)
+
+    fail_delivery(test_db, first, "Forbidden")
+
+    assert get_delivery(test_db, first)['delivery_status'] == "failed"
+    assert [d['id'] for d in claim_deliveries(test_db, 10)] == [second]
+    assert count_pending_deliveries(test_db) == 1
+
+
+def test_requeue_interrupted_deliveries(test_db):
+    """Test that messages left sending return to the outbox."""
+    from database import claim_deliveries, enqueue_outgoing_message, get_store
+
+    row_id = enqueue_outgoing_message(test_db, 1, "one")
+    claim_deliveries(test_db, 10)
+    assert claim_deliveries(test_db, 10) == []
+
+    # The bot's own sends only come back when it starts
+    assert get_store(test_db).requeue_deliveries(unleased=False) == 0
+    assert get_store(test_db).requeue_deliveries() == 1
+    assert [d['id'] for d in claim_deliveries(test_db, 10)] == [row_id]
+
+
+def test_requeue_leaves_leased_deliveries(test_db):
+    """Test that another process's send is requeued only after its lease."""
+    import time
+    from unittest.mock import patch
+    from database import claim_deliveries, enqueue_outgoing_message, get_store
+
+    row_id = enqueue_outgoing_message(test_db, 1, "one", claim=True)
+    assert get_store(test_db).requeue_deliveries() == 0
+
+    with patch("database.time.time", return_value=time.time() + 200):
+        assert get_store(test_db).requeue_deliveries(unleased=False) == 1
+        assert [d['id'] for d in claim_deliveries(test_db, 10)] == [row_id]
+
+
+def test_logged_outgoing_message_is_delivered(test_db):
+    """Test that messages logged after sending never enter the outbox."""
+    from database import add_outgoing_message, claim_deliveries, get_delivery
+
+    row_id = add_outgoing_message(test_db, 1, "Already sent")
+
+    assert get_delivery(test_db, row_id)['delivery_status'] == "delivered"
+    assert claim_deliveries(test_db, 10) == []
+
+
+def test_chat_settings_default_and_update(test_db):
+    """Test that chat settings default to detection and update independently."""
+    from database import get_chat_settings, set_chat_language, set_chat_prompt_history
+
+    assert get_chat_settings(test_db, 123) == {
+        'chat_id': 123, 'language': None, 'prompt_history': False
+    }
+
+    set_chat_language(test_db, 123, 'de')
+    set_chat_prompt_history(test_db, 123, True)
+    assert get_chat_settings(test_db, 123)['language'] == 'de'
+    assert get_chat_settings(test_db, 123)['prompt_history'] is True
+
+    set_chat_language(test_db, 123, None)
+    assert get_chat_settings(test_db, 123) == {
+        'chat_id': 123, 'language': None, 'prompt_history': True
+    }
+    assert get_chat_settings(test_db, 456)['prompt_history'] is False
+
+
+def test_recent_texts_of_chat(test_db):
+    """Test that recent texts include transcripts but not partial ones or other chats."""
+    from database import (add_incoming_message, add_outgoing_message, claim_transcription_jobs,
+                          enqueue_transcription_job, get_recent_texts,
+                          set_partial_transcription)
+
+    add_incoming_message(test_db, 123, 123, "user", 1, "first")
+    add_incoming_message(test_db, 123, 123, "user", 2, None, "/tmp/a.ogg", "spoken")
+    add_incoming_message(test_db, 999, 999, "other", 3, "other chat")
+    add_outgoing_message(test_db, 123, "reply")
+    row_id = add_incoming_message(test_db, 123, 123, "user", 4, None, "/tmp/b.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/b.ogg")
+    claim_transcription_jobs(test_db, 1)
+    set_partial_transcription(test_db, job_id, "half")
+
+    assert get_recent_texts(test_db, 123, 5) == ["first", "spoken", "reply"]
+    assert get_recent_texts(test_db, 123, 2) == ["spoken", "reply"]
+
+
+def test_transcription_job_keeps_chat_options(test_db):
+    """Test that a job's language and prompt come back when it is claimed."""
+    from database import (add_incoming_message, claim_transcription_jobs,
+                          enqueue_transcription_job)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg", language='de',
+                              initial_prompt='Kubernetes')
+
+    job = claim_transcription_jobs(test_db, 1)[0]
+    assert job['language'] == 'de'
+    assert job['initial_prompt'] == 'Kubernetes'
@@ -0,0 +1,142 @@
+"""Tests for dispatcher.py - coalesced wake-ups of the processing runner."""
+import asyncio
+import stat
+import time
+
+import pytest
+
+
+@pytest.fixture
+def runner_script(tmp_path):
+    """Script that records its arguments and every wake line it reads."""
+    log = tmp_path / "runner.log"
+    script = tmp_path / "runner.sh"
+    script.write_text(
+        "#!/bin/bash\n"
+        f'echo "start $*" >> "{log}"\n'
+        f'while read -r line; do echo "$line" >> "{log}"; done\n'
+        f'echo "exit" >> "{log}"\n'
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script), log
+
+
+async def wait_for_lines(log, count, timeout=5.0):
+    """Wait until the runner log has at least count lines."""
+    deadline = time.monotonic() + timeout
+    while True:
+        lines = log.read_text().splitlines() if log.exists() else []
+        if len(lines) >= count:
+            return lines
+        assert time.monotonic() < deadline, f"runner log: {lines}"
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.asyncio
+async def test_burst_coalesced_into_one_wakeup(runner_script):
+    """Test that ten quick triggers wake the runner once."""
+    from dispatcher import ProcessingDispatcher
+
+    script, log = runner_script
+    dispatcher = ProcessingDispatcher(script, debounce=0.1)
+    await dispatcher.start()
+
+    for _ in range(10):
+        dispatcher.trigger()
+    lines = await wait_for_lines(log, 2)
+    await asyncio.sleep(0.2)
+    await dispatcher.stop()
+
+    lines = await wait_for_lines(log, 3)
+    assert lines == ["start --listen", "wake", "exit"]
+    assert dispatcher.stats() == {'triggers': 10, 'wakeups': 1, 'runner_starts': 1}
+
+
+@pytest.mark.asyncio
+async def test_separate_windows_wake_separately(runner_script):
+    """Test that triggers after the window has closed wake the runner again."""
+    from dispatcher import ProcessingDispatcher
+
+    script, log = runner_script
+    dispatcher = ProcessingDispatcher(script, debounce=0.05)
+    await dispatcher.start()
+
+    dispatcher.trigger()
+    await wait_for_lines(log, 2)
+    dispatcher.trigger()
+    lines = await wait_for_lines(log, 3)
+    await dispatcher.stop()
+
+    assert lines == ["start --listen", "wake", "wake"]
+    assert dispatcher.runner_starts == 1
+
+
+@pytest.mark.asyncio
+async def test_runner_restarted_after_exit(tmp_path):
+    """Test that a runner that has exited is started again on the next trigger."""
+    from dispatcher import ProcessingDispatcher
+
+    log = tmp_path / "runner.log"
+    script = tmp_path / "once.sh"
+    script.write_text(f'#!/bin/bash\nread -r line && echo "$line" >> "{log}"\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    dispatcher = ProcessingDispatcher(str(script), debounce=0.01)
+    await dispatcher.start()
+
+    dispatcher.trigger()
+    await wait_for_lines(log, 1)
+    await dispatcher._runner.wait()
+
+    dispatcher.trigger()
+    await wait_for_lines(log, 2)
+    await dispatcher.stop()
+
+    assert dispatcher.runner_starts == 2
+    assert dispatcher.wakeups == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_pending_wakeup(runner_script):
+    """Test that stopping inside the debounce window sends nothing."""
+    from dispatcher import ProcessingDispatcher
+
+    script, log = runner_script
+    dispatcher = ProcessingDispatcher(script, debounce=0.5)
+    await dispatcher.start()
+
+    dispatcher.trigger()
+    await dispatcher.stop()
+    lines = await wait_for_lines(log, 2)
+
+    assert lines == ["start --listen", "exit"]
+    assert dispatcher.wakeups == 0
+
+
+@pytest.mark.asyncio
+async def test_real_runner_script_starts_and_listens(tmp_path, monkeypatch):
+    """Test that scripts/telegram-process.sh executes in listen mode and
+    handles a wake-up."""
+    from pathlib import Path
+    from database import init_db
+    from dispatcher import ProcessingDispatcher
+
+    script = Path(__file__).parents[2] / "scripts" / "telegram-process.sh"
+    monkeypatch.setenv("WORKSPACE_DIR", str(tmp_path))
+    (tmp_path / "telegram_bot").mkdir()
+    init_db(str(tmp_path / "telegram_bot" / "messages.db"))
+    log = tmp_path / "logs" / "telegram-process.log"
+
+    dispatcher = ProcessingDispatcher(str(script), debounce=0.01)
+    await dispatcher.start()
+    try:
+        lines = await wait_for_lines(log, 2)
+        assert "Listening for wake-ups" in lines[0]
+        assert "No unprocessed messages" in lines[1]
+
+        dispatcher.trigger()
+        lines = await wait_for_lines(log, 3)
+        assert "No unprocessed messages" in lines[2]
+        assert dispatcher._runner.returncode is None
+    finally:
+        await dispatcher.stop()
@@ -0,0 +1,86 @@
+"""Tests for outbound_formatter.py - splitting and joining replies."""
+from outbound_formatter import (MESSAGE_LIMIT, coalesce_count, join_messages,
+                                split_message, telegram_length)
+
+
+def test_short_message_unchanged():
+    """Test that text within the limit is not touched."""
+    assert split_message("Hello\n\nWorld") == ["Hello\n\nWorld"]
+
+
+def test_splits_at_paragraphs():
+    """Test that parts break between paragraphs and pack them greedily."""
+    paragraphs = ["a" * 40, "b" * 40, "c" * 40]
+
+    parts = split_message("\n\n".join(paragraphs), limit=90)
+
+    assert parts == ["a" * 40 + "\n\n" + "b" * 40, "c" * 40]
+
+
+def test_long_paragraph_splits_at_lines_then_words():
+    """Test that a paragraph over the limit breaks at line ends, then spaces."""
+    text = "first line here\n" + " ".join(["word"] * 10)
+
+    parts = split_message(text, limit=20)
+
+    assert parts[0] == "first line here"
+    assert all(telegram_length(part) <= 20 for part in parts)
+    assert " ".join(parts[1:]) == " ".join(["word"] * 10)
+
+
+def test_code_block_kept_whole_when_it_fits():
+    """Test that blank lines inside a code block do not split it."""
+    code = "```python\ndef f():\n\n    return 1\n```"
+    text = "x" * 50 + "\n\n" + code
+
+    assert split_message(text, limit=60) == ["x" * 50, code]
+
+
+def test_long_code_block_split_between_lines_and_refenced():
+    """Test that every part of an oversized code block is fenced."""
+    lines = [f"line_{n} = {n}" for n in range(20)]
+    code = "```python\n" + "\n".join(lines) + "\n```"
+
+    parts = split_message(code, limit=80)
+
+    assert len(parts) > 1
+    for part in parts:
+        assert part.startswith("```python\n") and part.endswith("\n```")
+        assert telegram_length(part) <= 80
+    inner = [line for part in parts for line in part.split("\n")[1:-1]]
+    assert inner == lines
+
+
+def test_unbreakable_text_is_cut():
+    """Test that text without any break points is cut at the limit."""
+    parts = split_message("x" * 25, limit=10)
+
+    assert parts == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_limit_counts_utf16_units():
+    """Test that characters outside the BMP count twice, as Telegram does."""
+    emoji = "\U0001F600"
+    assert telegram_length(emoji) == 2
+
+    parts = split_message(emoji * 6, limit=5)
+
+    assert parts == [emoji * 2, emoji * 2, emoji * 2]
+
+
+def test_default_limit_is_telegrams():
+    """Test that the default limit produces parts Telegram accepts."""
+    text = "\n\n".join("p" * 1000 for _ in range(10))
+
+    parts = split_message(text)
+
+    assert all(telegram_length(part) <= MESSAGE_LIMIT for part in parts)
+    assert "\n\n".join(parts) == text
+
+
+def test_coalesce_count():
+    """Test how many replies fit into one joined message."""
+    assert coalesce_count(["a" * 4, "b" * 4, "c" * 4], limit=10) == 2
+    assert coalesce_count(["a" * 20, "b"], limit=10) == 1
+    assert coalesce_count([], limit=10) == 0
+    assert join_messages(["a", "b"]) == "a\n\nb"
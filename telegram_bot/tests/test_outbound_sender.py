@@ -0,0 +1,329 @@
+"""Tests for outbound_sender.py - outbox delivery and the send_message.py socket."""
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from telegram.error import RetryAfter
+
+
+def make_bot(log=None, delay=0.0):
+    """Mock bot whose send_message records calls and returns a message."""
+    sent = []
+
+    async def send_message(chat_id, text):
+        if log is not None:
+            log.append(("start", chat_id, text))
+        await asyncio.sleep(delay)
+        sent.append((chat_id, text))
+        if log is not None:
+            log.append(("end", chat_id, text))
+        return SimpleNamespace(message_id=len(sent))
+
+    bot = Mock()
+    bot.send_message = AsyncMock(side_effect=send_message)
+    return bot
+
+
+@pytest.fixture
+async def sender_factory(test_db):
+    """Start OutboundSenders on the test database and stop them afterwards."""
+    from async_database import close_async_stores
+    from outbound_sender import OutboundSender
+
+    senders = []
+
+    async def start(bot, **kwargs):
+        sender = OutboundSender(test_db, bot, **kwargs)
+        await sender.start()
+        senders.append(sender)
+        return sender
+
+    yield start
+    for sender in senders:
+        await sender.stop()
+    await close_async_stores()
+
+
+async def request(socket_path, messages):
+    """Send request lines over one connection and return the replies by id.
+
+    Messages given as strings are written as they are.
+    """
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    for index, message in enumerate(messages):
+        line = message if isinstance(message, str) else json.dumps(dict(message, id=index))
+        writer.write(line.encode() + b"\n")
+    writer.write_eof()
+    replies = {}
+    while line := await reader.readline():
+        reply = json.loads(line)
+        replies[reply['id']] = reply
+    writer.close()
+    return replies
+
+
+@pytest.mark.asyncio
+async def test_sends_and_logs_messages(sender_factory, test_db):
+    """Test that requested messages are stored, sent and marked delivered."""
+    from database import get_db_connection
+
+    bot = make_bot()
+    sender = await sender_factory(bot)
+
+    replies = await request(sender.socket_path, [{'chat_id': 1, 'text': "Hello"}])
+
+    assert replies[0]['ok'] is True
+    bot.send_message.assert_awaited_once_with(chat_id=1, text="Hello")
+    conn = get_db_connection(test_db)
+    rows = conn.execute(
+        "SELECT chat_id, text, delivery_status, telegram_message_id FROM messages"
+    ).fetchall()
+    conn.close()
+    assert [tuple(row) for row in rows] == [(1, "Hello", "delivered", 1)]
+    assert sender.stats() == {'sent': 1, 'failed': 0, 'retried': 0, 'coalesced': 0}
+
+
+@pytest.mark.asyncio
+async def test_batch_runs_chats_concurrently_in_order(sender_factory):
+    """Test that a batch is sent concurrently across chats, in order per chat."""
+    log = []
+    sender = await sender_factory(make_bot(log, delay=0.05), concurrency=4, coalesce_window=0)
+    messages = [{'chat_id': chat, 'text': f"{chat}-{n}"} for n in range(3) for chat in range(4)]
+
+    start = asyncio.get_running_loop().time()
+    replies = await request(sender.socket_path, messages)
+    elapsed = asyncio.get_running_loop().time() - start
+
+    assert all(reply['ok'] for reply in replies.values())
+    # Four chats in parallel, three messages each: about 3 rounds, not 12
+    assert elapsed < 0.4
+    for chat in range(4):
+        started = [text for event, chat_id, text in log if event == "start" and chat_id == chat]
+        assert started == [f"{chat}-{n}" for n in range(3)]
+        # No overlap within a chat
+        events = [event for event, chat_id, _ in log if chat_id == chat]
+        assert events == ["start", "end"] * 3
+
+
+@pytest.mark.asyncio
+async def test_retries_after_flood_wait(sender_factory):
+    """Test that a RetryAfter from Telegram is waited out and retried."""
+    bot = Mock()
+    bot.send_message = AsyncMock(side_effect=[RetryAfter(0), SimpleNamespace(message_id=7)])
+    sender = await sender_factory(bot)
+
+    assert await asyncio.wait_for(sender.send(1, "Hello"), timeout=5) == 7
+    assert bot.send_message.await_count == 2
+    assert sender.stats() == {'sent': 1, 'failed': 0, 'retried': 1, 'coalesced': 0}
+
+
+@pytest.mark.asyncio
+async def test_network_errors_back_off_then_fail(sender_factory, test_db):
+    """Test that network errors are retried until the attempts run out."""
+    from database import get_delivery
+    from telegram.error import NetworkError
+
+    import outbound_sender
+
+    bot = Mock()
+    bot.send_message = AsyncMock(side_effect=NetworkError("Connection reset"))
+    sender = await sender_factory(bot, max_attempts=2)
+
+    with patch.object(outbound_sender, "BACKOFF_BASE_SECONDS", 0.01):
+        with pytest.raises(outbound_sender.DeliveryError, match="Connection reset"):
+            await asyncio.wait_for(sender.send(1, "Hello"), timeout=5)
+
+    assert bot.send_message.await_count == 2
+    delivery = get_delivery(test_db, 1)
+    assert delivery['delivery_status'] == "failed"
+    assert delivery['attempts'] == 2
+    assert delivery['error'] == "Connection reset"
+
+
+def test_retry_delay():
+    """Test which errors are retried and how long to wait."""
+    from telegram.error import BadRequest, Forbidden, TimedOut
+    from outbound_sender import BACKOFF_MAX_SECONDS, retry_delay
+
+    assert retry_delay(RetryAfter(12), 1) == 12
+    assert retry_delay(TimedOut(), 1) == 1
+    assert retry_delay(TimedOut(), 3) == 4
+    assert retry_delay(TimedOut(), 30) == BACKOFF_MAX_SECONDS
+    assert retry_delay(BadRequest("Message is too long"), 1) is None
+    assert retry_delay(Forbidden("Bot was blocked by the user"), 1) is None
+
+
+@pytest.mark.asyncio
+async def test_chat_rate_limit(sender_factory):
+    """Test that one chat gets its burst, then messages at the chat rate."""
+    bot = make_bot()
+    sender = await sender_factory(bot, chat_rate=20, chat_burst=2, coalesce_window=0)
+
+    start = asyncio.get_running_loop().time()
+    await asyncio.gather(*(sender.send(1, str(n)) for n in range(6)))
+    elapsed = asyncio.get_running_loop().time() - start
+
+    # Two at once, then four more at 20 per second
+    assert elapsed >= 0.18
+    assert [c.kwargs['text'] for c in bot.send_message.await_args_list] == [str(n) for n in range(6)]
+
+
+@pytest.mark.asyncio
+async def test_global_rate_limit(sender_factory):
+    """Test that the shared bucket limits sends across chats."""
+    bot = make_bot()
+    sender = await sender_factory(bot, global_rate=20)
+
+    start = asyncio.get_running_loop().time()
+    await asyncio.gather(*(sender.send(chat, "Hi") for chat in range(30)))
+    elapsed = asyncio.get_running_loop().time() - start
+
+    # A burst of 20, then ten more at 20 per second
+    assert elapsed >= 0.45
+
+
+@pytest.mark.asyncio
+async def test_delivers_messages_left_in_outbox(test_db, sender_factory):
+    """Test that pending and interrupted messages are delivered on start."""
+    from database import claim_deliveries, enqueue_outgoing_message, get_delivery
+
+    interrupted = enqueue_outgoing_message(test_db, 2, "Being sent when it crashed")
+    claim_deliveries(test_db, 10)
+    pending = enqueue_outgoing_message(test_db, 1, "Queued while the bot was down")
+    bot = make_bot()
+
+    sender = await sender_factory(bot)
+    await asyncio.wait_for(sender.wait_for(pending), timeout=5)
+    await asyncio.wait_for(sender.wait_for(interrupted), timeout=5)
+
+    assert get_delivery(test_db, pending)['delivery_status'] == "delivered"
+    assert get_delivery(test_db, interrupted)['delivery_status'] == "delivered"
+    assert bot.send_message.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_direct_send_in_progress_is_not_sent_again(test_db, sender_factory):
+    """Test that a send_message.py send under lease is left to it on start."""
+    from database import complete_delivery, enqueue_outgoing_message
+
+    row_id = enqueue_outgoing_message(test_db, 1, "Sent directly", claim=True)
+    bot = make_bot()
+    sender = await sender_factory(bot)
+    await asyncio.sleep(0.1)
+
+    assert bot.send_message.await_count == 0
+    complete_delivery(test_db, row_id, 42)
+    assert await sender.wait_for(row_id) == 42
+
+
+@pytest.mark.asyncio
+async def test_store_error_after_send_releases_chat(sender_factory, test_db):
+    """Test that a crash recording a delivery does not block the chat."""
+    from database import get_delivery
+
+    import outbound_sender
+
+    bot = make_bot()
+    sender = await sender_factory(bot)
+    complete = sender._store.complete_delivery
+    calls = []
+
+    async def flaky_complete(row_id, message_id):
+        calls.append(row_id)
+        if len(calls) == 1:
+            raise RuntimeError("disk I/O error")
+        await complete(row_id, message_id)
+
+    sender._store.complete_delivery = flaky_complete
+
+    with patch.object(outbound_sender, "BACKOFF_BASE_SECONDS", 0.01):
+        assert await asyncio.wait_for(sender.send(1, "one"), timeout=5) == 2
+        assert await asyncio.wait_for(sender.send(1, "two"), timeout=5) == 3
+
+    assert get_delivery(test_db, 1)['delivery_status'] == "delivered"
+    assert bot.send_message.await_count == 3
+    assert sender.stats()['retried'] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_told_when_message_still_queued(sender_factory, test_db):
+    """Test that a client gets a queued reply instead of waiting forever."""
+    from database import get_delivery
+    from telegram.error import NetworkError
+
+    import outbound_sender
+
+    bot = Mock()
+    bot.send_message = AsyncMock(side_effect=NetworkError("Connection reset"))
+    sender = await sender_factory(bot)
+
+    with patch.object(outbound_sender, "WAIT_SECONDS", 0.2):
+        replies = await asyncio.wait_for(
+            request(sender.socket_path, [{'chat_id': 1, 'text': "Hello"}]), timeout=5
+        )
+
+    assert replies[0] == {'id': 0, 'ok': True, 'message_id': None, 'queued': True}
+    assert get_delivery(test_db, 1)['delivery_status'] in ("pending", "sending")
+
+
+@pytest.mark.asyncio
+async def test_stop_removes_socket(sender_factory):
+    """Test that the socket file goes away when the sender stops."""
+    import os
+
+    sender = await sender_factory(make_bot())
+    assert os.path.exists(sender.socket_path)
+
+    await sender.stop()
+
+    assert not os.path.exists(sender.socket_path)
+
+
+@pytest.mark.asyncio
+async def test_long_message_sent_in_parts(sender_factory, test_db):
+    """Test that text over the limit is stored and sent as several rows."""
+    from database import get_db_connection
+
+    bot = make_bot()
+    sender = await sender_factory(bot)
+    text = "\n\n".join(["a" * 3000, "b" * 3000])
+
+    await asyncio.wait_for(sender.send(1, text), timeout=5)
+
+    sent = [c.kwargs['text'] for c in bot.send_message.await_args_list]
+    assert sent == ["a" * 3000, "b" * 3000]
+    conn = get_db_connection(test_db)
+    rows = conn.execute("SELECT text, delivery_status FROM messages ORDER BY id").fetchall()
+    conn.close()
+    assert [tuple(row) for row in rows] == [("a" * 3000, "delivered"), ("b" * 3000, "delivered")]
+
+
+@pytest.mark.asyncio
+async def test_burst_of_replies_is_coalesced(sender_factory, test_db):
+    """Test that replies queued behind a chat's message go out together."""
+    from database import get_db_connection
+
+    bot = make_bot(delay=0.05)
+    sender = await sender_factory(bot, coalesce_window=0.1)
+
+    first = asyncio.create_task(sender.send(1, "one"))
+    await asyncio.sleep(0.01)
+    rest = [asyncio.create_task(sender.send(1, text)) for text in ("two", "three")]
+    await asyncio.wait_for(asyncio.gather(first, *rest), timeout=5)
+    # Within the window of the last message: held and joined
+    await asyncio.wait_for(asyncio.gather(sender.send(1, "four"), sender.send(1, "five")), timeout=5)
+
+    sent = [c.kwargs['text'] for c in bot.send_message.await_args_list]
+    assert sent == ["one", "two\n\nthree", "four\n\nfive"]
+    assert sender.stats()['coalesced'] == 2
+    conn = get_db_connection(test_db)
+    rows = conn.execute(
+        "SELECT text, telegram_message_id FROM messages ORDER BY id"
+    ).fetchall()
+    conn.close()
+    # Every reply keeps its own row, sharing the joined message's ID
+    assert [tuple(row) for row in rows] == [
+        ("one", 1), ("two", 2), ("three", 2), ("four", 3), ("five", 3)
+    ]
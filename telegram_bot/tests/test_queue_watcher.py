@@ -0,0 +1,200 @@
+"""Tests for queue_watcher.py - push notifications for queued messages."""
+import asyncio
+import json
+import stat
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+
+async def wait_for(predicate, timeout=5.0):
+    """Poll until predicate() is true or fail after timeout."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.005)
+
+
+def mock_dispatcher():
+    """Dispatcher stand-in that records triggers."""
+    dispatcher = MagicMock()
+    dispatcher.start = AsyncMock()
+    dispatcher.stop = AsyncMock()
+    dispatcher.stats.return_value = {}
+    return dispatcher
+
+
+@pytest.fixture
+async def watcher_factory(test_db):
+    """Start watchers with a long sweep interval and stop them afterwards."""
+    from queue_watcher import QueueWatcher
+
+    watchers = []
+
+    async def factory(dispatcher, **kwargs):
+        kwargs.setdefault('sweep_seconds', 3600)
+        watcher = QueueWatcher(test_db, dispatcher, **kwargs)
+        await watcher.start()
+        watchers.append(watcher)
+        return watcher
+
+    yield factory
+
+    for watcher in watchers:
+        await watcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_insert_triggers_processing(test_db, watcher_factory):
+    """Test that inserting a message notifies the watcher right away."""
+    from database import add_incoming_message
+
+    dispatcher = mock_dispatcher()
+    watcher = await watcher_factory(dispatcher)
+    await wait_for(lambda: watcher.sweeps == 1)  # initial sweep finds nothing
+    assert dispatcher.trigger.call_count == 0
+
+    start = time.monotonic()
+    add_incoming_message(test_db, 123, 123, "user", 1, "hello")
+    await wait_for(lambda: dispatcher.trigger.called)
+
+    assert time.monotonic() - start < 0.5
+    assert watcher.notifications == 1
+    assert watcher.metrics()['notify_latency_ms']['count'] == 1
+
+
+@pytest.mark.asyncio
+async def test_untranscribed_voice_does_not_notify(test_db, watcher_factory):
+    """Test that voice notes only notify once their transcript is stored."""
+    from database import (add_incoming_message, enqueue_transcription_job,
+                          claim_transcription_jobs, complete_transcription_job)
+
+    dispatcher = mock_dispatcher()
+    watcher = await watcher_factory(dispatcher)
+
+    row_id = add_incoming_message(test_db, 123, 123, "user", 1, None, "/tmp/v.ogg")
+    job_id = enqueue_transcription_job(test_db, row_id, "/tmp/v.ogg")
+    claim_transcription_jobs(test_db, 1)
+    await asyncio.sleep(0.1)
+    assert watcher.notifications == 0
+
+    complete_transcription_job(test_db, job_id, "transcribed")
+    await wait_for(lambda: watcher.notifications == 1)
+    assert dispatcher.trigger.called
+
+
+@pytest.mark.asyncio
+async def test_sweep_finds_missed_messages(test_db, watcher_factory):
+    """Test that the fallback sweep wakes the runner for an existing backlog."""
+    from database import add_incoming_message
+
+    # Queued before the watcher listened, so no notification arrives
+    add_incoming_message(test_db, 123, 123, "user", 1, "hello")
+
+    dispatcher = mock_dispatcher()
+    watcher = await watcher_factory(dispatcher)
+    await wait_for(lambda: watcher.sweeps == 1)
+
+    assert watcher.sweep_hits == 1
+    assert watcher.notifications == 0
+    dispatcher.trigger.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_metrics_written_to_file(test_db, tmp_path, watcher_factory):
+    """Test that counters and latencies are exported as JSON."""
+    from database import add_incoming_message
+
+    metrics_path = tmp_path / "metrics.json"
+    dispatcher = mock_dispatcher()
+    watcher = await watcher_factory(dispatcher, metrics_path=str(metrics_path))
+
+    add_incoming_message(test_db, 123, 123, "user", 1, "hello")
+    await wait_for(lambda: watcher.notifications == 1)
+    watcher.on_wake()
+    watcher.write_metrics(force=True)
+
+    metrics = json.loads(metrics_path.read_text())
+    assert metrics['notifications'] == 1
+    assert metrics['wake_latency_ms']['count'] == 1
+    assert metrics['wake_latency_ms']['max'] >= metrics['notify_latency_ms']['p50']
+
+
+@pytest.mark.asyncio
+async def test_runner_woken_within_milliseconds(test_db, tmp_path, watcher_factory):
+    """Test insert-to-wake latency end to end with a real runner."""
+    from database import add_incoming_message
+    from dispatcher import ProcessingDispatcher
+
+    log = tmp_path / "runner.log"
+    script = tmp_path / "runner.sh"
+    script.write_text(f'#!/bin/bash\nwhile read -r line; do echo "$line" >> "{log}"; done\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    dispatcher = ProcessingDispatcher(str(script), debounce=0.01)
+    watcher = await watcher_factory(dispatcher)
+    dispatcher.on_wake = watcher.on_wake
+
+    add_incoming_message(test_db, 123, 123, "user", 1, "hello")
+    await wait_for(lambda: log.exists() and log.read_text())
+
+    latency = watcher.metrics()['wake_latency_ms']
+    assert latency['count'] == 1
+    assert latency['max'] < 500
+
+
+@pytest.mark.asyncio
+async def test_second_watcher_refuses_to_start(test_db, tmp_path, watcher_factory):
+    """Test that only one watcher, and so one runner, serves a database."""
+    from queue_watcher import QueueWatcher, WatcherRunningError
+
+    pid_path = tmp_path / "watcher.pid"
+    await watcher_factory(mock_dispatcher(), pid_path=str(pid_path))
+    assert pid_path.read_text().isdigit()
+
+    second = mock_dispatcher()
+    with pytest.raises(WatcherRunningError):
+        await QueueWatcher(test_db, second).start()
+    second.start.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stale_socket_is_replaced(test_db, watcher_factory):
+    """Test that a socket file left by a dead watcher does not block a new one."""
+    import socket
+    from database import notify_socket_path
+
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale.bind(notify_socket_path(test_db))
+    stale.close()
+
+    dispatcher = mock_dispatcher()
+    await watcher_factory(dispatcher)
+    dispatcher.start.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_shared_dispatcher_wakes_runner_sub_second(test_db, tmp_path, watcher_factory):
+    """Test that the dispatcher the bot and daemon build reports sub-second wakes."""
+    from database import add_incoming_message
+    from queue_watcher import DEBOUNCE_SECONDS, build_dispatcher
+
+    log = tmp_path / "runner.log"
+    script = tmp_path / "runner.sh"
+    script.write_text(f'#!/bin/bash\nwhile read -r line; do echo "$line" >> "{log}"; done\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    metrics_path = tmp_path / "metrics.json"
+
+    dispatcher = build_dispatcher(str(script))
+    assert dispatcher.debounce == DEBOUNCE_SECONDS < 1.0
+    watcher = await watcher_factory(dispatcher, metrics_path=str(metrics_path))
+    dispatcher.on_wake = watcher.on_wake
+
+    add_incoming_message(test_db, 123, 123, "user", 1, "hello")
+    await wait_for(lambda: log.exists() and log.read_text())
+    watcher.write_metrics(force=True)
+
+    latency = json.loads(metrics_path.read_text())['wake_latency_ms']
+    assert latency['count'] == 1
+    assert latency['max'] < 500
@@ -0,0 +1,189 @@
+"""Tests for retention.py - message archival and compaction."""
+import os
+import sqlite3
+
+import pytest
+
+import database as db
+from retention import archive_path, ensure_incremental_vacuum, run_retention
+
+
+def add_old_message(db_path, created_at, processed=1, direction='incoming',
+                    voice_file_path=None):
+    """Insert a message with an explicit timestamp and return its row ID."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(
+        "INSERT INTO messages (chat_id, user_id, message_id, text, voice_file_path, "
+        "direction, processed, created_at) VALUES (1, 1, 1, 'old', ?, ?, ?, ?)",
+        (voice_file_path, direction, processed, created_at)
+    )
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+def message_ids(db_path):
+    """Return all message row IDs in a database."""
+    conn = sqlite3.connect(db_path)
+    ids = [row[0] for row in conn.execute("SELECT id FROM messages ORDER BY id")]
+    conn.close()
+    return ids
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    """Directory for archive databases."""
+    return str(tmp_path / "archive")
+
+
+def test_old_finished_messages_move_to_monthly_archives(test_db, archive_dir):
+    """Test that old processed rows land in one archive per month."""
+    january = add_old_message(test_db, "2020-01-15 10:00:00")
+    reply = add_old_message(test_db, "2020-01-15 10:01:00", processed=0, direction='outgoing')
+    february = add_old_message(test_db, "2020-02-03 09:00:00")
+    recent = db.add_incoming_message(test_db, 1, 1, "user", 2, "recent")
+
+    stats = run_retention(test_db, archive_dir, retention_days=30)
+
+    assert stats['months'] == ["2020-01", "2020-02"]
+    assert stats['archived'] == 3
+    assert message_ids(test_db) == [recent]
+    assert message_ids(archive_path(archive_dir, "2020-01")) == [january, reply]
+    assert message_ids(archive_path(archive_dir, "2020-02")) == [february]
+
+
+def test_unprocessed_messages_are_kept(test_db, archive_dir):
+    """Test that old messages still waiting for the agent stay in the queue."""
+    waiting = add_old_message(test_db, "2020-01-15 10:00:00", processed=0)
+
+    stats = run_retention(test_db, archive_dir, retention_days=30)
+
+    assert stats['archived'] == 0
+    assert message_ids(test_db) == [waiting]
+
+
+def test_undelivered_replies_are_kept(test_db, archive_dir):
+    """Test that old replies still in the outbox are not archived."""
+    pending = add_old_message(test_db, "2020-01-15 10:00:00", processed=0, direction='outgoing')
+    failed = add_old_message(test_db, "2020-01-15 10:01:00", processed=0, direction='outgoing')
+    conn = sqlite3.connect(test_db)
+    conn.execute("UPDATE messages SET delivery_status = 'pending' WHERE id = ?", (pending,))
+    conn.execute("UPDATE messages SET delivery_status = 'failed' WHERE id = ?", (failed,))
+    conn.commit()
+    conn.close()
+
+    stats = run_retention(test_db, archive_dir, retention_days=30)
+
+    assert stats['archived'] == 1
+    assert message_ids(test_db) == [pending]
+
+
+def test_archive_keeps_all_columns(test_db, archive_dir):
+    """Test that archived rows keep every column of the hot table."""
+    row_id = add_old_message(test_db, "2020-01-15 10:00:00")
+
+    run_retention(test_db, archive_dir, retention_days=30)
+
+    conn = sqlite3.connect(archive_path(archive_dir, "2020-01"))
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM messages WHERE id = ?", (row_id,)).fetchone()
+    conn.close()
+    assert row['text'] == "old"
+    assert row['created_at'] == "2020-01-15 10:00:00"
+    assert "attempts" in row.keys()
+
+
+def test_voice_files_deleted_with_their_messages(test_db, archive_dir, tmp_path):
+    """Test that archived voice notes' audio is removed, and others kept."""
+    old_voice = tmp_path / "voice_1.ogg"
+    new_voice = tmp_path / "voice_2.ogg"
+    old_voice.write_bytes(b"old audio")
+    new_voice.write_bytes(b"new audio")
+    old_id = add_old_message(test_db, "2020-01-15 10:00:00", voice_file_path=str(old_voice))
+    db.enqueue_transcription_job(test_db, old_id, str(old_voice))
+    db.add_incoming_message(test_db, 1, 1, "user", 2, voice_file_path=str(new_voice))
+
+    stats = run_retention(test_db, archive_dir, retention_days=30)
+
+    assert stats['voice_files'] == 1
+    assert not old_voice.exists()
+    assert new_voice.exists()
+    assert db.get_transcription_job(test_db, 1) is None
+
+
+def test_voice_files_moved_in_archive_mode(test_db, archive_dir, tmp_path):
+    """Test that archive mode moves audio next to the archive and repoints rows."""
+    voice = tmp_path / "voice_1.ogg"
+    voice.write_bytes(b"old audio")
+    add_old_message(test_db, "2020-01-15 10:00:00", voice_file_path=str(voice))
+
+    run_retention(test_db, archive_dir, retention_days=30, voice_mode="archive")
+
+    moved = os.path.join(archive_dir, "voice", "2020-01", "voice_1.ogg")
+    assert not voice.exists()
+    with open(moved, "rb") as f:
+        assert f.read() == b"old audio"
+    conn = sqlite3.connect(archive_path(archive_dir, "2020-01"))
+    assert conn.execute("SELECT voice_file_path FROM messages").fetchone()[0] == moved
+    conn.close()
+
+
+def test_rerun_appends_to_existing_archive(test_db, archive_dir):
+    """Test that a second run adds to the month's archive."""
+    first = add_old_message(test_db, "2020-01-15 10:00:00")
+    run_retention(test_db, archive_dir, retention_days=30)
+    second = add_old_message(test_db, "2020-01-20 10:00:00")
+
+    run_retention(test_db, archive_dir, retention_days=30)
+
+    assert message_ids(archive_path(archive_dir, "2020-01")) == [first, second]
+
+
+def test_dry_run_changes_nothing(test_db, archive_dir):
+    """Test that a dry run only reports months."""
+    row_id = add_old_message(test_db, "2020-01-15 10:00:00")
+
+    stats = run_retention(test_db, archive_dir, retention_days=30, dry_run=True)
+
+    assert stats['months'] == ["2020-01"]
+    assert message_ids(test_db) == [row_id]
+    assert not os.path.exists(archive_dir)
+
+
+def test_freed_pages_are_returned(test_db, archive_dir):
+    """Test that archiving shrinks the hot database file."""
+    conn = sqlite3.connect(test_db)
+    conn.executemany(
+        "INSERT INTO messages (chat_id, text, direction, processed, created_at) "
+        "VALUES (1, ?, 'incoming', 1, '2020-01-15 10:00:00')",
+        (("x" * 500,) for _ in range(2000))
+    )
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    size_before = os.path.getsize(test_db)
+
+    stats = run_retention(test_db, archive_dir, retention_days=30)
+
+    assert stats['archived'] == 2000
+    assert stats['pages_freed'] > 0
+    assert os.path.getsize(test_db) < size_before / 2
+
+
+def test_legacy_database_converted_to_incremental_vacuum(tmp_path):
+    """Test that a database created without auto-vacuum is converted once."""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x)")
+    conn.commit()
+
+    assert ensure_incremental_vacuum(conn) is True
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert ensure_incremental_vacuum(conn) is False
+    conn.close()
+
+
+def test_unknown_voice_mode_rejected(test_db, archive_dir):
+    """Test that a misconfigured voice mode fails before touching data."""
+    with pytest.raises(ValueError):
+        run_retention(test_db, archive_dir, voice_mode="compress")
@@ -15,7 +15,7 @@ async def test_send_message_success(test_db, mock_env):
 
     with patch('send_message.Bot') as mock_bot_class:
         mock_bot = Mock()
-        mock_bot.send_message = AsyncMock()
+        mock_bot.send_message = AsyncMock(return_value=Mock(message_id=42))
         mock_bot_class.return_value = mock_bot
 
         with patch('send_message.DB_PATH', test_db):
@@ -39,7 +39,7 @@ async def test_send_message_logs_to_database(test_db, mock_env):
 
     with patch('send_message.Bot') as mock_bot_class:
         mock_bot = Mock()
-        mock_bot.send_message = AsyncMock()
+        mock_bot.send_message = AsyncMock(return_value=Mock(message_id=42))
         mock_bot_class.return_value = mock_bot
 
         with patch('send_message.DB_PATH', test_db):
@@ -61,14 +61,15 @@ async def test_send_message_logs_to_database(test_db, mock_env):
 
 
 @pytest.mark.asyncio
-async def test_send_message_failure(mock_env):
+async def test_send_message_failure(test_db, mock_env):
     """Test handling of send failure."""
     from send_message import send_telegram_message
 
     chat_id = 123456789
     message = "Failed message"
 
-    with patch('telegram.Bot') as mock_bot_class:
+    with patch('send_message.Bot') as mock_bot_class, \
+         patch('send_message.DB_PATH', test_db):
         mock_bot = Mock()
         mock_bot.send_message = AsyncMock(side_effect=Exception("Network error"))
         mock_bot_class.return_value = mock_bot
@@ -138,3 +139,118 @@ def test_multiword_message(mock_env):
         args, kwargs = mock_run.call_args
         # The coroutine was passed to asyncio.run, we can't easily inspect it
         # But we verified it was called with the joined message
+
+
+@pytest.mark.asyncio
+async def test_send_message_uses_running_sender(test_db, mock_env):
+    """Test that messages go through the bot's outbound sender when it runs."""
+    from types import SimpleNamespace
+    from async_database import close_async_stores
+    from outbound_sender import OutboundSender
+    from send_message import send_telegram_message
+
+    bot = Mock()
+    bot.send_message = AsyncMock(return_value=SimpleNamespace(message_id=1))
+    sender = OutboundSender(test_db, bot)
+    await sender.start()
+    try:
+        with patch('send_message.Bot') as mock_bot_class, \
+             patch('send_message.DB_PATH', test_db):
+            result = await send_telegram_message(123456789, "Via sender")
+
+            assert result is True
+            mock_bot_class.assert_not_called()
+            bot.send_message.assert_awaited_once_with(chat_id=123456789, text="Via sender")
+    finally:
+        await sender.stop()
+        await close_async_stores()
+
+
+@pytest.mark.asyncio
+async def test_unresponsive_sender_times_out(test_db, mock_env):
+    """Test that a sender that never replies does not hang the client."""
+    import asyncio
+    from outbound_sender import sender_socket_path
+    from send_message import send_via_service
+
+    async def ignore(reader, writer):
+        await reader.read()
+        await asyncio.sleep(5)
+
+    server = await asyncio.start_unix_server(ignore, path=sender_socket_path(test_db))
+    try:
+        with patch('send_message.DB_PATH', test_db), \
+             patch('send_message.REPLY_TIMEOUT_SECONDS', 0.1):
+            replies = await asyncio.wait_for(
+                send_via_service([{'chat_id': 1, 'text': "Hello"}]), timeout=5
+            )
+    finally:
+        server.close()
+
+    assert replies == [{'ok': False, 'error': "Sender did not reply"}]
+
+
+@pytest.mark.asyncio
+async def test_send_messages_counts_failures(test_db, mock_env):
+    """Test that a batch reports how many messages failed."""
+    from send_message import send_messages
+
+    with patch('send_message.Bot') as mock_bot_class, \
+         patch('send_message.DB_PATH', test_db):
+        mock_bot = Mock()
+        mock_bot.send_message = AsyncMock(side_effect=[Mock(message_id=1), Exception("Blocked")])
+        mock_bot_class.return_value = mock_bot
+
+        failed = await send_messages([
+            {'chat_id': 1, 'text': "First"},
+            {'chat_id': 2, 'text': "Second"},
+        ])
+
+    assert failed == 1
+
+
+def test_read_batch_parses_json_lines():
+    """Test parsing --batch input."""
+    from send_message import read_batch
+
+    lines = ['{"chat_id": "1", "text": "Hi"}\n', '\n', '{"chat_id": 2, "text": "Yo"}\n']
+
+    assert read_batch(lines) == [{'chat_id': 1, 'text': "Hi"}, {'chat_id': 2, 'text': "Yo"}]
+
+
+@pytest.mark.asyncio
+async def test_temporary_failure_stays_in_outbox(test_db, mock_env):
+    """Test that a message hit by a network error is left for the bot."""
+    from telegram.error import TimedOut
+    from database import get_delivery
+    from send_message import send_telegram_message
+
+    with patch('send_message.Bot') as mock_bot_class, \
+         patch('send_message.DB_PATH', test_db):
+        mock_bot = Mock()
+        mock_bot.send_message = AsyncMock(side_effect=TimedOut())
+        mock_bot_class.return_value = mock_bot
+
+        result = await send_telegram_message(123456789, "Later")
+
+    assert result is True
+    assert get_delivery(test_db, 1)['delivery_status'] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_long_message_sent_in_parts(test_db, mock_env):
+    """Test that a reply over Telegram's limit goes out as several messages."""
+    from send_message import send_telegram_message
+
+    text = "\n\n".join(["a" * 3000, "b" * 3000])
+
+    with patch('send_message.Bot') as mock_bot_class, \
+         patch('send_message.DB_PATH', test_db):
+        mock_bot = Mock()
+        mock_bot.send_message = AsyncMock(return_value=Mock(message_id=42))
+        mock_bot_class.return_value = mock_bot
+
+        assert await send_telegram_message(123456789, text) is True
+
+    sent = [c.kwargs['text'] for c in mock_bot.send_message.await_args_list]
+    assert sent == ["a" * 3000, "b" * 3000]
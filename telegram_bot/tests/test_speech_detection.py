@@ -0,0 +1,92 @@
+"""Tests for speech_detection.py - energy-based silence trimming."""
+import numpy as np
+import pytest
+
+
+RATE = 16000
+
+
+def silence(seconds, level=0.0, seed=0):
+    """Silence, or white noise at the given amplitude."""
+    rng = np.random.default_rng(seed)
+    return (level * rng.standard_normal(int(RATE * seconds))).astype(np.float32)
+
+
+def tone(seconds, amplitude=0.3):
+    """A steady tone standing in for speech."""
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def test_silent_recording_has_no_speech():
+    """Test that digital silence yields no spans."""
+    from speech_detection import speech_spans
+
+    assert speech_spans(silence(3.0)) == []
+    assert speech_spans(np.zeros(0, dtype=np.float32)) == []
+
+
+def test_speech_found_in_background_noise():
+    """Test that speech is told apart from a noisy room's floor."""
+    from speech_detection import speech_spans
+
+    noise = 0.01
+    audio = np.concatenate([silence(2.0, noise, 1), tone(1.0) + silence(1.0, noise, 2),
+                            silence(3.0, noise, 3)])
+
+    spans = speech_spans(audio)
+
+    assert len(spans) == 1
+    start, end = spans[0]
+    assert start / RATE == pytest.approx(1.8, abs=0.05)
+    assert end / RATE == pytest.approx(3.2, abs=0.05)
+
+
+def test_short_pauses_stay_inside_a_span():
+    """Test that a pause between words does not split the speech."""
+    from speech_detection import speech_spans
+
+    audio = np.concatenate([tone(1.0), silence(0.3), tone(1.0), silence(2.0), tone(1.0)])
+
+    spans = speech_spans(audio)
+
+    assert len(spans) == 2
+    assert spans[0][0] == 0
+    assert spans[1][1] == len(audio)
+
+
+def test_clicks_are_dropped():
+    """Test that bursts shorter than a word are not kept."""
+    from speech_detection import speech_spans
+
+    audio = np.concatenate([silence(1.0), tone(0.06), silence(1.0)])
+
+    assert speech_spans(audio) == []
+
+
+def test_constant_noise_is_kept_whole():
+    """Test that a recording with no quiet floor is not trimmed."""
+    from speech_detection import keep_speech, speech_spans
+
+    audio = silence(2.0, 0.2)
+
+    spans = speech_spans(audio)
+
+    assert spans == [(0, len(audio))]
+    assert keep_speech(audio, spans) is audio
+
+
+def test_restore_time_maps_across_cuts():
+    """Test that trimmed times land back on the original timeline."""
+    from speech_detection import keep_speech, restore_time
+
+    spans = [(RATE, 2 * RATE), (5 * RATE, 7 * RATE)]
+    audio = np.zeros(8 * RATE, dtype=np.float32)
+
+    assert len(keep_speech(audio, spans)) == 3 * RATE
+    assert restore_time(0.5, spans) == 1.5
+    assert restore_time(1.5, spans) == 5.5
+    # A segment ending at the joint ends with the first span
+    assert restore_time(1.0, spans, is_end=True) == 2.0
+    assert restore_time(1.0, spans) == 5.0
+    assert restore_time(3.0, spans, is_end=True) == 7.0
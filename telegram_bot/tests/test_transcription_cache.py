@@ -0,0 +1,110 @@
+"""Tests for transcription_cache.py - content-addressed transcripts."""
+import hashlib
+
+import pytest
+
+
+def test_hash_audio_matches_content(tmp_path):
+    """Test that files with equal bytes hash equally regardless of name."""
+    from transcription_cache import hash_audio
+
+    first = tmp_path / "voice_1.ogg"
+    second = tmp_path / "voice_2.ogg"
+    first.write_bytes(b"OggS" * 1000)
+    second.write_bytes(b"OggS" * 1000)
+
+    assert hash_audio(str(first)) == hash_audio(str(second))
+    assert hash_audio(str(first)) == hashlib.sha256(b"OggS" * 1000).hexdigest()
+
+
+def test_hash_audio_bytes_matches_file(tmp_path):
+    """Test that hashing downloaded bytes agrees with hashing the file."""
+    from transcription_cache import hash_audio, hash_audio_bytes
+
+    voice = tmp_path / "voice.ogg"
+    voice.write_bytes(b"OggS" * 1000)
+
+    assert hash_audio_bytes(b"OggS" * 1000) == hash_audio(str(voice))
+
+
+def test_config_key_ignores_threading():
+    """Test that only output-affecting settings change the key."""
+    from transcription_cache import config_key
+    from whisper_config import WhisperConfig
+
+    base = WhisperConfig()
+
+    assert config_key(base) == config_key(WhisperConfig(cpu_threads=4, num_workers=2))
+    assert config_key(base) != config_key(WhisperConfig(model_size="base"))
+    assert config_key(base) != config_key(WhisperConfig(beam_size=1))
+    assert config_key(base) != config_key(WhisperConfig(vad_filter=True))
+    assert config_key(base) != config_key(WhisperConfig(trim_silence=True))
+    # Whisper's VAD takes over from silence trimming
+    assert config_key(WhisperConfig(vad_filter=True)) == \
+        config_key(WhisperConfig(vad_filter=True, trim_silence=True))
+
+
+@pytest.mark.asyncio
+async def test_lookup_counts_hits_and_misses(test_db):
+    """Test hit/miss counters and hit rate."""
+    from database import put_cached_transcription
+    from transcription_cache import TranscriptionCache, config_key
+    from whisper_config import WhisperConfig
+
+    cache = TranscriptionCache(test_db, WhisperConfig())
+    put_cached_transcription(test_db, "known", config_key(WhisperConfig()), "hello")
+
+    assert await cache.lookup("unknown") is None
+    assert await cache.lookup("known") == "hello"
+    assert await cache.lookup("known") == "hello"
+
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+
+
+@pytest.mark.asyncio
+async def test_evict_applies_size_limit(test_db):
+    """Test that evict() keeps at most max_entries."""
+    from database import put_cached_transcription
+    from transcription_cache import TranscriptionCache
+    from whisper_config import WhisperConfig
+
+    cache = TranscriptionCache(test_db, WhisperConfig(), max_entries=3, max_age_days=30)
+    for i in range(5):
+        put_cached_transcription(test_db, f"hash{i}", cache.key, f"text {i}")
+
+    assert await cache.evict() == 2
+    assert cache.stats()['evicted'] == 2
+
+
+@pytest.mark.asyncio
+async def test_pinned_language_has_its_own_entries(test_db):
+    """Test that transcripts in a pinned language do not answer detected lookups."""
+    from database import put_cached_transcription
+    from transcription_cache import TranscriptionCache
+    from whisper_config import WhisperConfig
+
+    cache = TranscriptionCache(test_db, WhisperConfig())
+    put_cached_transcription(test_db, "note", cache.key_for('de'), "hallo")
+
+    assert cache.key_for(None) == cache.key
+    assert await cache.lookup("note") is None
+    assert await cache.lookup("note", 'de') == "hallo"
+
+
+@pytest.mark.asyncio
+async def test_primed_transcripts_keyed_by_prompt(test_db):
+    """Test that one chat's primed transcript is not served to another chat."""
+    from database import put_cached_transcription
+    from transcription_cache import TranscriptionCache
+    from whisper_config import WhisperConfig
+
+    cache = TranscriptionCache(test_db, WhisperConfig())
+    put_cached_transcription(test_db, "note", cache.key_for('en', "Grafana dashboards"),
+                             "Check Grafana")
+
+    assert await cache.lookup("note", 'en') is None
+    assert await cache.lookup("note", 'en', "Kubernetes pods") is None
+    assert await cache.lookup("note", 'en', "Grafana dashboards") == "Check Grafana"
@@ -0,0 +1,434 @@
+"""Tests for transcription_service.py - background transcription jobs."""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+import transcription_service
+from voice_transcription import TranscriptionResult
+
+
+async def wait_for(predicate, timeout=5.0):
+    """Poll until predicate() is true or fail after timeout."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def service_factory(test_db):
+    """Build services on a thread pool and stop them after the test."""
+    from transcription_service import TranscriptionService
+
+    services = []
+
+    async def factory(workers=2, **kwargs):
+        service = TranscriptionService(
+            test_db, workers=workers, executor=ThreadPoolExecutor(max_workers=workers),
+            **kwargs
+        )
+        services.append(service)
+        await service.start()
+        return service
+
+    yield factory
+
+    for service in services:
+        await service.stop()
+
+
+def add_voice(test_db, message_id):
+    """Store a voice message row awaiting transcription."""
+    from database import add_incoming_message
+    return add_incoming_message(test_db, 123, 123, "user", message_id, None,
+                                f"/tmp/voice_{message_id}.ogg")
+
+
+@pytest.mark.asyncio
+async def test_enqueue_writes_transcription_back(test_db, service_factory):
+    """Test that finished jobs fill in the message's transcription."""
+    from database import get_unprocessed_messages
+
+    completed = []
+
+    async def on_complete(job, result):
+        completed.append((job, result))
+
+    with patch('transcription_service.transcribe_voice',
+               return_value=TranscriptionResult(success=True, transcription='hello')):
+        service = await service_factory(on_complete=on_complete)
+        row_id = add_voice(test_db, 1)
+        await service.enqueue(row_id, "/tmp/voice_1.ogg")
+        await wait_for(lambda: completed)
+
+    job, result = completed[0]
+    assert job['status'] == 'done'
+    assert job['chat_id'] == 123
+    assert result.transcription == 'hello'
+    assert get_unprocessed_messages(test_db)[0]['voice_transcription'] == 'hello'
+
+
+@pytest.mark.asyncio
+async def test_hashed_job_fills_cache(test_db, service_factory):
+    """Test that a job enqueued with an audio hash becomes a cache entry."""
+    from transcription_cache import TranscriptionCache
+    from whisper_config import WhisperConfig
+
+    completed = []
+
+    async def on_complete(job, result):
+        completed.append(job)
+
+    cache = TranscriptionCache(test_db, WhisperConfig())
+    with patch('transcription_service.transcribe_voice',
+               return_value=TranscriptionResult(success=True, transcription='hello')):
+        service = await service_factory(on_complete=on_complete, cache=cache)
+        row_id = add_voice(test_db, 1)
+        await service.enqueue(row_id, "/tmp/voice_1.ogg", "abc")
+        await wait_for(lambda: completed)
+
+    assert completed[0]['audio_hash'] == "abc"
+    assert await cache.lookup("abc") == "hello"
+
+
+@pytest.mark.asyncio
+async def test_long_job_streams_partial_transcripts(test_db, service_factory):
+    """Test that partial transcripts are stored and reported before the final one."""
+    from database import get_unprocessed_messages
+
+    notified = []
+    snapshots = []
+    completed = []
+
+    async def on_partial(job):
+        notified.append(job)
+
+    async def on_complete(job, result):
+        completed.append(job)
+
+    def streaming_transcribe(path, on_partial=None):
+        texts = []
+        for text in ["one", "two", "three"]:
+            time.sleep(0.1)
+            texts.append(text)
+            on_partial(" ".join(texts))
+            snapshots.extend(get_unprocessed_messages(test_db))
+        return TranscriptionResult(success=True, transcription=" ".join(texts))
+
+    with patch('transcription_service.transcribe_voice', side_effect=streaming_transcribe):
+        service = await service_factory(on_partial=on_partial, on_complete=on_complete,
+                                        partial_interval=0.05)
+        await service.enqueue(add_voice(test_db, 1), "/tmp/voice_1.ogg")
+        await wait_for(lambda: completed and notified)
+
+    assert [m['voice_transcription'] for m in snapshots] == ["one", "one two", "one two three"]
+    assert all(m['transcription_partial'] for m in snapshots)
+    assert notified[0]['chat_id'] == 123
+
+    final = get_unprocessed_messages(test_db)
+    assert final[0]['voice_transcription'] == "one two three"
+    assert final[0]['transcription_partial'] is False
+    # The queue reached the job as an argument, not through the worker global
+    assert transcription_service._partial_queue is None
+
+
+@pytest.mark.asyncio
+async def test_short_job_has_no_partial(test_db, service_factory):
+    """Test that notes finishing within the interval skip partial writes."""
+    partials = []
+    completed = []
+
+    async def on_partial(job):
+        partials.append(job)
+
+    async def on_complete(job, result):
+        completed.append(job)
+
+    def quick_transcribe(path, on_partial=None):
+        on_partial("hello")
+        return TranscriptionResult(success=True, transcription="hello")
+
+    with patch('transcription_service.transcribe_voice', side_effect=quick_transcribe):
+        service = await service_factory(on_partial=on_partial, on_complete=on_complete,
+                                        partial_interval=5)
+        await service.enqueue(add_voice(test_db, 1), "/tmp/voice_1.ogg")
+        await wait_for(lambda: completed)
+
+    assert partials == []
+
+
+@pytest.mark.asyncio
+async def test_enqueue_returns_immediately(test_db, service_factory):
+    """Test that enqueueing does not wait for the transcription."""
+    def slow_transcribe(path, **kwargs):
+        time.sleep(0.5)
+        return TranscriptionResult(success=True, transcription='slow')
+
+    with patch('transcription_service.transcribe_voice', side_effect=slow_transcribe):
+        service = await service_factory()
+        start = time.monotonic()
+        await service.enqueue(add_voice(test_db, 1), "/tmp/voice_1.ogg")
+
+        assert time.monotonic() - start < 0.2
+
+
+@pytest.mark.asyncio
+async def test_jobs_run_in_parallel(test_db, service_factory):
+    """Test that several queued voice notes are transcribed concurrently."""
+    from database import get_unprocessed_messages
+
+    def slow_transcribe(path, **kwargs):
+        time.sleep(0.3)
+        return TranscriptionResult(success=True, transcription=path)
+
+    with patch('transcription_service.transcribe_voice', side_effect=slow_transcribe):
+        service = await service_factory(workers=4)
+        start = time.monotonic()
+        for i in range(4):
+            await service.enqueue(add_voice(test_db, i), f"/tmp/voice_{i}.ogg")
+        await wait_for(lambda: len(get_unprocessed_messages(test_db)) == 4)
+
+    assert time.monotonic() - start < 0.9
+
+
+@pytest.mark.asyncio
+async def test_failed_job_reported_after_retries(test_db, service_factory):
+    """Test that failures are retried and then reported once."""
+    from database import get_unprocessed_messages
+    from transcription_service import MAX_ATTEMPTS
+
+    completed = []
+
+    async def on_complete(job, result):
+        completed.append((job, result))
+
+    with patch('transcription_service.transcribe_voice',
+               return_value=TranscriptionResult(success=False, error='bad audio')) as mock_transcribe:
+        service = await service_factory(on_complete=on_complete)
+        await service.enqueue(add_voice(test_db, 1), "/tmp/voice_1.ogg")
+        await wait_for(lambda: completed)
+
+    assert mock_transcribe.call_count == MAX_ATTEMPTS
+    job, result = completed[0]
+    assert job['status'] == 'failed'
+    assert result.error == 'bad audio'
+    assert get_unprocessed_messages(test_db) == []
+
+
+@pytest.mark.asyncio
+async def test_start_resumes_interrupted_jobs(test_db, service_factory):
+    """Test that jobs left running by a crash are picked up on start."""
+    from database import (enqueue_transcription_job, claim_transcription_jobs,
+                          get_unprocessed_messages)
+
+    enqueue_transcription_job(test_db, add_voice(test_db, 1), "/tmp/voice_1.ogg")
+    claim_transcription_jobs(test_db, 1)  # simulated crash mid-job
+
+    with patch('transcription_service.transcribe_voice',
+               return_value=TranscriptionResult(success=True, transcription='resumed')):
+        await service_factory()
+        await wait_for(lambda: get_unprocessed_messages(test_db))
+
+    assert get_unprocessed_messages(test_db)[0]['voice_transcription'] == 'resumed'
+
+
+@pytest.mark.asyncio
+async def test_warm_up_reports_ready(test_db, service_factory):
+    """Test that warm-up runs in every worker and reports timings."""
+    status = {'ready': True, 'load_seconds': 2.5, 'warmup_seconds': 0.4}
+
+    with patch('transcription_service._worker_warmup_status', return_value=status) as mock_warm:
+        service = await service_factory(workers=3)
+        assert service.model_status['state'] == 'cold'
+
+        result = await service.warm_up()
+
+    assert mock_warm.call_count == 3
+    assert result is service.model_status
+    assert result['state'] == 'ready'
+    assert result['workers'] == 3
+    assert result['load_seconds'] == 2.5
+    assert result['warmup_seconds'] >= 0
+
+
+@pytest.mark.asyncio
+async def test_warm_up_failure_is_reported(test_db, service_factory):
+    """Test that a failed model load shows up in model_status."""
+    with patch('transcription_service._worker_warmup_status',
+               side_effect=RuntimeError("model download failed")):
+        service = await service_factory()
+        result = await service.warm_up()
+
+    assert result['state'] == 'failed'
+    assert "model download failed" in result['error']
+
+
+@pytest.mark.asyncio
+async def test_downloaded_audio_decoded_from_memory(test_db, service_factory):
+    """Test that a job's first attempt gets the bytes and a retry the file."""
+    calls = []
+    completed = []
+
+    async def on_complete(job, result):
+        completed.append(result)
+
+    def flaky_transcribe(voice_file, on_partial=None):
+        calls.append(voice_file)
+        if len(calls) == 1:
+            return TranscriptionResult(success=False, error='worker crashed')
+        return TranscriptionResult(success=True, transcription='from disk')
+
+    with patch('transcription_service.transcribe_voice', side_effect=flaky_transcribe):
+        service = await service_factory(on_complete=on_complete)
+        row_id = add_voice(test_db, 1)
+        await service.enqueue(row_id, "/tmp/voice_1.ogg", audio=b"OggS fake voice")
+        await wait_for(lambda: completed)
+
+    assert calls == [b"OggS fake voice", "/tmp/voice_1.ogg"]
+    assert completed[0].transcription == 'from disk'
+    assert not service._audio
+
+
+@pytest.mark.asyncio
+async def test_backlog_transcribed_in_batches(test_db, service_factory):
+    """Test that a backlog is batched per chat and pinned language only."""
+    from database import add_incoming_message, enqueue_transcription_job, get_unprocessed_messages
+
+    for i in range(6):
+        enqueue_transcription_job(test_db, add_voice(test_db, i), f"/tmp/voice_{i}.ogg",
+                                  language='de')
+    enqueue_transcription_job(test_db, add_voice(test_db, 6), "/tmp/voice_6.ogg")
+    other_chat = add_incoming_message(test_db, 456, 456, "other", 7, None, "/tmp/voice_7.ogg")
+    enqueue_transcription_job(test_db, other_chat, "/tmp/voice_7.ogg", language='de')
+
+    batches = []
+    alone = []
+
+    def batch_transcribe(voice_files, options=None):
+        batches.append(voice_files)
+        return [TranscriptionResult(success=True, transcription=path) for path in voice_files]
+
+    def transcribe(path, **kwargs):
+        alone.append(path)
+        return TranscriptionResult(success=True, transcription=path)
+
+    with patch('transcription_service.transcribe_batch', side_effect=batch_transcribe), \
+         patch('transcription_service.transcribe_voice', side_effect=transcribe):
+        await service_factory(workers=2, batch_size=4, batch_backlog=4)
+        await wait_for(lambda: len(get_unprocessed_messages(test_db)) == 8)
+
+    assert sorted(batches) == [[f"/tmp/voice_{i}.ogg" for i in range(3)],
+                               [f"/tmp/voice_{i}.ogg" for i in range(3, 6)]]
+    assert sorted(alone) == ["/tmp/voice_6.ogg", "/tmp/voice_7.ogg"]
+    assert sorted(m['voice_transcription'] for m in get_unprocessed_messages(test_db)) == \
+        [f"/tmp/voice_{i}.ogg" for i in range(8)]
+
+
+@pytest.mark.asyncio
+async def test_burst_not_batched(test_db, service_factory):
+    """Test that a few notes waiting for a busy worker are not a backlog."""
+    from database import enqueue_transcription_job, get_unprocessed_messages
+
+    for i in range(3):
+        enqueue_transcription_job(test_db, add_voice(test_db, i), f"/tmp/voice_{i}.ogg",
+                                  language='de')
+
+    with patch('transcription_service.transcribe_batch') as mock_batch, \
+         patch('transcription_service.transcribe_voice',
+               return_value=TranscriptionResult(success=True, transcription='x')):
+        await service_factory(workers=1, batch_size=4)
+        await wait_for(lambda: len(get_unprocessed_messages(test_db)) == 3)
+
+    mock_batch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_chat_settings_passed_to_transcription(test_db, service_factory):
+    """Test that a job's pinned language and prompt reach the model."""
+    from database import get_unprocessed_messages
+
+    calls = []
+
+    def record_transcribe(path, **kwargs):
+        calls.append(kwargs)
+        return TranscriptionResult(success=True, transcription='hallo')
+
+    with patch('transcription_service.transcribe_voice', side_effect=record_transcribe):
+        service = await service_factory(workers=1)
+        await service.enqueue(add_voice(test_db, 1), "/tmp/voice_1.ogg",
+                              language='de', initial_prompt='Kubernetes')
+        await service.enqueue(add_voice(test_db, 2), "/tmp/voice_2.ogg")
+        await wait_for(lambda: len(get_unprocessed_messages(test_db)) == 2)
+
+    assert calls[0]['language'] == 'de'
+    assert calls[0]['initial_prompt'] == 'Kubernetes'
+    assert 'language' not in calls[1]
+
+
+@pytest.mark.asyncio
+async def test_chat_settings_passed_to_batches(test_db, service_factory):
+    """Test that batched jobs carry their own chat settings."""
+    from database import enqueue_transcription_job, get_unprocessed_messages
+
+    batches = []
+
+    def batch_transcribe(voice_files, options=None):
+        batches.append(options)
+        return [TranscriptionResult(success=True, transcription='x') for _ in voice_files]
+
+    enqueue_transcription_job(test_db, add_voice(test_db, 1), "/tmp/voice_1.ogg",
+                              language='de')
+    enqueue_transcription_job(test_db, add_voice(test_db, 2), "/tmp/voice_2.ogg",
+                              language='de', initial_prompt='Grafana')
+    with patch('transcription_service.transcribe_batch', side_effect=batch_transcribe):
+        await service_factory(workers=1, batch_size=4, batch_backlog=2)
+        await wait_for(lambda: len(get_unprocessed_messages(test_db)) == 2)
+
+    assert batches == [[{'language': 'de'}, {'language': 'de', 'initial_prompt': 'Grafana'}]]
+
+
+@pytest.mark.asyncio
+async def test_transcription_telemetry_persisted(test_db, service_factory):
+    """Test that a finished job's timings are stored with its message."""
+    import json
+    import sqlite3
+
+    completed = []
+
+    async def on_complete(job, result):
+        completed.append(result)
+
+    result = TranscriptionResult(success=True, transcription='hello', audio_seconds=8.0,
+                                 decode_seconds=0.01, inference_seconds=2.0, language='en')
+
+    with patch('transcription_service.transcribe_voice', return_value=result):
+        service = await service_factory(on_complete=on_complete)
+        row_id = add_voice(test_db, 1)
+        await service.enqueue(row_id, "/tmp/voice_1.ogg")
+        await wait_for(lambda: completed)
+
+    conn = sqlite3.connect(test_db)
+    stats = json.loads(conn.execute(
+        "SELECT transcription_stats FROM messages WHERE id = ?", (row_id,)
+    ).fetchone()[0])
+    conn.close()
+    assert stats['rtf'] == 0.25
+    assert stats['language'] == 'en'
+    assert stats['decode_seconds'] == 0.01
+
+
+def test_worker_uses_resolved_profile(monkeypatch):
+    """Test that workers take the profile the bot chose instead of re-timing."""
+    import os
+
+    monkeypatch.setenv("WHISPER_PROFILE", "auto")
+    monkeypatch.delenv("WHISPER_CPU_THREADS", raising=False)
+
+    transcription_service._init_worker(2, False, None, "balanced")
+
+    assert os.environ["WHISPER_PROFILE"] == "balanced"
+    assert os.environ["WHISPER_CPU_THREADS"] == "2"
+    transcription_service._partial_queue = None
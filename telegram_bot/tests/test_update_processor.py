@@ -0,0 +1,136 @@
+"""Tests for update_processor.py - concurrent, per-chat ordered updates."""
+import asyncio
+import random
+from datetime import datetime
+
+import pytest
+from telegram import Chat, Message, Update
+
+
+def make_update(update_id, chat_id):
+    """Build a text-message update for a chat."""
+    message = Message(update_id, datetime.now(), Chat(chat_id, "private"), text=str(update_id))
+    return Update(update_id, message=message)
+
+
+def handler(log, update_id, delay=0.0, running=None, fail=False):
+    """Coroutine that records start and end of handling an update."""
+    async def handle():
+        log.append(("start", update_id))
+        if running is not None:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError("handler failed")
+        finally:
+            if running is not None:
+                running["now"] -= 1
+            log.append(("end", update_id))
+    return handle()
+
+
+@pytest.mark.asyncio
+async def test_updates_of_one_chat_run_in_order():
+    """Test that a chat's updates run one at a time in arrival order."""
+    from update_processor import ChatOrderedUpdateProcessor
+
+    processor = ChatOrderedUpdateProcessor(8)
+    log = []
+    # Earlier updates are slower, so any overlap would reorder them
+    await asyncio.gather(*(
+        processor.process_update(make_update(i, 1), handler(log, i, 0.02 / (i + 1)))
+        for i in range(5)
+    ))
+
+    assert log == [(event, i) for i in range(5) for event in ("start", "end")]
+
+
+@pytest.mark.asyncio
+async def test_chats_run_concurrently_within_limit():
+    """Test that many chats keep their order while sharing the slot limit."""
+    from update_processor import ChatOrderedUpdateProcessor
+
+    processor = ChatOrderedUpdateProcessor(4)
+    rng = random.Random(7)
+    log = []
+    running = {"now": 0, "peak": 0}
+    updates = [(i, i % 10) for i in range(200)]
+    await asyncio.gather(*(
+        processor.process_update(
+            make_update(update_id, chat_id),
+            handler(log, update_id, rng.random() * 0.005, running)
+        )
+        for update_id, chat_id in updates
+    ))
+
+    assert running["peak"] == 4
+    for chat_id in range(10):
+        chat_updates = [i for i, chat in updates if chat == chat_id]
+        started = [i for event, i in log if event == "start" and i % 10 == chat_id]
+        assert started == chat_updates
+
+
+@pytest.mark.asyncio
+async def test_slow_chat_does_not_block_others():
+    """Test that a backlog in one chat leaves other chats' updates running."""
+    from update_processor import ChatOrderedUpdateProcessor
+
+    processor = ChatOrderedUpdateProcessor(2)
+    log = []
+    slow = [asyncio.create_task(processor.process_update(make_update(i, 1), handler(log, i, 0.2)))
+            for i in range(3)]
+    await asyncio.sleep(0)
+
+    await asyncio.wait_for(
+        processor.process_update(make_update(10, 2), handler(log, 10)), timeout=0.1
+    )
+
+    assert ("end", 10) in log
+    assert ("end", 0) not in log
+    await asyncio.gather(*slow)
+
+
+@pytest.mark.asyncio
+async def test_failed_or_cancelled_update_does_not_stall_chat():
+    """Test that the chat's next update runs after an error or cancellation."""
+    from update_processor import ChatOrderedUpdateProcessor
+
+    processor = ChatOrderedUpdateProcessor(4)
+    log = []
+    failing = asyncio.create_task(
+        processor.process_update(make_update(1, 1), handler(log, 1, 0.01, fail=True))
+    )
+    cancelled = asyncio.create_task(
+        processor.process_update(make_update(2, 1), handler(log, 2, 1.0))
+    )
+    following = asyncio.create_task(
+        processor.process_update(make_update(3, 1), handler(log, 3))
+    )
+    await asyncio.sleep(0.05)
+    cancelled.cancel()
+
+    await asyncio.wait_for(following, timeout=1)
+
+    with pytest.raises(RuntimeError):
+        await failing
+    assert log.index(("end", 1)) < log.index(("start", 3))
+    assert processor._tails == {}
+
+
+@pytest.mark.asyncio
+async def test_updates_without_chat_run_immediately():
+    """Test that updates without a chat are not ordered behind a chat."""
+    from update_processor import ChatOrderedUpdateProcessor, chat_key
+
+    processor = ChatOrderedUpdateProcessor(2)
+    log = []
+    busy = asyncio.create_task(processor.process_update(make_update(1, 1), handler(log, 1, 0.2)))
+    await asyncio.sleep(0)
+
+    await asyncio.wait_for(processor.process_update(object(), handler(log, 2)), timeout=0.1)
+
+    assert chat_key(object()) is None
+    assert chat_key(make_update(3, 42)) == 42
+    await busy
@@ -3,17 +3,23 @@ import os
 from pathlib import Path
 from unittest.mock import Mock, patch
 
+import numpy as np
 import pytest
 
 
+def silent_audio(seconds=1.0):
+    """Decoded audio samples as returned by decode_audio."""
+    return np.zeros(int(16000 * seconds), dtype=np.float32)
+
+
 def test_transcribe_valid_audio(sample_audio_file):
     """Test transcribing a valid audio file."""
     from voice_transcription import transcribe_voice
 
-    with patch('voice_transcription.convert_to_wav') as mock_convert, \
+    with patch('voice_transcription.decode_audio') as mock_decode, \
          patch('voice_transcription.get_model') as mock_get_model:
-        # Mock audio conversion
-        mock_convert.return_value = sample_audio_file + ".wav"
+        # Mock audio decoding
+        mock_decode.return_value = silent_audio()
 
         # Mock the model and transcription
         mock_model = Mock()
@@ -22,23 +28,21 @@ def test_transcribe_valid_audio(sample_audio_file):
         mock_model.transcribe.return_value = ([mock_segment], None)
         mock_get_model.return_value = mock_model
 
-        # Mock os.remove to avoid cleanup errors
-        with patch('voice_transcription.os.remove'):
-            result = transcribe_voice(sample_audio_file)
+        result = transcribe_voice(sample_audio_file)
 
-        assert result['success'] is True
-        assert result['transcription'] == "This is a test transcription"
-        assert 'error' not in result or result['error'] is None
+        assert result.success is True
+        assert result.transcription == "This is a test transcription"
+        assert result.error is None
 
 
 def test_transcribe_multiple_segments(sample_audio_file):
     """Test transcribing audio with multiple segments."""
     from voice_transcription import transcribe_voice
 
-    with patch('voice_transcription.convert_to_wav') as mock_convert, \
+    with patch('voice_transcription.decode_audio') as mock_decode, \
          patch('voice_transcription.get_model') as mock_get_model:
-        # Mock audio conversion
-        mock_convert.return_value = sample_audio_file + ".wav"
+        # Mock audio decoding
+        mock_decode.return_value = silent_audio()
 
         mock_model = Mock()
 
@@ -53,12 +57,32 @@ def test_transcribe_multiple_segments(sample_audio_file):
         mock_model.transcribe.return_value = ([seg1, seg2, seg3], None)
         mock_get_model.return_value = mock_model
 
-        # Mock os.remove to avoid cleanup errors
-        with patch('voice_transcription.os.remove'):
-            result = transcribe_voice(sample_audio_file)
+        result = transcribe_voice(sample_audio_file)
+
+        assert result.success is True
+        assert result.transcription == "First segment Second segment Third segment"
+
+
+def test_transcribe_reports_partial_transcripts(sample_audio_file):
+    """Test that on_partial sees the transcript grow segment by segment."""
+    from voice_transcription import transcribe_voice
 
-        assert result['success'] is True
-        assert result['transcription'] == "First segment Second segment Third segment"
+    partials = []
+
+    def segments():
+        for text in ["First", "Second", "Third"]:
+            # Segments are consumed lazily, one at a time
+            assert len(partials) == ["First", "Second", "Third"].index(text)
+            yield Mock(text=text)
+
+    with patch('voice_transcription.decode_audio', return_value=silent_audio()), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        mock_get_model.return_value.transcribe.return_value = (segments(), None)
+
+        result = transcribe_voice(sample_audio_file, on_partial=partials.append)
+
+    assert partials == ["First", "First Second", "First Second Third"]
+    assert result.transcription == "First Second Third"
 
 
 def test_transcribe_nonexistent_file():
@@ -67,9 +91,8 @@ def test_transcribe_nonexistent_file():
 
     result = transcribe_voice("/nonexistent/file.ogg")
 
-    assert result['success'] is False
-    assert 'error' in result
-    assert result['error'] is not None
+    assert result.success is False
+    assert result.error is not None
 
 
 def test_transcribe_invalid_audio():
@@ -83,8 +106,8 @@ def test_transcribe_invalid_audio():
 
     result = transcribe_voice(invalid_file)
 
-    assert result['success'] is False
-    assert 'error' in result
+    assert result.success is False
+    assert result.error is not None
 
     # Cleanup
     os.remove(invalid_file)
@@ -110,12 +133,16 @@ def test_model_lazy_loading():
         assert model1 is model2
 
 
-def test_model_configuration():
+def test_model_configuration(monkeypatch):
     """Test that model is configured correctly."""
     import voice_transcription
 
+    for var in ("WHISPER_PROFILE", "WHISPER_MODEL", "WHISPER_CPU_THREADS", "WHISPER_NUM_WORKERS"):
+        monkeypatch.delenv(var, raising=False)
+
     # Reset global model state
     voice_transcription._model = None
+    voice_transcription._config = None
 
     with patch('voice_transcription.WhisperModel') as mock_whisper:
         from voice_transcription import get_model
@@ -126,19 +153,68 @@ def test_model_configuration():
         mock_whisper.assert_called_once_with(
             "small",
             device="cpu",
-            compute_type="int8"
+            compute_type="int8",
+            cpu_threads=0,
+            num_workers=1
         )
 
+    voice_transcription._model = None
+
+
+def test_model_configuration_from_env(monkeypatch):
+    """Test that profiles and WHISPER_* variables configure the model."""
+    import voice_transcription
+
+    monkeypatch.setenv("WHISPER_PROFILE", "fastest")
+    monkeypatch.setenv("WHISPER_CPU_THREADS", "2")
+    voice_transcription._model = None
+    voice_transcription._config = None
+
+    with patch('voice_transcription.WhisperModel') as mock_whisper:
+        voice_transcription.get_model()
+
+        args, kwargs = mock_whisper.call_args
+        assert args == ("tiny",)
+        assert kwargs['cpu_threads'] == 2
+        assert voice_transcription.get_config().transcribe_kwargs() == {
+            'beam_size': 1, 'vad_filter': True
+        }
+
+    voice_transcription._model = None
+    voice_transcription._config = None
+
+
+def test_select_profile_picks_most_accurate_within_target(monkeypatch, tmp_path):
+    """Test that auto selection stops at the first profile fast enough."""
+    import voice_transcription
+
+    monkeypatch.setenv("WHISPER_PROFILE_CACHE", str(tmp_path / "profile.json"))
+    monkeypatch.setenv("WHISPER_PROFILE_SAMPLE", str(tmp_path / "sample.ogg"))
+    rtfs = {"small": 0.9, "base": 0.4, "tiny": 0.1}
 
-def test_audio_conversion(sample_audio_file):
-    """Test that audio is converted to WAV format."""
+    with patch('voice_transcription.decode_audio', return_value=silent_audio()), \
+         patch('voice_transcription.measure_profile',
+               side_effect=lambda config, audio: {'rtf': rtfs[config.model_size]}) as mock_measure:
+        assert voice_transcription.select_profile(target_rtf=0.5) == "balanced"
+        assert mock_measure.call_count == 2
+
+        # Cached: no new measurements
+        assert voice_transcription.select_profile(target_rtf=0.5) == "balanced"
+        assert mock_measure.call_count == 2
+
+        # Nothing fast enough falls back to the fastest profile
+        assert voice_transcription.select_profile(target_rtf=0.01) == "fastest"
+
+
+def test_audio_decoded_in_memory(sample_audio_file):
+    """Test that decoded samples are passed straight to the model."""
     from voice_transcription import transcribe_voice
 
     with patch('voice_transcription.get_model') as mock_get_model, \
-         patch('voice_transcription.convert_to_wav') as mock_convert:
+         patch('voice_transcription.decode_audio') as mock_decode:
 
-        mock_wav_path = "/tmp/converted.wav"
-        mock_convert.return_value = mock_wav_path
+        audio = silent_audio()
+        mock_decode.return_value = audio
 
         mock_model = Mock()
         mock_segment = Mock()
@@ -146,45 +222,222 @@ def test_audio_conversion(sample_audio_file):
         mock_model.transcribe.return_value = ([mock_segment], None)
         mock_get_model.return_value = mock_model
 
-        result = transcribe_voice(sample_audio_file)
+        transcribe_voice(sample_audio_file)
 
-        # Verify conversion was called
-        mock_convert.assert_called_once_with(sample_audio_file)
+        # Verify decoding was called
+        mock_decode.assert_called_once_with(sample_audio_file)
 
-        # Verify model transcribe called with converted file
-        mock_model.transcribe.assert_called_once_with(mock_wav_path)
+        # Verify model transcribe called with the decoded samples
+        mock_model.transcribe.assert_called_once()
+        assert mock_model.transcribe.call_args[0][0] is audio
 
 
-def test_wav_cleanup(sample_audio_file):
-    """Test that temporary WAV files are cleaned up."""
+def test_no_temporary_wav_written(sample_audio_file):
+    """Test that transcription never converts to a WAV file on disk."""
     from voice_transcription import transcribe_voice
 
     with patch('voice_transcription.get_model') as mock_get_model, \
+         patch('voice_transcription.decode_audio', return_value=silent_audio()), \
          patch('voice_transcription.convert_to_wav') as mock_convert, \
          patch('os.remove') as mock_remove:
 
-        mock_wav_path = "/tmp/test.wav"
-        mock_convert.return_value = mock_wav_path
-
         mock_model = Mock()
-        mock_segment = Mock()
-        mock_segment.text = "Test"
-        mock_model.transcribe.return_value = ([mock_segment], None)
+        mock_model.transcribe.return_value = ([], None)
         mock_get_model.return_value = mock_model
 
         transcribe_voice(sample_audio_file)
 
-        # Verify cleanup called
-        mock_remove.assert_called_with(mock_wav_path)
+        mock_convert.assert_not_called()
+        mock_remove.assert_not_called()
+        assert not os.path.exists(sample_audio_file + ".wav")
+
+
+def test_transcribe_downloaded_bytes():
+    """Test that audio in memory is decoded from a buffer, not a file."""
+    import io
+    from voice_transcription import transcribe_voice
+
+    with patch('voice_transcription.get_model') as mock_get_model, \
+         patch('voice_transcription._pyav_decode', return_value=silent_audio()) as mock_decode:
+
+        mock_segment = Mock()
+        mock_segment.text = "From memory"
+        mock_get_model.return_value.transcribe.return_value = ([mock_segment], None)
+
+        result = transcribe_voice(b"OggS fake voice")
+
+    assert result.success is True
+    assert result.transcription == "From memory"
+    source = mock_decode.call_args[0][0]
+    assert isinstance(source, io.BytesIO)
+    assert source.getvalue() == b"OggS fake voice"
+
+
+def speech_with_silence():
+    """One second of tone after two seconds of silence, then one more."""
+    tone = 0.3 * np.sin(2 * np.pi * 220 * np.arange(16000) / 16000).astype(np.float32)
+    return np.concatenate([silent_audio(2.0), tone, silent_audio(1.0)])
+
+
+def test_trim_silence_keeps_original_timestamps(sample_audio_file, monkeypatch):
+    """Test that silence is cut before inference and times map back."""
+    import voice_transcription
+    from whisper_config import WhisperConfig
+
+    monkeypatch.setattr(voice_transcription, '_config', WhisperConfig(trim_silence=True))
+
+    with patch('voice_transcription.decode_audio', return_value=speech_with_silence()), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        model = mock_get_model.return_value
+        model.transcribe.return_value = ([Mock(start=0.2, end=1.0, text="Hello")], None)
+
+        result = voice_transcription.transcribe_voice(sample_audio_file)
+
+    # 0.2s of padding is kept either side of the one second of speech
+    assert len(model.transcribe.call_args[0][0]) == pytest.approx(1.4 * 16000, abs=500)
+    assert result.transcription == "Hello"
+    segment = result.segments[0]
+    assert segment.start == pytest.approx(2.0, abs=0.05)
+    assert segment.end == pytest.approx(2.8, abs=0.05)
+
+
+def test_trim_silence_skips_inference_on_silence(sample_audio_file, monkeypatch):
+    """Test that a silent recording is not sent to the model at all."""
+    import voice_transcription
+    from whisper_config import WhisperConfig
+
+    monkeypatch.setattr(voice_transcription, '_config', WhisperConfig(trim_silence=True))
+
+    with patch('voice_transcription.decode_audio', return_value=silent_audio(3.0)), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        result = voice_transcription.transcribe_voice(sample_audio_file)
+
+    mock_get_model.return_value.transcribe.assert_not_called()
+    assert result.success is True
+    assert result.transcription == ""
+    assert result.segments == []
+
+
+def test_transcribe_batch_packs_short_clips():
+    """Test that short clips share one inference and words map back to them."""
+    from voice_transcription import transcribe_batch
+
+    clips = {b"first": silent_audio(2.0), b"second": silent_audio(1.0)}
+    words = [Mock(start=0.1, end=0.5, word=" Hello"), Mock(start=3.2, end=3.6, word=" world")]
+
+    with patch('voice_transcription.decode_audio', side_effect=clips.__getitem__), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        model = mock_get_model.return_value
+        model.transcribe.return_value = ([Mock(words=words)], None)
+
+        results = transcribe_batch([b"first", b"second", "/nonexistent/file.ogg"],
+                                   [{'language': 'en'}] * 3)
+
+    # Both clips and the 1s gap between them went through one call
+    model.transcribe.assert_called_once()
+    assert len(model.transcribe.call_args[0][0]) == 4 * 16000
+    assert model.transcribe.call_args.kwargs['word_timestamps'] is True
+    assert model.transcribe.call_args.kwargs['language'] == 'en'
+    assert results[0].transcription == " Hello"
+    assert results[1].transcription == " world"
+    assert results[1].segments[0].start == pytest.approx(0.2)
+    assert results[2].success is False
+    # The shared inference is split by audio length
+    assert [r.batch_size for r in results[:2]] == [2, 2]
+    assert results[0].inference_seconds == pytest.approx(2 * results[1].inference_seconds)
+
+
+def test_transcribe_batch_packs_only_pinned_languages():
+    """Test that clips needing language detection, or in another language,
+    are never packed with others."""
+    from voice_transcription import transcribe_batch
+
+    clips = {b"auto": silent_audio(1.0), b"en": silent_audio(1.0),
+             b"de": silent_audio(1.0), b"de2": silent_audio(1.0)}
+
+    def transcribe(audio, **kwargs):
+        if 'word_timestamps' not in kwargs:
+            return [Mock(start=0.0, end=0.5, text=" alone")], None
+        words = [Mock(start=0.2, end=0.4, word=" first"), Mock(start=2.2, end=2.4, word=" second")]
+        return [Mock(words=words)], None
+
+    with patch('voice_transcription.decode_audio', side_effect=clips.__getitem__), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        model = mock_get_model.return_value
+        model.transcribe.side_effect = transcribe
+
+        results = transcribe_batch([b"auto", b"en", b"de", b"de2"],
+                                   [{}, {'language': 'en'}, {'language': 'de'},
+                                    {'language': 'de'}])
+
+    calls = model.transcribe.call_args_list
+    assert [call.kwargs.get('language') for call in calls] == [None, 'en', 'de']
+    assert [len(call[0][0]) for call in calls] == [16000, 16000, 3 * 16000]
+    # A pinned clip with no other in its language runs alone too
+    assert [r.transcription for r in results] == [" alone", " alone", " first", " second"]
+    assert [r.batch_size for r in results] == [1, 1, 2, 2]
+    assert [r.language_pinned for r in results] == [False, True, True, True]
+
+
+def test_transcribe_batch_runs_long_clips_alone():
+    """Test that clips too long to pack are transcribed on their own."""
+    from voice_transcription import transcribe_batch
+
+    with patch('voice_transcription.decode_audio', return_value=silent_audio(40.0)), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        model = mock_get_model.return_value
+        model.transcribe.return_value = ([Mock(start=1.0, end=2.0, text=" Long")], None)
+
+        results = transcribe_batch([b"long"], [{'language': 'en'}])
+
+    assert len(model.transcribe.call_args[0][0]) == 40 * 16000
+    assert 'word_timestamps' not in model.transcribe.call_args.kwargs
+    assert results[0].transcription == " Long"
+
+
+def test_pinned_language_and_prompt_passed_to_model(sample_audio_file):
+    """Test that chat settings skip language detection and prime the model."""
+    from voice_transcription import transcribe_voice
+
+    info = Mock(language='de', language_probability=1.0)
+    with patch('voice_transcription.decode_audio', return_value=silent_audio(2.0)), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        model = mock_get_model.return_value
+        model.transcribe.return_value = ([Mock(start=0.0, end=1.0, text="Kubernetes läuft")], info)
+
+        result = transcribe_voice(sample_audio_file, language='de', initial_prompt='Kubernetes')
+
+    kwargs = model.transcribe.call_args.kwargs
+    assert kwargs['language'] == 'de'
+    assert kwargs['initial_prompt'] == 'Kubernetes'
+    assert result.language_pinned is True
+    assert result.telemetry()['initial_prompt'] == 'Kubernetes'
+
+    with patch('voice_transcription.decode_audio', return_value=silent_audio(2.0)), \
+         patch('voice_transcription.get_model') as mock_get_model:
+        mock_get_model.return_value.transcribe.return_value = ([], info)
+        result = transcribe_voice(sample_audio_file)
+
+    assert 'language' not in mock_get_model.return_value.transcribe.call_args.kwargs
+    assert result.language_pinned is False
+
+
+def test_decode_audio_wraps_errors():
+    """Test that decoder failures are reported as decoding errors."""
+    from voice_transcription import decode_audio
+
+    with patch('voice_transcription._pyav_decode', side_effect=ValueError("bad data")):
+        with pytest.raises(Exception, match="Audio decoding failed: bad data"):
+            decode_audio("/tmp/broken.ogg")
 
 
 def test_transcription_error_handling(sample_audio_file):
     """Test error handling during transcription."""
     from voice_transcription import transcribe_voice
 
-    with patch('voice_transcription.convert_to_wav') as mock_convert, \
+    with patch('voice_transcription.decode_audio') as mock_decode, \
          patch('voice_transcription.get_model') as mock_get_model:
-        mock_convert.return_value = sample_audio_file + ".wav"
+        mock_decode.return_value = silent_audio()
 
         mock_model = Mock()
         mock_model.transcribe.side_effect = Exception("Transcription failed")
@@ -192,61 +445,65 @@ def test_transcription_error_handling(sample_audio_file):
 
         result = transcribe_voice(sample_audio_file)
 
-        assert result['success'] is False
-        assert 'error' in result
-        assert "Transcription failed" in result['error']
+        assert result.success is False
+        assert "Transcription failed" in result.error
 
 
 def test_empty_transcription(sample_audio_file):
     """Test handling of empty transcription (no speech detected)."""
     from voice_transcription import transcribe_voice
 
-    with patch('voice_transcription.convert_to_wav') as mock_convert, \
+    with patch('voice_transcription.decode_audio') as mock_decode, \
          patch('voice_transcription.get_model') as mock_get_model:
-        mock_convert.return_value = sample_audio_file + ".wav"
+        mock_decode.return_value = silent_audio()
 
         mock_model = Mock()
         # No segments (empty list)
         mock_model.transcribe.return_value = ([], None)
         mock_get_model.return_value = mock_model
 
-        with patch('voice_transcription.os.remove'):
-            result = transcribe_voice(sample_audio_file)
+        result = transcribe_voice(sample_audio_file)
 
-        assert result['success'] is True
-        assert result['transcription'] == ""
+        assert result.success is True
+        assert result.transcription == ""
 
 
-def test_transcribe_returns_dict(sample_audio_file):
-    """Test that transcribe_voice always returns a dict with expected keys."""
-    from voice_transcription import transcribe_voice
+def test_transcribe_returns_result_with_telemetry(sample_audio_file):
+    """Test that transcribe_voice reports timings, language and settings."""
+    from voice_transcription import TranscriptionResult, transcribe_voice
 
-    with patch('voice_transcription.convert_to_wav') as mock_convert, \
+    with patch('voice_transcription.decode_audio') as mock_decode, \
          patch('voice_transcription.get_model') as mock_get_model:
-        mock_convert.return_value = sample_audio_file + ".wav"
+        mock_decode.return_value = silent_audio(4.0)
 
-        mock_model = Mock()
-        mock_segment = Mock()
-        mock_segment.text = "Test"
-        mock_model.transcribe.return_value = ([mock_segment], None)
-        mock_get_model.return_value = mock_model
+        info = Mock(language="en", language_probability=0.98)
+        segment = Mock(start=0.5, end=1.5, text="Test")
+        mock_get_model.return_value.transcribe.return_value = ([segment], info)
 
-        with patch('voice_transcription.os.remove'):
-            result = transcribe_voice(sample_audio_file)
+        result = transcribe_voice(sample_audio_file)
+
+    assert isinstance(result, TranscriptionResult)
+    assert result.success is True
+    assert result.audio_seconds == 4.0
+    assert result.language == "en"
+    assert result.language_probability == 0.98
+    assert result.rtf == result.inference_seconds / 4.0
+    assert result.settings['model_size'] == "small"
 
-        # Verify return structure
-        assert isinstance(result, dict)
-        assert 'success' in result
-        assert 'transcription' in result
+    telemetry = result.telemetry()
+    assert telemetry['segments'] == [{'start': 0.5, 'end': 1.5, 'text': "Test"}]
+    assert telemetry['batch_size'] == 1
+    assert set(telemetry) >= {'decode_seconds', 'load_seconds', 'inference_seconds', 'rtf'}
+    assert not hasattr(result, '__dict__')
 
 
 def test_long_transcription(sample_audio_file):
     """Test handling of long transcriptions with many segments."""
     from voice_transcription import transcribe_voice
 
-    with patch('voice_transcription.convert_to_wav') as mock_convert, \
+    with patch('voice_transcription.decode_audio') as mock_decode, \
          patch('voice_transcription.get_model') as mock_get_model:
-        mock_convert.return_value = sample_audio_file + ".wav"
+        mock_decode.return_value = silent_audio()
 
         mock_model = Mock()
 
@@ -260,22 +517,21 @@ def test_long_transcription(sample_audio_file):
         mock_model.transcribe.return_value = (segments, None)
         mock_get_model.return_value = mock_model
 
-        with patch('voice_transcription.os.remove'):
-            result = transcribe_voice(sample_audio_file)
+        result = transcribe_voice(sample_audio_file)
 
-        assert result['success'] is True
+        assert result.success is True
         # Verify all segments joined
-        assert "Segment 0" in result['transcription']
-        assert "Segment 99" in result['transcription']
+        assert "Segment 0" in result.transcription
+        assert "Segment 99" in result.transcription
 
 
 def test_special_characters_in_transcription(sample_audio_file):
     """Test handling of special characters in transcription."""
     from voice_transcription import transcribe_voice
 
-    with patch('voice_transcription.convert_to_wav') as mock_convert, \
+    with patch('voice_transcription.decode_audio') as mock_decode, \
          patch('voice_transcription.get_model') as mock_get_model:
-        mock_convert.return_value = sample_audio_file + ".wav"
+        mock_decode.return_value = silent_audio()
 
         mock_model = Mock()
         mock_segment = Mock()
@@ -283,9 +539,33 @@ def test_special_characters_in_transcription(sample_audio_file):
         mock_model.transcribe.return_value = ([mock_segment], None)
         mock_get_model.return_value = mock_model
 
-        with patch('voice_transcription.os.remove'):
-            result = transcribe_voice(sample_audio_file)
+        result = transcribe_voice(sample_audio_file)
+
+        assert result.success is True
+        assert "émojis 🎉" in result.transcription
+        assert "spëcial çharacters!" in result.transcription
+
+
+def test_warm_up_model_runs_dummy_inference_once():
+    """Test that warm-up loads the model and decodes one silent clip."""
+    import voice_transcription
+
+    voice_transcription._model = None
+
+    with patch('voice_transcription.WhisperModel') as mock_whisper, \
+         patch.dict(voice_transcription._warmup, {'ready': False}):
+        mock_whisper.return_value.transcribe.return_value = (iter([]), None)
 
-        assert result['success'] is True
-        assert "émojis 🎉" in result['transcription']
-        assert "spëcial çharacters!" in result['transcription']
+        status = voice_transcription.warm_up_model()
+        again = voice_transcription.warm_up_model()
+
+        assert status['ready'] is True
+        assert status['load_seconds'] >= 0
+        assert status['warmup_seconds'] >= 0
+        assert again == status
+        mock_whisper.return_value.transcribe.assert_called_once()
+        audio = mock_whisper.return_value.transcribe.call_args[0][0]
+        assert audio.dtype == np.float32
+        assert not audio.any()
+
+    voice_transcription._model = None
@@ -0,0 +1,119 @@
+"""Tests for whisper_config.py - model configuration from environment."""
+import json
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clean_whisper_env(monkeypatch, tmp_path):
+    """Start every test without WHISPER_* settings and a private cache."""
+    from whisper_config import _ENV_FIELDS
+
+    for var in [*_ENV_FIELDS, "WHISPER_PROFILE", "WHISPER_TARGET_RTF", "WHISPER_PROFILE_SAMPLE"]:
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("WHISPER_PROFILE_CACHE", str(tmp_path / "profile.json"))
+
+
+def test_defaults_match_previous_model():
+    """Test that defaults keep the small int8 CPU model."""
+    from whisper_config import WhisperConfig, apply_env_overrides
+
+    config = apply_env_overrides(WhisperConfig())
+
+    assert config.model_size == "small"
+    assert config.model_kwargs()['device'] == "cpu"
+    assert config.model_kwargs()['compute_type'] == "int8"
+
+
+def test_env_overrides(monkeypatch):
+    """Test that WHISPER_* variables override configuration fields."""
+    from whisper_config import WhisperConfig, apply_env_overrides
+
+    monkeypatch.setenv("WHISPER_MODEL", "base")
+    monkeypatch.setenv("WHISPER_CPU_THREADS", "2")
+    monkeypatch.setenv("WHISPER_NUM_WORKERS", "3")
+    monkeypatch.setenv("WHISPER_BEAM_SIZE", "1")
+    monkeypatch.setenv("WHISPER_VAD_FILTER", "true")
+    monkeypatch.setenv("WHISPER_TRIM_SILENCE", "yes")
+
+    config = apply_env_overrides(WhisperConfig())
+
+    assert config.model_size == "base"
+    assert config.model_kwargs()['cpu_threads'] == 2
+    assert config.model_kwargs()['num_workers'] == 3
+    assert config.transcribe_kwargs() == {'beam_size': 1, 'vad_filter': True}
+    assert config.trim_silence is True
+
+
+def test_invalid_env_value(monkeypatch):
+    """Test that malformed numbers are reported with the variable name."""
+    from whisper_config import WhisperConfig, apply_env_overrides
+
+    monkeypatch.setenv("WHISPER_BEAM_SIZE", "wide")
+
+    with pytest.raises(ValueError, match="WHISPER_BEAM_SIZE"):
+        apply_env_overrides(WhisperConfig())
+
+
+def test_profile_name(monkeypatch):
+    """Test profile selection from WHISPER_PROFILE."""
+    from whisper_config import profile_name
+
+    assert profile_name() is None
+
+    monkeypatch.setenv("WHISPER_PROFILE", "Fast")
+    assert profile_name() == "fast"
+
+    monkeypatch.setenv("WHISPER_PROFILE", "auto")
+    assert profile_name() == "auto"
+
+    monkeypatch.setenv("WHISPER_PROFILE", "huge")
+    with pytest.raises(ValueError, match="Unknown WHISPER_PROFILE"):
+        profile_name()
+
+
+def test_profiles_ordered_by_accuracy():
+    """Test that profiles run from most accurate to fastest."""
+    from whisper_config import PROFILES
+
+    names = list(PROFILES)
+    assert names[0] == "accurate"
+    assert names[-1] == "fastest"
+
+
+def test_profile_cache_round_trip(tmp_path):
+    """Test that an auto choice is remembered for the same target only."""
+    from whisper_config import load_cached_profile, save_cached_profile, profile_cache_path
+
+    assert load_cached_profile(0.5) is None
+
+    save_cached_profile(0.5, "balanced", {'accurate': 0.9, 'balanced': 0.4})
+
+    assert load_cached_profile(0.5) == "balanced"
+    assert load_cached_profile(0.3) is None
+    assert json.loads(profile_cache_path().read_text())['rtf']['balanced'] == 0.4
+
+
+def test_profile_cache_keyed_by_settings(monkeypatch):
+    """Test that changing an override measures the profiles again."""
+    from whisper_config import load_cached_profile, save_cached_profile
+
+    save_cached_profile(0.5, "balanced", {'accurate': 0.9, 'balanced': 0.4})
+
+    monkeypatch.setenv("WHISPER_COMPUTE_TYPE", "float32")
+    assert load_cached_profile(0.5) is None
+    monkeypatch.setenv("WHISPER_COMPUTE_TYPE", "int8")
+    assert load_cached_profile(0.5) == "balanced"
+    monkeypatch.setenv("WHISPER_CPU_THREADS", "2")
+    assert load_cached_profile(0.5) is None
+
+
+def test_profile_sample_required(monkeypatch, tmp_path):
+    """Test that timing profiles needs a real recording from the host."""
+    from whisper_config import profile_sample_path
+
+    with pytest.raises(ValueError, match="WHISPER_PROFILE_SAMPLE"):
+        profile_sample_path()
+
+    monkeypatch.setenv("WHISPER_PROFILE_SAMPLE", str(tmp_path / "note.ogg"))
+    assert profile_sample_path() == tmp_path / "note.ogg"
@@ -0,0 +1,44 @@
+"""Tests for workers.py - executor for blocking work."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_run_in_worker_does_not_block_loop():
+    """Test that blocking work in the worker pool leaves the loop responsive."""
+    from workers import run_in_worker
+
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(run_in_worker(time.sleep, 0.2), ticker())
+
+    assert ticks[-1] - ticks[0] < 0.15
+
+
+@pytest.mark.asyncio
+async def test_run_in_worker_returns_result():
+    """Test that results and keyword arguments pass through."""
+    from workers import run_in_worker
+
+    result = await run_in_worker(lambda a, b=0: (threading.current_thread(), a + b), 1, b=2)
+
+    assert result[1] == 3
+    assert result[0] is not threading.main_thread()
+
+
+def test_shutdown_workers_recreates_executor():
+    """Test that the executor is rebuilt after shutdown."""
+    from workers import get_executor, shutdown_workers
+
+    first = get_executor()
+    shutdown_workers()
+
+    assert get_executor() is not first